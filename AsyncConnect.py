@@ -0,0 +1,350 @@
+"""
+    AsyncConnect.py
+
+    asyncio variant of the XTS Connect REST wrapper.
+
+    AsyncXTSConnect has the same methods as XTSConnect, but every API call returns a coroutine, so
+    independent calls (the legs of a multi-leg order, the slices of a split order, quotes for several
+    instruments) can run concurrently from one event loop:
+
+        xt = AsyncXTSConnect(API_KEY, API_SECRET, source)
+        await xt.interactive_login()
+        responses = await asyncio.gather(*(xt.place_order(**leg) for leg in legs))
+        await xt.close()
+
+    All calls share one aiohttp session whose connections are kept alive, so only the first request
+    to the server pays for the TCP and TLS handshakes. XTS_RECORD and XTS_REPLAY (or a RecordingTransport
+    or ReplayTransport passed as `transport`) record and replay the calls as they do for XTSConnect.
+
+    :copyright:
+    :license: see LICENSE for details.
+"""
+import asyncio
+import logging
+import time
+
+import aiohttp
+from six.moves.urllib.parse import urljoin
+
+import Exception as ex
+from Connect import XTSConnect
+from instrumentation import RequestRecord
+from replay_transport import RecordingTransport, ReplayTransport
+
+log = logging.getLogger(__name__)
+
+
+class AsyncXTSConnect(XTSConnect):
+    """
+    The XTS Connect API wrapper class for asyncio.
+    Create it, and call its methods, from the event loop that will use it.
+    """
+
+    def __init__(self,
+                 apiKey,
+                 secretKey,
+                 source,
+                 root=None,
+                 debug=False,
+                 timeout=None,
+                 pool=None,
+                 disable_ssl=XTSConnect._ssl_flag,
+                 rate_limiter=None,
+                 response_cache=None,
+                 codec=None,
+                 transport=None):
+        """
+        Initialise a new asyncio XTS Connect client instance.
+
+        Takes the same arguments as XTSConnect. `pool`, if given, is a dict of aiohttp.TCPConnector
+        arguments (for example `limit`, `limit_per_host`, `keepalive_timeout`).
+        """
+        super().__init__(apiKey, secretKey, source, root=root, debug=debug, timeout=timeout,
+                         pool=None, disable_ssl=disable_ssl, rate_limiter=rate_limiter,
+                         response_cache=response_cache, codec=codec, transport=transport)
+        # Requests go through aiohttp: the transport's own connections are never used, only its per-route
+        # timeouts and, for a recording or replay transport, its file
+        self.transport.close()
+        self.pool = dict(pool or {})
+        self.reqsession = None  # aiohttp.ClientSession, created on first use inside the running loop
+        self._async_token_lock = None  # asyncio.Lock, created on first use inside the running loop
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _session(self):
+        """Return the shared session, creating it on first use."""
+        if self.reqsession is None or self.reqsession.closed:
+            pool = {"limit": 100, "limit_per_host": 30, "keepalive_timeout": 60}
+            pool.update(self.pool)
+            connector = aiohttp.TCPConnector(ssl=False if self.disable_ssl else None, **pool)
+            self.reqsession = aiohttp.ClientSession(connector=connector,
+                                                    timeout=aiohttp.ClientTimeout(total=self.timeout),
+                                                    trace_configs=[self._trace_config()])
+        return self.reqsession
+
+    @staticmethod
+    def _trace_config():
+        """
+        Record the DNS and connection times of a request into the dict passed as its trace_request_ctx.
+        aiohttp reports the TLS handshake as part of the connection, so tls_ms is not measured here.
+        """
+        async def dns_start(session, context, params):
+            if context.trace_request_ctx is not None:
+                context.trace_request_ctx["dns_started"] = time.perf_counter()
+
+        async def dns_end(session, context, params):
+            timings = context.trace_request_ctx
+            if timings is not None and "dns_started" in timings:
+                timings["dns_ms"] = (time.perf_counter() - timings.pop("dns_started")) * 1000
+
+        async def connection_start(session, context, params):
+            if context.trace_request_ctx is not None:
+                context.trace_request_ctx["connection_started"] = time.perf_counter()
+
+        async def connection_end(session, context, params):
+            timings = context.trace_request_ctx
+            if timings is not None and "connection_started" in timings:
+                timings["connect_ms"] = (time.perf_counter() - timings.pop("connection_started")) * 1000 \
+                    - timings.get("dns_ms", 0)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_dns_resolvehost_start.append(dns_start)
+        trace_config.on_dns_resolvehost_end.append(dns_end)
+        trace_config.on_connection_create_start.append(connection_start)
+        trace_config.on_connection_create_end.append(connection_end)
+        return trace_config
+
+    async def close(self):
+        """Close the pooled connections."""
+        if self.reqsession is not None and not self.reqsession.closed:
+            await self.reqsession.close()
+
+    ########################################################################################################
+    # Methods that read the response before returning it
+    ########################################################################################################
+
+    async def interactive_login(self):
+        """Send the login url to which a user should receive the token."""
+        try:
+            params = {
+                "appKey": self.apiKey,
+                "secretKey": self.secretKey,
+                "source": self.source
+            }
+            response = await self._post("user.login", params)
+
+            if "token" in response['result']:
+                self._set_common_variables(response['result']['token'], response['result']['userID'],
+                                           response['result']['isInvestorClient'])
+            return response
+        except Exception as e:
+            return response['description']
+
+    async def marketdata_login(self):
+        try:
+            params = {
+                "appKey": self.apiKey,
+                "secretKey": self.secretKey,
+                "source": self.source
+            }
+            response = await self._post("market.login", params)
+
+            if "token" in response['result']:
+                self._set_common_variables(response['result']['token'], response['result']['userID'], False)
+            return response
+        except Exception as e:
+            return response['description']
+
+    async def get_balance(self, clientID=None):
+        """Get Balance API call grouped under this category information related to limits on equities, derivative,
+        upfront margin, available exposure and other RMS related balances available to the user."""
+        if self.isInvestorClient:
+            try:
+                params = {}
+                response = await self._get('user.balance', params)
+                return response
+            except Exception as e:
+                return response['description']
+        else:
+            print("Balance : Balance API available for retail API users only, dealers can watch the same on dealer "
+                  "terminal")
+
+    async def place_orders(self, orders, max_in_flight=4):
+        """
+        Place several orders concurrently and collect the results, like XTSConnect.place_orders.
+        At most `max_in_flight` orders are awaited at the same time.
+        """
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(max(1, max_in_flight))
+
+        async def submit(index, order):
+            async with semaphore:
+                sent = time.perf_counter()
+                result = {'index': index, 'orderUniqueIdentifier': order.get('orderUniqueIdentifier')}
+                try:
+                    response = await self.place_order(**order)
+                    result['response'] = response
+                    result['success'] = isinstance(response, dict) and response.get('type') == 'success'
+                except Exception as e:
+                    result['response'] = None
+                    result['error'] = str(e)
+                    result['success'] = False
+                result['sent_ms'] = (sent - started) * 1000
+                result['elapsed_ms'] = (time.perf_counter() - sent) * 1000
+                return result
+
+        results = list(await asyncio.gather(*(submit(index, order) for index, order in enumerate(orders))))
+
+        succeeded = sum(1 for result in results if result['success'])
+        return {
+            'results': results,
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded,
+            'elapsed_ms': (time.perf_counter() - started) * 1000
+        }
+
+    async def _refresh_token(self, route, stale_token):
+        """Like XTSConnect._refresh_token, but waiting callers await the login instead of blocking."""
+        if self._async_token_lock is None:
+            self._async_token_lock = asyncio.Lock()
+
+        kind = "market" if route.startswith("market.") else "interactive"
+        async with self._async_token_lock:
+            if self.token != stale_token:
+                return True  # Refreshed by another caller while this one waited
+            if not (self.apiKey and self.secretKey):
+                return False  # Session reconnect without keys, nothing to log in with
+            if time.monotonic() - self._token_refresh_failed < self._token_refresh_backoff:
+                return False
+
+            try:
+                response = await (self.marketdata_login() if kind == "market" else self.interactive_login())
+            except Exception as e:
+                response = str(e)
+            if self.token == stale_token or not isinstance(response, dict):
+                print(f"Error refreshing {kind} token: {response}")
+                self._token_refresh_failed = time.monotonic()
+                return False
+            self._token_refresh_failed = 0.0
+            token, user_id = self.token, self.userID
+
+        for listener in list(self._token_listeners):
+            try:
+                listener(kind, token, user_id)
+            except Exception as e:
+                print(f"Error in token listener: {e}")
+        return True
+
+    ########################################################################################################
+    # Common Methods
+    ########################################################################################################
+
+    async def _request(self, route, method, parameters=None):
+        """Make an HTTP request, logging in again once if the session token has expired."""
+        stale_token = self.token
+        try:
+            return await self._send_request(route, method, parameters)
+        except ex.XTSTokenException:
+            if route in self._session_routes or not await self._refresh_token(route, stale_token):
+                raise
+            if route not in self._retried_routes:
+                raise  # The token is fresh again, but only the caller may decide to resend this call
+            return await self._send_request(route, method, parameters)
+
+    async def _send_request(self, route, method, parameters=None):
+        """Send one HTTP request."""
+        params = parameters if parameters else {}
+
+        # Form a restful URL
+        uri = self._routes[route].format(params)
+        url = urljoin(self.root, uri)
+        headers = {}
+
+        if self.token:
+            # set authorization header
+            headers.update({'Content-Type': 'application/json', 'Authorization': self.token})
+
+        query = None
+        if method in ["GET", "DELETE"] and params:
+            # requests drops None values and sends booleans as text; aiohttp accepts neither
+            query = {key: str(value) if isinstance(value, bool) else value
+                     for key, value in params.items() if value is not None}
+
+        # Metadata routes are answered from the cache while their entry is fresh
+        cacheable = self.response_cache.cacheable(route)
+        if cacheable:
+            cached = self.response_cache.get(route, method, params)
+            if cached is not None:
+                return cached
+
+        # Wait for the route's turn under the client-side throttle without blocking the loop
+        waited = await self.rate_limiter.acquire_async(route)
+
+        connect_timeout, read_timeout = self.transport.timeout_for(route)
+        timeout = aiohttp.ClientTimeout(total=None, connect=connect_timeout, sock_read=read_timeout)
+
+        timings = {}
+        started = time.perf_counter()
+        try:
+            if isinstance(self.transport, ReplayTransport):
+                status, content_type, content, ttfb_ms = await self.transport.replay_async(route, method, params)
+            else:
+                async with self._session().request(method,
+                                                   url,
+                                                   data=params if method in ["POST", "PUT"] else None,
+                                                   params=query,
+                                                   headers=headers,
+                                                   timeout=timeout,
+                                                   trace_request_ctx=timings) as r:
+                    ttfb_ms = (time.perf_counter() - started) * 1000
+                    status = r.status
+                    content_type = r.headers.get("content-type", "")
+                    content = await r.read()
+        except Exception as e:
+            if self._request_hooks:
+                self._run_request_hooks(RequestRecord(route, method, total_ms=(time.perf_counter() - started) * 1000,
+                                                      wait_ms=waited * 1000, error=repr(e)))
+            raise e
+
+        if isinstance(self.transport, RecordingTransport):
+            self.transport.record(route, method, params, status, content_type, content,
+                                  (time.perf_counter() - started) * 1000, ttfb_ms)
+
+        if self._request_hooks:
+            self._run_request_hooks(RequestRecord(route, method, status, len(content), timings.get("dns_ms"),
+                                                  timings.get("connect_ms"), None, ttfb_ms=ttfb_ms,
+                                                  total_ms=(time.perf_counter() - started) * 1000,
+                                                  wait_ms=waited * 1000))
+
+        if self.debug:
+            log.debug("Response: {code} {content}".format(code=status, content=content))
+
+        # Validate the content type.
+        if "json" in content_type:
+            try:
+                data = self.codec.loads(content)
+            except ValueError:
+                raise ex.XTSDataException("Couldn't parse the JSON response received from the server: {content}".format(
+                    content=content))
+
+            # api error
+            if data.get("type"):
+
+                if status == 400 and data["type"] == "error" and data["description"] == "Invalid Token":
+                    raise ex.XTSTokenException(data["description"])
+
+                if status == 400 and data["type"] == "error" and data["description"] == "Bad Request":
+                    message = "Description: " + data["description"] + " errors: " + str(data['result']["errors"])
+                    raise ex.XTSInputException(str(message))
+
+            if cacheable:
+                self.response_cache.put(route, method, params, data)
+            return data
+        else:
+            raise ex.XTSDataException("Unknown Content-Type ({content_type}) with response: ({content})".format(
+                content_type=content_type,
+                content=content))
@@ -7,13 +7,22 @@
     :license: see LICENSE for details.
 """
 import configparser
-import json
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 from six.moves.urllib.parse import urljoin
 
 import Exception as ex
+from transport import PooledTransport
+from replay_transport import transport_from_env
+from rate_limiter import RateLimiter
+from response_cache import ResponseCache
+from quote_aggregator import QuoteAggregator
+from json_codec import STREAMED_ROUTES, default_codec, read_body
+from instrumentation import RequestRecord
 
 log = logging.getLogger(__name__)
 
@@ -48,6 +57,27 @@ class XTSConnect(XTSCommon):
     # SSL Flag
     _ssl_flag = cfg.get('SSL', 'disable_ssl')
 
+    # Session routes, which never trigger a token refresh
+    _session_routes = ("user.login", "user.logout", "market.login", "market.logout")
+
+    # Routes resent once with the fresh token after an "Invalid Token" error: the reads, including the
+    # market data ones sent as POST, and the writes that leave the same state when repeated
+    _retried_routes = frozenset((
+        "user.profile", "user.balance", "orders", "trades", "order.status", "order.history",
+        "order.dealer.status", "dealer.trades", "portfolio.positions", "portfolio.holdings",
+        "portfolio.dealerpositions", "order.modify", "order.cancel", "bracketorder.cancel",
+
+        "market.config", "market.instruments.master", "market.instruments.subscription",
+        "market.instruments.unsubscription", "market.instruments.ohlc", "market.instruments.indexlist",
+        "market.instruments.quotes", "market.search.instrumentsbyid", "market.search.instrumentsbystring",
+        "market.instruments.instrument.series", "market.instruments.instrument.equitysymbol",
+        "market.instruments.instrument.futuresymbol", "market.instruments.instrument.optionsymbol",
+        "market.instruments.instrument.optiontype", "market.instruments.instrument.expirydate",
+    ))
+
+    # Seconds before another refresh is tried after a failed one
+    _token_refresh_backoff = 5
+
     # Constants
     # Products
     PRODUCT_MIS = "MIS"
@@ -74,6 +104,7 @@ class XTSConnect(XTSCommon):
 
     # Validity
     VALIDITY_DAY = "DAY"
+    VALIDITY_IOC = "IOC"
 
     # Exchange Segments
     EXCHANGE_NSECM = "NSECM"
@@ -149,7 +180,12 @@ class XTSConnect(XTSCommon):
                  debug=False,
                  timeout=None,
                  pool=None,
-                 disable_ssl=_ssl_flag):
+                 disable_ssl=_ssl_flag,
+                 rate_limiter=None,
+                 response_cache=None,
+                 codec=None,
+                 transport=None,
+                 quote_aggregator=None):
         """
         Initialise a new XTS Connect client instance.
 
@@ -164,9 +200,21 @@ class XTSConnect(XTSCommon):
         and responses to stdout.
         - `timeout` is the time (seconds) for which the API client will wait for
         a request to complete before it fails. Defaults to 7 seconds
-        - `pool` is manages request pools. It takes a dict of params accepted by HTTPAdapter
+        - `pool` configures the connection pool. It takes a dict of params accepted by PooledTransport
+        (pool_connections, pool_maxsize, max_retries, pool_block, timeouts). A pool is always used.
         - `disable_ssl` disables the SSL verification while making a request.
         If set requests won't throw SSLError if its set to custom `root` url without SSL.
+        - `rate_limiter` throttles requests per route with order entry ahead of polling. Pass one RateLimiter
+        to clients that share the same broker limits; by default each client gets its own.
+        - `response_cache` serves instrument metadata and client config from a ResponseCache. Give it a `path`
+        to keep the cache across restarts; by default each client gets its own in-memory cache.
+        - `codec` encodes request bodies and decodes responses. Defaults to the fastest one installed
+        (orjson, else the json module).
+        - `transport` sends the requests, for example a replay_transport.RecordingTransport or ReplayTransport.
+        Defaults to a PooledTransport built from `pool`, or to the transport selected by the XTS_RECORD or
+        XTS_REPLAY environment variables.
+        - `quote_aggregator` coalesces concurrent get_quote calls into few requests. Pass a QuoteAggregator built
+        on this client to set its window or quote cache; by default each client gets one with a 5 ms window.
         """
         self.debug = debug
         self.apiKey = apiKey
@@ -178,14 +226,30 @@ class XTSConnect(XTSCommon):
 
         super().__init__()
 
-        # Create requests session only if pool exists. Reuse session
-        # for every request. Otherwise create session for each request
-        if pool:
-            self.reqsession = requests.Session()
-            reqadapter = requests.adapters.HTTPAdapter(**pool)
-            self.reqsession.mount("https://", reqadapter)
-        else:
-            self.reqsession = requests
+        # Keep-alive session shared by every request, with per-route-class timeouts
+        self.transport = transport or transport_from_env(default_timeout=self.timeout, **(pool or {})) \
+            or PooledTransport(default_timeout=self.timeout, **(pool or {}))
+        self.reqsession = self.transport.session
+
+        # Per-route token buckets with priority lanes
+        self.rate_limiter = rate_limiter or RateLimiter()
+
+        # LRU with per-route TTLs for data that changes at most once a day
+        self.response_cache = response_cache or ResponseCache()
+
+        # JSON codec for request and response bodies
+        self.codec = codec or default_codec()
+
+        # get_quote calls arriving together share one request
+        self.quote_aggregator = quote_aggregator or QuoteAggregator(self)
+
+        # Single-flight token refresh: one caller logs in again, the others wait and reuse its token
+        self._token_lock = threading.Lock()
+        self._token_refresh_failed = 0.0
+        self._token_listeners = []
+
+        # Callables given a RequestRecord after every request
+        self._request_hooks = []
 
         # disable requests SSL warning
         requests.packages.urllib3.disable_warnings()
@@ -194,6 +258,59 @@ class XTSConnect(XTSCommon):
         """Set the `access_token` received after a successful authentication."""
         super().__init__(access_token,userID, isInvestorClient)
 
+    def add_token_listener(self, listener):
+        """
+        Call `listener(kind, token, userID)` whenever an expired token is refreshed, with `kind` "market"
+        or "interactive". Used to hand the new token to socket clients and saved credentials.
+        """
+        self._token_listeners.append(listener)
+
+    def _refresh_token(self, route, stale_token):
+        """
+        Log in again after `stale_token` was rejected on `route`. Only the first caller logs in; callers that
+        waited on it reuse its token. Returns True if a fresh token is available.
+        """
+        kind = "market" if route.startswith("market.") else "interactive"
+        with self._token_lock:
+            if self.token != stale_token:
+                return True  # Refreshed by another caller while this one waited
+            if not (self.apiKey and self.secretKey):
+                return False  # Session reconnect without keys, nothing to log in with
+            if time.monotonic() - self._token_refresh_failed < self._token_refresh_backoff:
+                return False
+
+            try:
+                response = self.marketdata_login() if kind == "market" else self.interactive_login()
+            except Exception as e:
+                response = str(e)
+            if self.token == stale_token or not isinstance(response, dict):
+                print(f"Error refreshing {kind} token: {response}")
+                self._token_refresh_failed = time.monotonic()
+                return False
+            self._token_refresh_failed = 0.0
+            token, user_id = self.token, self.userID
+
+        for listener in list(self._token_listeners):
+            try:
+                listener(kind, token, user_id)
+            except Exception as e:
+                print(f"Error in token listener: {e}")
+        return True
+
+    def add_request_hook(self, hook):
+        """
+        Call `hook(record)` with an instrumentation.RequestRecord (route, method, status, bytes and timings)
+        after every request. Hooks run on the requesting thread, so they should be quick.
+        """
+        self._request_hooks.append(hook)
+
+    def _run_request_hooks(self, record):
+        for hook in list(self._request_hooks):
+            try:
+                hook(record)
+            except Exception as e:
+                print(f"Error in request hook: {e}")
+
     def _login_url(self):
         """Get the remote login url to which a user should be redirected to initiate the login flow."""
         return self._default_login_uri
@@ -271,11 +388,52 @@ class XTSConnect(XTSCommon):
             if not self.isInvestorClient:
                 params['clientID'] = clientID
 
-            response = self._post('order.place', json.dumps(params))
+            response = self._post('order.place', self.codec.dumps(params))
             return response
         except Exception as e:
             return response['description']
-        
+
+    def place_orders(self, orders, max_in_flight=4):
+        """
+        Place several orders concurrently and collect the results.
+
+        - `orders` is a list of dicts of `place_order` keyword arguments.
+        - `max_in_flight` is the number of orders sent at the same time over the pooled connections.
+
+        Returns a dict with one result per order, in input order, each holding the API response (or the
+        error), its success flag and its round-trip time, plus totals for the whole batch.
+        """
+        started = time.perf_counter()
+
+        def submit(index, order):
+            sent = time.perf_counter()
+            result = {'index': index, 'orderUniqueIdentifier': order.get('orderUniqueIdentifier')}
+            try:
+                response = self.place_order(**order)
+                result['response'] = response
+                result['success'] = isinstance(response, dict) and response.get('type') == 'success'
+            except Exception as e:
+                result['response'] = None
+                result['error'] = str(e)
+                result['success'] = False
+            result['sent_ms'] = (sent - started) * 1000
+            result['elapsed_ms'] = (time.perf_counter() - sent) * 1000
+            return result
+
+        if not orders:
+            results = []
+        else:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_in_flight, len(orders)))) as executor:
+                results = list(executor.map(submit, range(len(orders)), orders))
+
+        succeeded = sum(1 for result in results if result['success'])
+        return {
+            'results': results,
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded,
+            'elapsed_ms': (time.perf_counter() - started) * 1000
+        }
+
     def place_bracketorder(self,
                     exchangeSegment,
                     exchangeInstrumentID,
@@ -307,7 +465,7 @@ class XTSConnect(XTSCommon):
                 "isProOrder": isProOrder,
              "orderUniqueIdentifier": orderUniqueIdentifier
             }
-            response = self._post('bracketorder.place', json.dumps(params))
+            response = self._post('bracketorder.place', self.codec.dumps(params))
             print(response)
             return response
         except Exception as e:
@@ -374,7 +532,7 @@ class XTSConnect(XTSCommon):
             if not self.isInvestorClient:
                 params['clientID'] = clientID
 
-            response = self._put('order.modify', json.dumps(params))
+            response = self._put('order.modify', self.codec.dumps(params))
             return response
         except Exception as e:
             return response['description']
@@ -493,7 +651,7 @@ class XTSConnect(XTSCommon):
             }
             if not self.isInvestorClient:
                 params['clientID'] = clientID
-            response = self._put('portfolio.positions.convert', json.dumps(params))
+            response = self._put('portfolio.positions.convert', self.codec.dumps(params))
             return response
         except Exception as e:
             return response['description']
@@ -516,7 +674,7 @@ class XTSConnect(XTSCommon):
             params = {"exchangeSegment": exchangeSegment, "exchangeInstrumentID": exchangeInstrumentID}
             if not self.isInvestorClient:
                 params['clientID'] = self.userID
-            response = self._post('order.cancelall', json.dumps(params))
+            response = self._post('order.cancelall', self.codec.dumps(params))
             return response
         except Exception as e:
             return response['description']    
@@ -534,7 +692,7 @@ class XTSConnect(XTSCommon):
                       'limitPrice': limitPrice, 'stopPrice': stopPrice, 'orderUniqueIdentifier': orderUniqueIdentifier}
             if not self.isInvestorClient:
                 params['clientID'] = clientID
-            response = self._post('order.place.cover', json.dumps(params))
+            response = self._post('order.place.cover', self.codec.dumps(params))
             return response
         except Exception as e:
             return response['description']
@@ -547,7 +705,7 @@ class XTSConnect(XTSCommon):
             params = {'appOrderID': appOrderID}
             if not self.isInvestorClient:
                 params['clientID'] = clientID
-            response = self._put('order.exit.cover', json.dumps(params))
+            response = self._put('order.exit.cover', self.codec.dumps(params))
             return response
         except Exception as e:
             return response['description']
@@ -567,7 +725,7 @@ class XTSConnect(XTSCommon):
                       }
             if not self.isInvestorClient:
                 params['clientID'] = clientID
-            response = self._put('portfolio.squareoff', json.dumps(params))
+            response = self._put('portfolio.squareoff', self.codec.dumps(params))
             return response
         except Exception as e:
             return response['description']
@@ -625,10 +783,15 @@ class XTSConnect(XTSCommon):
             return response['description']
 
     def get_quote(self, Instruments, xtsMessageCode, publishFormat):
+        """Quotes of `Instruments`, batched with get_quote calls of other threads by the quote aggregator."""
+        return self.quote_aggregator.get_quote(Instruments, xtsMessageCode, publishFormat)
+
+    def fetch_quote(self, Instruments, xtsMessageCode, publishFormat):
+        """Request quotes of `Instruments` right away, bypassing the quote aggregator."""
         try:
 
             params = {'instruments': Instruments, 'xtsMessageCode': xtsMessageCode, 'publishFormat': publishFormat}
-            response = self._post('market.instruments.quotes', json.dumps(params))
+            response = self._post('market.instruments.quotes', self.codec.dumps(params))
             return response
         except Exception as e:
             return response['description']
@@ -636,7 +799,7 @@ class XTSConnect(XTSCommon):
     def send_subscription(self, Instruments, xtsMessageCode):
         try:
             params = {'instruments': Instruments, 'xtsMessageCode': xtsMessageCode}
-            response = self._post('market.instruments.subscription', json.dumps(params))
+            response = self._post('market.instruments.subscription', self.codec.dumps(params))
             return response
         except Exception as e:
             return response['description']
@@ -644,7 +807,7 @@ class XTSConnect(XTSCommon):
     def send_unsubscription(self, Instruments, xtsMessageCode):
         try:
             params = {'instruments': Instruments, 'xtsMessageCode': xtsMessageCode}
-            response = self._put('market.instruments.unsubscription', json.dumps(params))
+            response = self._put('market.instruments.unsubscription', self.codec.dumps(params))
             return response
         except Exception as e:
             return response['description']
@@ -652,7 +815,7 @@ class XTSConnect(XTSCommon):
     def get_master(self, exchangeSegmentList):
         try:
             params = {"exchangeSegmentList": exchangeSegmentList}
-            response = self._post('market.instruments.master', json.dumps(params))
+            response = self._post('market.instruments.master', self.codec.dumps(params))
             return response
         except Exception as e:
             return response['description']
@@ -731,7 +894,7 @@ class XTSConnect(XTSCommon):
     def search_by_instrumentid(self, Instruments):
         try:
             params = {'source': self.source, 'instruments': Instruments}
-            response = self._post('market.search.instrumentsbyid', json.dumps(params))
+            response = self._post('market.search.instrumentsbyid', self.codec.dumps(params))
             return response
         except Exception as e:
             return response['description']
@@ -773,7 +936,19 @@ class XTSConnect(XTSCommon):
         return self._request(route, "DELETE", params)
 
     def _request(self, route, method, parameters=None):
-        """Make an HTTP request."""
+        """Make an HTTP request, logging in again once if the session token has expired."""
+        stale_token = self.token
+        try:
+            return self._send_request(route, method, parameters)
+        except ex.XTSTokenException:
+            if route in self._session_routes or not self._refresh_token(route, stale_token):
+                raise
+            if route not in self._retried_routes:
+                raise  # The token is fresh again, but only the caller may decide to resend this call
+            return self._send_request(route, method, parameters)
+
+    def _send_request(self, route, method, parameters=None):
+        """Send one HTTP request."""
         params = parameters if parameters else {}
 
         # Form a restful URL
@@ -785,27 +960,54 @@ class XTSConnect(XTSCommon):
             # set authorization header
             headers.update({'Content-Type': 'application/json', 'Authorization': self.token})
 
-        try:
-            r = self.reqsession.request(method,
-                                        url,
-                                        data=params if method in ["POST", "PUT"] else None,
-                                        params=params if method in ["GET", "DELETE"] else None,
-                                        headers=headers,
-                                        verify=not self.disable_ssl)
+        # Metadata routes are answered from the cache while their entry is fresh
+        cacheable = self.response_cache.cacheable(route)
+        if cacheable:
+            cached = self.response_cache.get(route, method, params)
+            if cached is not None:
+                return cached
+
+        # Wait for the route's turn under the client-side throttle
+        waited = self.rate_limiter.acquire(route)
+
+        streamed = route in STREAMED_ROUTES
 
+        started = time.perf_counter()
+        try:
+            r = self.transport.request(route,
+                                       method,
+                                       url,
+                                       data=params if method in ["POST", "PUT"] else None,
+                                       params=params if method in ["GET", "DELETE"] else None,
+                                       headers=headers,
+                                       verify=not self.disable_ssl,
+                                       stream=streamed)
+
+            # Large bodies are read in big chunks into one buffer, the rest as usual
+            body = read_body(r) if streamed else r.content
         except Exception as e:
+            if self._request_hooks:
+                self._run_request_hooks(RequestRecord(route, method, total_ms=(time.perf_counter() - started) * 1000,
+                                                      wait_ms=waited * 1000, error=repr(e)))
             raise e
 
+        if self._request_hooks:
+            dns_ms, connect_ms, tls_ms = r.connect_timings
+            self._run_request_hooks(RequestRecord(route, method, r.status_code, len(body), dns_ms, connect_ms, tls_ms,
+                                                  ttfb_ms=r.elapsed.total_seconds() * 1000,
+                                                  total_ms=(time.perf_counter() - started) * 1000,
+                                                  wait_ms=waited * 1000))
+
         if self.debug:
-            log.debug("Response: {code} {content}".format(code=r.status_code, content=r.content))
+            log.debug("Response: {code} {content}".format(code=r.status_code, content=bytes(body)))
 
         # Validate the content type.
         if "json" in r.headers["content-type"]:
             try:
-                data = json.loads(r.content.decode("utf8"))
+                data = self.codec.loads(body)
             except ValueError:
                 raise ex.XTSDataException("Couldn't parse the JSON response received from the server: {content}".format(
-                    content=r.content))
+                    content=bytes(body)))
 
             # api error
             if data.get("type"):
@@ -817,8 +1019,10 @@ class XTSConnect(XTSCommon):
                     message = "Description: " + data["description"] + " errors: " + str(data['result']["errors"])
                     raise ex.XTSInputException(str(message))
 
+            if cacheable:
+                self.response_cache.put(route, method, params, data)
             return data
         else:
             raise ex.XTSDataException("Unknown Content-Type ({content_type}) with response: ({content})".format(
                 content_type=r.headers["content-type"],
-                content=r.content))
+                content=bytes(body)))
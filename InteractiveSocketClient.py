@@ -64,9 +64,15 @@ class OrderSocket_io(socketio.Client):
         configParser.read(configFilePath)
         self.port = configParser.get('root_url', 'root').strip()
 
+        self.set_token(self.token)
+
+    def set_token(self, token):
+        """Use a new token for the next connection; automatic reconnects pick it up as well."""
+        self.token = token
         port = f'{self.port}/?token='
 
         self.connection_url = port + self.token + '&userID=' + self.userID + "&apiType=INTERACTIVE"
+        self.sid.connection_url = self.connection_url
 
     def connect(self, headers={}, transports='websocket', namespaces=None, socketio_path='/interactive/socket.io',
                 verify=False):
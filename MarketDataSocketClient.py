@@ -36,16 +36,21 @@ class MDSocket_io(socketio.Client):
 
         self.port = configParser.get('root_url', 'root')
         self.userID = userID
-        publishFormat = 'JSON'
+        self.publishFormat = 'JSON'
         self.broadcastMode = configParser.get('root_url', 'broadcastMode')
+        self.set_token(token)
+
+    def set_token(self, token):
+        """Use a new token for the next connection; automatic reconnects pick it up as well."""
         self.token = token
 
         # Form the WebSocket connection URL
         port = f'{self.port}/?token='
         self.connection_url = (
             port + token + '&userID=' + self.userID +
-            '&publishFormat=' + publishFormat + '&broadcastMode=' + self.broadcastMode
+            '&publishFormat=' + self.publishFormat + '&broadcastMode=' + self.broadcastMode
         )
+        self.sid.connection_url = self.connection_url
 
     def connect(self, headers={}, transports=['websocket'], namespaces=None, socketio_path='/apimarketdata/socket.io'):
         """Connect to a Socket.IO server with forced WebSocket transport."""
@@ -2,26 +2,56 @@ import json
 import asyncio
 import websockets
 from PyQt5.QtCore import QThread, pyqtSignal
+from tick_codec import FORMAT_BINARY, decode_message
+from tick_dispatcher import Tick, TickDispatcher
+from shared_resources import subscribed_instruments
 
 class WebSocketClient(QThread):
-    response_received = pyqtSignal(str)  # Signal to update both tables with WebSocket messages
+    response_received = pyqtSignal(object)  # Signal for non-tick WebSocket messages (subscription confirmations, errors)
+    tick_received = pyqtSignal(object)  # Signal carrying a Tick decoded on this thread
 
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, wire_format=FORMAT_BINARY):
         super(WebSocketClient, self).__init__(parent)
         self.websocket = None
         self.loop = asyncio.new_event_loop()
+        self.wire_format = wire_format  # "binary" for compact tick frames, "json" to see raw payloads while debugging
+
+        # Routes each decoded tick to the widgets holding its instrument, on the GUI thread
+        self.dispatcher = TickDispatcher()
+        self.tick_received.connect(self.dispatcher.dispatch)
+
+        # Every widget shares this connection, so an instrument is unsubscribed once no widget holds it
+        self.dispatcher.released.connect(self.release_instrument)
 
     async def connect(self):
         try:
             async with websockets.connect("ws://localhost:8766") as websocket:
                 self.websocket = websocket
+                # Negotiate the tick framing before any subscription is sent
+                await self.websocket.send(json.dumps({'action': 'format', 'format': self.wire_format}))
                 await self.listen_to_messages()
         except Exception as e:
             print(f"Error connecting to WebSocket: {e}")
 
     async def listen_to_messages(self):
         async for message in self.websocket:
-            self.response_received.emit(message)
+            # Decode once here, off the GUI thread
+            tick = self.decode_tick(message)
+            if tick is not None:
+                self.tick_received.emit(tick)
+            else:
+                self.response_received.emit(message)
+
+    @staticmethod
+    def decode_tick(message):
+        """Return a Tick for touchline messages and None for anything else."""
+        try:
+            message_data = decode_message(message)
+            if isinstance(message_data, dict) and "Touchline" in message_data and "ExchangeInstrumentID" in message_data:
+                return Tick(message_data)
+        except (ValueError, KeyError, TypeError):
+            pass
+        return None
 
     def send_subscription(self, exchange_segment, exchange_instrument_id):
         data = {
@@ -31,6 +61,20 @@ class WebSocketClient(QThread):
         }
         asyncio.run_coroutine_threadsafe(self.websocket.send(json.dumps(data)), self.loop)
 
+    def send_unsubscription(self, exchange_segment, exchange_instrument_id):
+        data = {
+            'action': 'unsubscribe',
+            'exchangeSegment': exchange_segment,
+            'exchangeInstrumentID': exchange_instrument_id
+        }
+        asyncio.run_coroutine_threadsafe(self.websocket.send(json.dumps(data)), self.loop)
+
+    def release_instrument(self, exchange_segment, exchange_instrument_id):
+        """Unsubscribe from an instrument whose last widget callback was removed."""
+        subscribed_instruments.discard((exchange_segment, exchange_instrument_id))
+        if self.websocket is not None:
+            self.send_unsubscription(exchange_segment, exchange_instrument_id)
+
     def run(self):
         asyncio.set_event_loop(self.loop)
         self.loop.run_until_complete(self.connect())
@@ -8,6 +8,7 @@ from PyQt5.QtWidgets import (
 )
 from PyQt5.QtCore import QThread, pyqtSignal
 from shared_resources import subscribed_instruments  # Import shared resources
+from tick_codec import decode_message  # Shared decoder for JSON and binary relay frames
 
 try:
     import websockets
@@ -219,12 +220,12 @@ class AlgoTab(QWidget):
                 exchange_instrument_id = message_data.get("exchangeInstrumentID")
                 
                 # Check if instrument is already subscribed
-                if exchange_instrument_id not in subscribed_instruments:
-                    subscribed_instruments.add(exchange_instrument_id)
-                    exchange_segment = message_data.get("exchangeSegment")
-                    segment_code = self.SEGMENT_CODE_MAP.get(exchange_segment)
-                    if segment_code:
-                        self.subscribe_request.emit(segment_code, exchange_instrument_id)
+                exchange_segment = message_data.get("exchangeSegment")
+                segment_code = self.SEGMENT_CODE_MAP.get(exchange_segment)
+                if segment_code and str(exchange_instrument_id).isdigit() \
+                        and (int(segment_code), int(exchange_instrument_id)) not in subscribed_instruments:
+                    subscribed_instruments.add((int(segment_code), int(exchange_instrument_id)))
+                    self.subscribe_request.emit(segment_code, str(exchange_instrument_id))
 
                 data = [
                     message_data.get("strategyName", "N/A"),  # Strategy Name
@@ -382,7 +383,7 @@ class AlgoTab(QWidget):
     def update_ltp_column(self, message):
         """Process WebSocket messages and update the LTP column for matching rows."""
         try:
-            message_data = json.loads(message)
+            message_data = decode_message(message)
             if "Touchline" in message_data and "ExchangeInstrumentID" in message_data:
                 instrument_id = str(message_data["ExchangeInstrumentID"])
                 ltp = message_data["Touchline"].get("LastTradedPrice", "0.0")
@@ -393,7 +394,7 @@ class AlgoTab(QWidget):
                     item_id = self.price_table.item(row, 8)  # Column 8 is Exchange Instrument ID
                     if item_id and item_id.text() == instrument_id:
                         self.price_table.setItem(row, 13, QTableWidgetItem(str(ltp)))  # Update LTP column
-        except json.JSONDecodeError:
+        except ValueError:
             print("Failed to parse message for LTP update.")
 
 # Main code to run the application
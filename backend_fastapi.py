@@ -1,8 +1,9 @@
 # backend_fastapi.py
 
-from fastapi import FastAPI, WebSocket
+from fastapi import FastAPI, WebSocket, HTTPException
 from Connect import XTSConnect
 from MarketDataSocketClient import MDSocket_io
+from ordersbackend import load_credentials, update_credentials
 import threading
 import time
 import asyncio
@@ -24,8 +25,62 @@ set_marketDataToken = response['result']['token']
 set_muserID = response['result']['userID']
 print("Login: ", response)
 
+# Interactive session for order entry, reusing the token saved by the login flow; created on first use
+order_xt = None
+
+
+def save_order_token(kind, token, user_id):
+    # Persist a refreshed interactive token; ordersbackend picks it up when its socket reconnects
+    if kind == "interactive":
+        update_credentials({'order_token': token, 'order_user_id': user_id})
+
+
+def get_order_xt():
+    """Return the interactive client, created from credentials.json; with the optional order API keys it can
+    log in again when the session token expires."""
+    global order_xt
+    if order_xt is None:
+        try:
+            credentials = load_credentials()
+        except (IOError, ValueError):
+            credentials = {}
+        if not credentials.get('order_token') or not credentials.get('order_user_id'):
+            raise HTTPException(status_code=503, detail="No interactive session in credentials.json, log in first")
+        client = XTSConnect(credentials.get('order_api_key', ""), credentials.get('order_api_secret', ""), source)
+        client._set_common_variables(credentials['order_token'], credentials['order_user_id'],
+                                     credentials.get('isInvestorClient', True))
+        client.add_token_listener(save_order_token)
+        order_xt = client
+    return order_xt
+
+# Order fields the UI sends as XTSConnect constant names, e.g. "EXCHANGE_NSEFO" or "PRODUCT_MIS"
+ORDER_CONSTANT_FIELDS = ("exchangeSegment", "productType", "orderType", "orderSide", "timeInForce")
+
 app = FastAPI()
 
+
+def resolve_order(order):
+    """Map constant names in an order from the UI to their XTS values."""
+    order = dict(order)
+    for field in ORDER_CONSTANT_FIELDS:
+        value = order.get(field)
+        if isinstance(value, str) and hasattr(XTSConnect, value):
+            order[field] = getattr(XTSConnect, value)
+    return order
+
+
+@app.post("/place_orders")
+async def place_orders(payload: dict):
+    """Place a basket of orders in one call; returns per-order responses and timings."""
+    client = get_order_xt()
+    orders = [resolve_order(order) for order in payload.get("orders", [])]
+    max_in_flight = int(payload.get("max_in_flight", 8))
+
+    # place_orders blocks while the orders are in flight, keep the event loop free
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, client.place_orders, orders, max_in_flight)
+
+
 class MarketDataThread(threading.Thread):
     def __init__(self, websocket, loop):
         super().__init__()
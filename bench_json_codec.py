@@ -0,0 +1,80 @@
+"""
+    bench_json_codec.py
+
+    Micro-benchmark of response decoding and request encoding in XTSConnect.
+
+    Compares the previous path, json.loads(body.decode("utf8")) and json.dumps, with the codecs of
+    json_codec on payloads shaped like an instrument master download, an order book and a single order.
+
+        python bench_json_codec.py [repeat]
+
+    :copyright:
+    :license: see LICENSE for details.
+"""
+import json
+import sys
+import timeit
+
+from json_codec import JsonCodec, OrjsonCodec, orjson
+
+
+def master_payload(rows=100000):
+    """Instrument master: one large pipe-delimited string in `result`."""
+    line = "NSEFO|{0}|2|NIFTY|NIFTY24DEC{0}CE|OPTIDX|NIFTY-OPTIDX|{0}|0.05|1800|25|1|0|2024-12-26T14:30:00|{0}|3|NIFTY"
+    result = "\n".join(line.format(35000 + i) for i in range(rows))
+    return json.dumps({"type": "success", "code": "s-master-0001", "result": result}).encode("utf8")
+
+
+def order_book_payload(orders=5000):
+    """Order book: a list of order dicts in `result`."""
+    order = {
+        "LoginID": "AK27983", "ClientID": "AK27983", "AppOrderID": 0, "OrderReferenceID": "",
+        "GeneratedBy": "TWSAPI", "ExchangeOrderID": "1100000012345678", "OrderCategoryType": "NORMAL",
+        "ExchangeSegment": "NSEFO", "ExchangeInstrumentID": 35003, "OrderSide": "BUY", "OrderType": "LIMIT",
+        "ProductType": "NRML", "TimeInForce": "DAY", "OrderPrice": 24150.55, "OrderQuantity": 50,
+        "OrderStopPrice": 0, "OrderStatus": "Filled", "OrderAverageTradedPrice": "24150.55",
+        "LeavesQuantity": 0, "CumulativeQuantity": 50, "OrderDisclosedQuantity": 0,
+        "OrderGeneratedDateTime": "2024-11-23T10:15:30", "ExchangeTransactTime": "2024-11-23T10:15:30+05:30",
+        "LastUpdateDateTime": "2024-11-23T10:15:30", "OrderExpiryDate": "1980-01-01T00:00:00",
+        "CancelRejectReason": "", "OrderUniqueIdentifier": "quant", "OrderLegStatus": "SingleOrderLeg",
+    }
+    result = [dict(order, AppOrderID=1100000000 + i) for i in range(orders)]
+    return json.dumps({"type": "success", "code": "s-orders-0001", "result": result}).encode("utf8")
+
+
+ORDER = {
+    "exchangeSegment": "NSEFO", "exchangeInstrumentID": 35003, "productType": "NRML", "orderType": "LIMIT",
+    "orderSide": "BUY", "timeInForce": "DAY", "disclosedQuantity": 0, "orderQuantity": 50,
+    "limitPrice": 24150.55, "stopPrice": 0, "orderUniqueIdentifier": "quant", "clientID": "*****",
+}
+
+
+def bench(label, function, number, repeat):
+    best = min(timeit.repeat(function, number=number, repeat=repeat)) / number
+    print(f"  {label:<32}{best * 1e6:>12.1f} us")
+    return best
+
+
+def main(repeat=5):
+    codecs = [JsonCodec()]
+    if orjson is not None:
+        codecs.append(OrjsonCodec())
+    else:
+        print("orjson is not installed, only the json module codec is measured\n")
+
+    for name, body, number in (("master", master_payload(), 5), ("order book", order_book_payload(), 5)):
+        print(f"decode {name} ({len(body) / 1e6:.1f} MB)")
+        baseline = bench('json.loads(body.decode("utf8"))', lambda: json.loads(body.decode("utf8")), number, repeat)
+        for codec in codecs:
+            best = bench(f"{codec.name}.loads(body)", lambda: codec.loads(body), number, repeat)
+            print(f"  {'':<32}{baseline / best:>11.1f}x")
+
+    print("encode order")
+    baseline = bench("json.dumps(params)", lambda: json.dumps(ORDER), 20000, repeat)
+    for codec in codecs:
+        best = bench(f"{codec.name}.dumps(params)", lambda: codec.dumps(ORDER), 20000, repeat)
+        print(f"  {'':<32}{baseline / best:>11.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,298 @@
+"""
+    candle_builder.py
+
+    OHLCV bars built incrementally from live ticks, for strategies that need fresh candles without polling
+    get_ohlc.
+
+    CandleBuilder keeps a CandleSeries per instrument and interval (1s, 1m, 5m and 15m by default). Each
+    1501/1502 touchline or 1512 LTP message updates the current bar of every interval in constant time;
+    quote-only updates (no new trade) are ignored. Volume comes from the change in TotalTradedQuantity, or
+    from the last traded quantity for 1512 messages that do not carry it.
+
+    1505 candle broadcasts are the exchange's own one minute bars: `reconcile` overwrites the matching
+    1m bar with them and corrects the 5m and 15m bars that contain it. `seed` loads earlier 1m bars from
+    get_ohlc so that the longer intervals have history as soon as an instrument is subscribed.
+
+        candles = CandleBuilder()
+        candles.add_listener(lambda key, interval, bar: print(key, interval, bar))  # called on each closed bar
+        candles.update(message)
+        bars = candles.bars(2, 35003, 300)  # 5m bars, oldest first, the last one still forming
+
+    Bar times are epoch seconds of the bar start.
+"""
+import threading
+from collections import deque
+from datetime import datetime
+
+# XTS timestamps count seconds from 1980-01-01
+XTS_EPOCH_OFFSET = 315532800
+
+INTERVALS = (1, 60, 300, 900)
+
+
+class Bar:
+    """One OHLCV bar starting at `time`."""
+
+    __slots__ = ("time", "open", "high", "low", "close", "volume")
+
+    def __init__(self, time, open, high, low, close, volume=0):
+        self.time = time
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return (f"Bar({datetime.fromtimestamp(self.time):%H:%M:%S} o={self.open} h={self.high} l={self.low} "
+                f"c={self.close} v={self.volume})")
+
+
+class CandleSeries:
+    """Bars of one instrument and interval, oldest first; the last bar is the one still forming."""
+
+    def __init__(self, interval, max_bars=1500):
+        self.interval = interval
+        self.bars = deque(maxlen=max_bars)
+
+    def update(self, time, price, volume):
+        """Add a trade; returns the bar it closed, if any."""
+        start = int(time) - int(time) % self.interval
+        bars = self.bars
+        if bars:
+            bar = bars[-1]
+            if bar.time == start:
+                if price > bar.high:
+                    bar.high = price
+                elif price < bar.low:
+                    bar.low = price
+                bar.close = price
+                bar.volume += volume
+                return None
+            if start < bar.time:
+                # A trade from a bar that is already closed, e.g. delayed across a reconnect
+                old = self.bar_at(start, create=False)
+                if old is not None:
+                    old.high = max(old.high, price)
+                    old.low = min(old.low, price)
+                    old.volume += volume
+                return None
+        bars.append(Bar(start, price, price, price, price, volume))
+        return bars[-2] if len(bars) > 1 else None
+
+    def bar_at(self, start, create=True):
+        """Return the bar starting at `start`, inserting an empty one in order if `create` is set."""
+        bars = self.bars
+        for index in range(len(bars) - 1, -1, -1):  # Recent bars are the ones looked up
+            bar = bars[index]
+            if bar.time == start:
+                return bar
+            if bar.time < start:
+                break
+        else:
+            index = -1
+        if not create:
+            return None
+        bar = Bar(start, None, None, None, None, 0)
+        if index + 1 == len(bars):
+            bars.append(bar)
+        elif len(bars) == bars.maxlen:
+            return None  # Older than anything a full series still holds
+        else:
+            bars.insert(index + 1, bar)
+        return bar
+
+
+class CandleBuilder:
+    """Streaming multi-interval OHLCV aggregation for every instrument that trades."""
+
+    def __init__(self, intervals=INTERVALS, max_bars=1500):
+        self.intervals = tuple(sorted(intervals))
+        self.max_bars = max_bars
+        self.series = {}  # (exchangeSegment, exchangeInstrumentID) -> {interval: CandleSeries}
+        self.listeners = []
+        self._last_trade = {}  # key -> (time, price, cumulative volume) of the last trade seen
+        self._seeded = set()
+        self._lock = threading.Lock()
+
+        # Counters
+        self.trades = 0
+        self.reconciled = 0
+        self.corrections = 0
+
+    def add_listener(self, listener):
+        """Call `listener(key, interval, bar)` whenever a bar closes."""
+        self.listeners.append(listener)
+
+    def _series(self, key):
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = {interval: CandleSeries(interval, self.max_bars)
+                                         for interval in self.intervals}
+        return series
+
+    def bars(self, exchange_segment, exchange_instrument_id, interval):
+        """Return a copy of the bars of an instrument and interval, oldest first."""
+        with self._lock:
+            series = self.series.get((int(exchange_segment), int(exchange_instrument_id)))
+            if not series:
+                return []
+            # New Bar objects, so the caller's copy does not change with the next tick
+            return [Bar(bar.time, bar.open, bar.high, bar.low, bar.close, bar.volume) for bar in series[interval].bars]
+
+    def update(self, message):
+        """Add the trade carried by a decoded 1501/1502/1512 message; returns False if there was none."""
+        try:
+            key = (int(message["ExchangeSegment"]), int(message["ExchangeInstrumentID"]))
+            touchline = message.get("Touchline")
+            if touchline is not None:
+                trade_time = touchline.get("LastTradedTime") or touchline.get("LastUpdateTime")
+                price = float(touchline["LastTradedPrice"])
+                cumulative = touchline.get("TotalTradedQuantity")
+                quantity = touchline.get("LastTradedQunatity") or 0
+            else:
+                trade_time = message.get("LastUpdateTime") or message.get("ExchangeTimeStamp")
+                price = float(message["LastTradedPrice"])
+                cumulative = None
+                quantity = message.get("LastTradedQunatity") or 0
+            trade_time = int(trade_time) + XTS_EPOCH_OFFSET
+        except (KeyError, TypeError, ValueError):
+            return False
+        if not price:
+            return False
+
+        closed = []
+        with self._lock:
+            last = self._last_trade.get(key)
+            if cumulative is not None:
+                cumulative = int(cumulative)
+                if last is not None and last[2] is not None:
+                    if cumulative <= last[2] and trade_time == last[0]:
+                        return False  # A quote update, no new trade
+                    volume = max(0, cumulative - last[2])
+                else:
+                    volume = 0  # First sight of the instrument: its day volume is not a trade
+            else:
+                if last is not None and (trade_time, price) == last[:2]:
+                    return False
+                volume = int(quantity)
+                cumulative = last[2] + volume if last is not None and last[2] is not None else None
+            self._last_trade[key] = (trade_time, price, cumulative)
+            self.trades += 1
+
+            for interval, series in self._series(key).items():
+                bar = series.update(trade_time, price, volume)
+                if bar is not None:
+                    closed.append((interval, bar))
+
+        for interval, bar in closed:
+            for listener in self.listeners:
+                listener(key, interval, bar)
+        return True
+
+    def reconcile(self, message):
+        """Correct the bars with a decoded 1505 candle message, whose BarTime is the minute's start."""
+        try:
+            key = (int(message["ExchangeSegment"]), int(message["ExchangeInstrumentID"]))
+            start = int(message["BarTime"]) + XTS_EPOCH_OFFSET
+            start -= start % 60
+            values = (float(message["Open"]), float(message["High"]), float(message["Low"]),
+                      float(message["Close"]), int(message.get("BarVolume") or 0))
+        except (KeyError, TypeError, ValueError):
+            return False
+
+        with self._lock:
+            series = self._series(key)
+            minute = series[60].bar_at(start) if 60 in series else None
+            if minute is None:
+                return False
+            old_volume = minute.volume
+            if (minute.open, minute.high, minute.low, minute.close, minute.volume) != values:
+                self.corrections += 1
+            minute.open, minute.high, minute.low, minute.close, minute.volume = values
+
+            for interval, longer in series.items():
+                if interval <= 60 or interval % 60:
+                    continue
+                bar = longer.bar_at(start - start % interval)
+                if bar is None:
+                    continue
+                if bar.open is None or bar.time == start:
+                    bar.open = values[0]
+                if bar.close is None:
+                    bar.close = values[3]
+                bar.high = values[1] if bar.high is None else max(bar.high, values[1])
+                bar.low = values[2] if bar.low is None else min(bar.low, values[2])
+                bar.volume += values[4] - old_volume
+            self.reconciled += 1
+        return True
+
+    def seed(self, xt_market, exchange_segment, exchange_instrument_id, start=None, end=None, time_offset=0):
+        """
+        Load today's 1m bars from get_ohlc (from 09:15 unless `start` is given) into the 1m and longer
+        intervals, before the first live bar. `time_offset` is added to the timestamps of the response,
+        e.g. -19800 for a server that reports IST wall-clock times. Returns the number of bars loaded.
+        """
+        now = datetime.now()
+        start = start or now.replace(hour=9, minute=15, second=0, microsecond=0)
+        end = end or now
+        response = xt_market.get_ohlc(exchange_segment, exchange_instrument_id, start.strftime("%b %d %Y %H%M%S"),
+                                      end.strftime("%b %d %Y %H%M%S"), 60)
+        try:
+            rows = response["result"]["dataReponse"]
+        except (KeyError, TypeError):
+            print(f"OHLC seed failed for {exchange_segment}/{exchange_instrument_id}: {response}")
+            return 0
+
+        history = []
+        for row in rows.split(","):
+            fields = row.split("|")
+            if len(fields) < 6:
+                continue
+            try:
+                history.append((int(fields[0]) + time_offset, float(fields[1]), float(fields[2]),
+                                float(fields[3]), float(fields[4]), int(fields[5])))
+            except ValueError:
+                continue
+        history.sort()
+
+        key = (int(exchange_segment), int(exchange_instrument_id))
+        with self._lock:
+            if key in self._seeded:
+                return 0
+            self._seeded.add(key)
+            series = self._series(key)
+
+            # Live ticks own every minute from the first live bar on
+            minutes = series.get(60)
+            first_live = minutes.bars[0].time if minutes is not None and minutes.bars else None
+            for interval, candles in series.items():
+                if interval < 60 or interval % 60:
+                    continue
+                live_from = candles.bars[0].time if candles.bars else None
+                touched = set()
+                for time, open_price, high, low, close, volume in history:
+                    if first_live is not None and time >= first_live:
+                        break
+                    bar = candles.bar_at(time - time % interval)
+                    if bar is None:
+                        continue
+                    if bar.open is None or (bar.time == live_from and id(bar) not in touched):
+                        bar.open = open_price
+                    if bar.close is None or bar.time != live_from:
+                        bar.close = close
+                    bar.high = high if bar.high is None else max(bar.high, high)
+                    bar.low = low if bar.low is None else min(bar.low, low)
+                    bar.volume += volume
+                    touched.add(id(bar))
+        return len(history)
+
+    def is_seeded(self, exchange_segment, exchange_instrument_id):
+        return (int(exchange_segment), int(exchange_instrument_id)) in self._seeded
+
+    def stats(self):
+        return {'instruments': len(self.series), 'trades': self.trades, 'reconciled': self.reconciled,
+                'corrections': self.corrections}
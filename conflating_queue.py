@@ -0,0 +1,109 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+
+
+class ConflatingQueue:
+    """
+    Bounded per-client buffer between the market data hub and a WebSocket client.
+
+    Ticks are keyed by instrument and only the latest snapshot of each instrument is kept, so a slow
+    client receives fresh prices instead of a growing backlog. Control messages (subscription
+    confirmations, errors) are kept in order in a small bounded deque. Incremental updates whose fields
+    must all arrive (depth level changes) are merged per key with `put_merged`. `get_batch` hands
+    everything pending to the sender at most `max_flush_rate` times per second.
+    """
+
+    def __init__(self, max_flush_rate=20, max_instruments=5000, max_control_messages=1000):
+        self.min_flush_interval = 1.0 / max_flush_rate if max_flush_rate else 0.0
+        self.max_instruments = max_instruments
+
+        # Latest message per instrument key, in first-arrival order
+        self.ticks = OrderedDict()
+
+        # Ordered non-tick messages
+        self.control = deque()
+        self.max_control_messages = max_control_messages
+
+        # key -> (merged fields, render function) of pending incremental updates
+        self.merged = OrderedDict()
+
+        self._ready = asyncio.Event()
+        self._last_flush = 0.0
+
+        # Counters
+        self.received = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.sent = 0
+        self.flushes = 0
+
+    def put_tick(self, key, message):
+        """Store the latest tick of an instrument, replacing one that has not been sent yet."""
+        self.received += 1
+        if key in self.ticks:
+            self.coalesced += 1
+        elif len(self.ticks) >= self.max_instruments:
+            self.dropped += 1
+            return
+        self.ticks[key] = message
+        self._ready.set()
+
+    def put_control(self, message):
+        """Queue a message that must not be conflated, dropping the oldest one when the buffer is full."""
+        self.received += 1
+        if len(self.control) >= self.max_control_messages:
+            self.control.popleft()
+            self.dropped += 1
+        self.control.append(message)
+        self._ready.set()
+
+    def put_merged(self, key, fields, render):
+        """
+        Merge `fields` (a dict) into the pending update of `key`, so a field changed again before the flush
+        is sent once with its latest value. `render(key, fields)` returns the message to send.
+        """
+        self.received += 1
+        pending = self.merged.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            pending[0].update(fields)
+        elif len(self.merged) >= self.max_instruments:
+            self.dropped += 1
+            return
+        else:
+            self.merged[key] = (dict(fields), render)
+        self._ready.set()
+
+    async def get_batch(self):
+        """Wait for pending messages, respecting the flush rate, and return them as a list."""
+        await self._ready.wait()
+
+        # Let more ticks coalesce until the next flush slot
+        wait = self._last_flush + self.min_flush_interval - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        batch = list(self.control)
+        batch.extend(self.ticks.values())
+        batch.extend(render(key, fields) for key, (fields, render) in self.merged.items())
+        self.control.clear()
+        self.ticks.clear()
+        self.merged.clear()
+        self._ready.clear()
+
+        self._last_flush = time.monotonic()
+        self.flushes += 1
+        self.sent += len(batch)
+        return batch
+
+    def stats(self):
+        """Return the buffer counters."""
+        return {
+            'received': self.received,
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'flushes': self.flushes,
+            'pending': len(self.ticks) + len(self.control) + len(self.merged)
+        }
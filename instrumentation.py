@@ -0,0 +1,311 @@
+"""
+    instrumentation.py
+
+    Request timing for the XTS Connect REST wrapper.
+
+    XTSConnect calls every hook added with add_request_hook with a RequestRecord once a request has
+    finished: route, method, status, response bytes, and the DNS, TCP connect, TLS handshake, time to
+    first byte and total latency in milliseconds, plus the time spent waiting for the client-side rate
+    limiter before the request was sent. Connection phases are only measured when the request opened a
+    new connection; on a reused keep-alive connection they are None.
+
+    RequestMetrics is the hook that keeps HDR-style latency histograms per route:
+
+        metrics = RequestMetrics()
+        xt.add_request_hook(metrics)
+        metrics.start_summary(interval=60)  # p50/p99/p999 per route written to the log every minute
+        print(metrics.percentiles())
+
+    :copyright:
+    :license: see LICENSE for details.
+"""
+import logging
+import math
+import socket
+import threading
+import time
+from array import array
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+log = logging.getLogger(__name__)
+
+# Latencies recorded for every request, in RequestRecord attribute names
+METRICS = ("total_ms", "ttfb_ms", "dns_ms", "connect_ms", "tls_ms", "wait_ms")
+
+PERCENTILES = (50, 99, 99.9)
+
+
+class RequestRecord:
+    """Timings and outcome of one REST request."""
+
+    __slots__ = ("route", "method", "status", "bytes", "dns_ms", "connect_ms", "tls_ms", "ttfb_ms", "total_ms",
+                 "wait_ms", "error")
+
+    def __init__(self, route, method, status=None, bytes=0, dns_ms=None, connect_ms=None, tls_ms=None,
+                 ttfb_ms=None, total_ms=None, wait_ms=None, error=None):
+        self.route = route
+        self.method = method
+        self.status = status
+        self.bytes = bytes
+        self.dns_ms = dns_ms
+        self.connect_ms = connect_ms
+        self.tls_ms = tls_ms
+        self.ttfb_ms = ttfb_ms
+        self.total_ms = total_ms
+        self.wait_ms = wait_ms
+        self.error = error
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"RequestRecord({fields})"
+
+
+########################################################################################################
+# Connection phase timing
+########################################################################################################
+
+# Phases of the connection opened by the current thread's request, read by PooledTransport.request
+_connect_timings = threading.local()
+
+
+def pop_connect_timings():
+    """Return and clear the (dns, connect, tls) milliseconds of the connection this thread opened, if any."""
+    timings = getattr(_connect_timings, "value", None)
+    _connect_timings.value = None
+    return timings or (None, None, None)
+
+
+class _TimedConnectionMixin:
+    """Times name resolution, TCP connect and TLS handshake of a new urllib3 connection."""
+
+    def _new_conn(self):
+        started = time.perf_counter()
+        host = self._dns_host
+        try:
+            # Resolve here so the lookup is timed apart from the connect; urllib3 reports failures itself
+            addresses = []
+            for info in socket.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM):
+                if info[4][0] not in addresses:
+                    addresses.append(info[4][0])
+        except socket.gaierror:
+            addresses = []
+        resolved = time.perf_counter()
+
+        # Like urllib3 with a host name, try each address in turn until one connects
+        candidates = addresses or [host]
+        try:
+            for position, address in enumerate(candidates):
+                self._dns_host = address
+                try:
+                    sock = super()._new_conn()
+                    break
+                except (NewConnectionError, ConnectTimeoutError):
+                    if position == len(candidates) - 1:
+                        raise
+        finally:
+            self._dns_host = host
+        self._timed_phases = ((resolved - started) * 1000, (time.perf_counter() - resolved) * 1000)
+        return sock
+
+    def connect(self):
+        self._timed_phases = None
+        started = time.perf_counter()
+        super().connect()
+        if self._timed_phases is not None:
+            dns_ms, connect_ms = self._timed_phases
+            tls_ms = (time.perf_counter() - started) * 1000 - dns_ms - connect_ms if self.is_https else None
+            _connect_timings.value = (dns_ms, connect_ms, tls_ms)
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    is_https = False
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    is_https = True
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose new connections record their DNS, connect and TLS times."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _TimedHTTPConnectionPool,
+                                                   "https": _TimedHTTPSConnectionPool}
+
+
+########################################################################################################
+# Histograms
+########################################################################################################
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of latencies in microseconds, from 1 us to about 38 hours.
+
+    Values below 128 us have their own bucket; above that every power of two is split into 64 buckets,
+    so any recorded value is reported within 1.6% of its true value, in constant memory.
+    """
+
+    SUB_BUCKETS = 64
+    MAGNITUDES = 30
+
+    def __init__(self):
+        self.counts = array('q', bytes(8 * (2 * self.SUB_BUCKETS + self.MAGNITUDES * self.SUB_BUCKETS)))
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value):
+        if value < 2 * self.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - 7  # Keep the top 7 bits: 64 buckets per power of two
+        return 2 * self.SUB_BUCKETS + (shift - 1) * self.SUB_BUCKETS + (value >> shift) - self.SUB_BUCKETS
+
+    def _value(self, index):
+        """Return the highest value counted in bucket `index`."""
+        if index < 2 * self.SUB_BUCKETS:
+            return index
+        shift, offset = divmod(index - 2 * self.SUB_BUCKETS, self.SUB_BUCKETS)
+        return ((offset + self.SUB_BUCKETS + 1) << (shift + 1)) - 1
+
+    def record(self, ms):
+        """Record a latency in milliseconds."""
+        value = max(0, int(ms * 1000))
+        index = min(self._index(value), len(self.counts) - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, percent):
+        """Return the latency in milliseconds at or below which `percent` of the recorded values fall."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * percent / 100.0))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self._value(index), self.max) / 1000.0
+        return self.max / 1000.0
+
+    def merge(self, other):
+        """Add the counts of another histogram to this one."""
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def summary(self):
+        """Return count, mean, min, max and the PERCENTILES in milliseconds."""
+        result = {
+            'count': self.count,
+            'mean_ms': self.total / self.count / 1000.0 if self.count else 0.0,
+            'min_ms': (self.min or 0) / 1000.0,
+            'max_ms': self.max / 1000.0
+        }
+        for percent in PERCENTILES:
+            result[f"p{percent:g}_ms".replace(".", "")] = self.percentile(percent)
+        return result
+
+
+class _RouteMetrics:
+    def __init__(self):
+        self.histograms = {metric: LatencyHistogram() for metric in METRICS}
+        self.errors = 0
+        self.bytes = 0
+        self.statuses = {}
+
+
+class RequestMetrics:
+    """Request hook keeping a latency histogram per route and phase, with error, status and byte counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._summary_timer = None
+        self._summary_interval = None
+
+    def __call__(self, record):
+        with self._lock:
+            route = self._routes.get(record.route)
+            if route is None:
+                route = self._routes[record.route] = _RouteMetrics()
+            for metric in METRICS:
+                value = getattr(record, metric)
+                if value is not None:
+                    route.histograms[metric].record(value)
+            route.bytes += record.bytes or 0
+            if record.error is not None:
+                route.errors += 1
+            route.statuses[record.status] = route.statuses.get(record.status, 0) + 1
+
+    def percentiles(self, metric="total_ms"):
+        """Return {route: histogram summary} of one metric, with all routes together under "*"."""
+        with self._lock:
+            overall = LatencyHistogram()
+            result = {}
+            for name, route in self._routes.items():
+                histogram = route.histograms[metric]
+                overall.merge(histogram)
+                result[name] = dict(histogram.summary(), errors=route.errors, bytes=route.bytes)
+            result["*"] = overall.summary()
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    def summary_lines(self):
+        """Return one log line per route with total latency percentiles and mean connection phases."""
+        lines = []
+        with self._lock:
+            routes = sorted(self._routes.items(), key=lambda item: -item[1].histograms["total_ms"].count)
+            for name, route in routes:
+                total = route.histograms["total_ms"].summary()
+                phases = " ".join(f"{metric[:-3]}={route.histograms[metric].summary()['mean_ms']:.1f}"
+                                  for metric in ("wait_ms", "ttfb_ms", "dns_ms", "connect_ms", "tls_ms")
+                                  if route.histograms[metric].count)
+                lines.append(f"{name}: n={total['count']} err={route.errors} p50={total['p50_ms']:.1f} "
+                             f"p99={total['p99_ms']:.1f} p999={total['p999_ms']:.1f} max={total['max_ms']:.1f} ms "
+                             f"mean {phases} ms")
+        return lines
+
+    def start_summary(self, interval=60):
+        """Write summary_lines to the log every `interval` seconds until stop_summary."""
+        self._summary_interval = interval
+        self._schedule_summary()
+
+    def _schedule_summary(self):
+        self._summary_timer = threading.Timer(self._summary_interval, self._write_summary)
+        self._summary_timer.daemon = True
+        self._summary_timer.start()
+
+    def _write_summary(self):
+        for line in self.summary_lines():
+            log.info("XTS latency %s", line)
+        if self._summary_interval is not None:
+            self._schedule_summary()
+
+    def stop_summary(self):
+        self._summary_interval = None
+        if self._summary_timer is not None:
+            self._summary_timer.cancel()
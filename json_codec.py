@@ -0,0 +1,106 @@
+"""
+    json_codec.py
+
+    JSON encoding and decoding for the XTS Connect REST wrapper.
+
+    The codec parses response bodies straight from bytes, without decoding them into a str first, and
+    encodes request bodies to bytes. When orjson is installed it is used for both directions; otherwise
+    the standard library json module is used with the same interface.
+
+    Large responses (instrument master, order book, trade book) are read in big chunks into a single
+    buffer sized from Content-Length, so the body is held once instead of as a list of chunks joined
+    into a second copy.
+
+    :copyright:
+    :license: see LICENSE for details.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Routes whose responses run to megabytes and are read with read_body
+STREAMED_ROUTES = {
+    "market.instruments.master",
+    "order.status", "order.dealer.status", "trades", "dealer.trades",
+}
+
+# Bytes read per chunk of a streamed response
+CHUNK_SIZE = 1 << 18
+
+
+class JsonCodec:
+    """Standard library codec."""
+
+    name = "json"
+
+    def loads(self, data):
+        """Parse a JSON document from bytes, bytearray, memoryview or str."""
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+    def dumps(self, obj):
+        """Serialise an object to JSON bytes."""
+        return json.dumps(obj).encode("utf8")
+
+
+class OrjsonCodec(JsonCodec):
+    """orjson codec, several times faster than the standard library in both directions."""
+
+    name = "orjson"
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+    def dumps(self, obj):
+        return orjson.dumps(obj)
+
+
+def default_codec():
+    """Return the fastest codec available."""
+    return OrjsonCodec() if orjson is not None else JsonCodec()
+
+
+def read_body(response, chunk_size=CHUNK_SIZE):
+    """
+    Read the body of a requests.Response sent with stream=True into one buffer and return it.
+    The result can be passed to a codec's loads without further copies. A pooled transport slot held by
+    the response is given back once the body is read.
+    """
+    try:
+        return _read_body(response, chunk_size)
+    finally:
+        release_slot = getattr(response, "release_slot", None)
+        if release_slot is not None:
+            release_slot()
+
+
+def _read_body(response, chunk_size):
+    if response._content_consumed:
+        return response.content  # Already read, e.g. by a recording transport
+
+    length = response.headers.get("content-length")
+    encoding = response.headers.get("content-encoding", "identity")
+    if length is None or encoding != "identity":
+        # Size unknown (chunked or compressed), collect the decoded chunks
+        buffer = bytearray()
+        for chunk in response.iter_content(chunk_size):
+            buffer += chunk
+        return buffer
+
+    buffer = bytearray(int(length))
+    view = memoryview(buffer)
+    filled = 0
+    while filled < len(buffer):
+        read = response.raw.readinto(view[filled:filled + chunk_size])
+        if not read:
+            break
+        filled += read
+    if filled == len(buffer):
+        response.raw.release_conn()  # Keep the connection for the next request
+    else:
+        response.close()
+    return view[:filled] if filled < len(buffer) else buffer
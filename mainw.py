@@ -2,8 +2,10 @@ import sys
 import asyncio
 import requests
 import websockets
-from PyQt5.QtWidgets import QApplication, QMainWindow, QTabWidget, QWidget, QVBoxLayout, QTextEdit, QSplitter, QAction, QMessageBox
-from PyQt5.QtCore import QThread, pyqtSignal, Qt
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QTabWidget, QWidget, QVBoxLayout, QHBoxLayout, QTextEdit, QSplitter, QAction, QMessageBox,
+                             QTableView, QHeaderView, QAbstractItemView, QComboBox, QCheckBox, QDateTimeEdit, QLabel)
+from PyQt5.QtCore import QThread, pyqtSignal, Qt, QAbstractTableModel, QModelIndex, QDateTime, QTimer
+from array import array
 import json
 import os
 import threading
@@ -17,12 +19,13 @@ from WebSocketClient import WebSocketClient
 from profile_dialog import ProfileDialog
 from margin_dialog import MarginDialog
 # from algo import AlgoTab, ResearchAlgo  # Import AlgoTab and ResearchAlgo from algo.py
-from datetime import datetime, timedelta
+from datetime import datetime
 from net_position import NetPositionDialog
 from quant_ui import WebSocketClientUI
 from qasync import QEventLoop
 import market
 from Connect import XTSConnect
+from message_log import MessageLog, LogReader
 
 
 class OrderBookUpdater(QThread):
@@ -48,42 +51,148 @@ class OrderBookUpdater(QThread):
         """Stop the thread gracefully."""
         self._is_running = False
         self.wait()
+class LogRecordModel(QAbstractTableModel):
+    """Table model over the log entries matching the current filter; records are read only when a row is painted."""
+    HEADERS = ["Time", "Type", "Message"]
+
+    def __init__(self, reader, parent=None):
+        super().__init__(parent)
+        self.reader = reader
+        self.matches = array('I')
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.matches)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        entry = self.matches[index.row()]
+        if index.column() == 1:
+            return self.reader.entry_type(entry)
+        record = self.reader.read(entry)
+        return str(record.get("timestamp", "")) if index.column() == 0 else str(record.get("message", ""))
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def set_matches(self, matches):
+        self.beginResetModel()
+        self.matches = matches
+        self.endResetModel()
+
+    def append_matches(self, matches):
+        if not matches:
+            return
+        first = len(self.matches)
+        self.beginInsertRows(QModelIndex(), first, first + len(matches) - 1)
+        self.matches.extend(matches)
+        self.endInsertRows()
+
+
 class LogWindow(QMainWindow):
-    """Window to display stored log messages with timestamps."""
+    """Window to display stored log messages with timestamps, filtered by type and time range."""
 
-    def __init__(self, log_file_path):
+    def __init__(self, message_log):
         super().__init__()
         self.setWindowTitle("WebSocket Log")
-        self.setGeometry(150, 150, 600, 400)
+        self.setGeometry(150, 150, 900, 500)
         
-        self.log_file_path = log_file_path
-        self.text_display = QTextEdit(self)
-        self.text_display.setReadOnly(True)
+        self.message_log = message_log
+        self.reader = LogReader(message_log)
+        self.model = LogRecordModel(self.reader, self)
+
+        # Filter bar
+        self.type_filter = QComboBox()
+        self.type_filter.addItems(["All", "order", "trade", "position", "connect", "other"])
+        self.type_filter.currentTextChanged.connect(self.apply_filter)
+
+        self.time_filter = QCheckBox("From")
+        self.time_filter.toggled.connect(self.apply_filter)
+        now = QDateTime.currentDateTime()
+        self.start_time = QDateTimeEdit(now.addSecs(-3600))
+        self.end_time = QDateTimeEdit(now.addSecs(3600))
+        for edit in (self.start_time, self.end_time):
+            edit.setDisplayFormat("yyyy-MM-dd HH:mm:ss")
+            edit.setCalendarPopup(True)
+            edit.dateTimeChanged.connect(self.apply_filter)
+
+        self.count_label = QLabel()
+
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("Type"))
+        filter_layout.addWidget(self.type_filter)
+        filter_layout.addWidget(self.time_filter)
+        filter_layout.addWidget(self.start_time)
+        filter_layout.addWidget(QLabel("To"))
+        filter_layout.addWidget(self.end_time)
+        filter_layout.addStretch()
+        filter_layout.addWidget(self.count_label)
+
+        # The view only asks the model for the visible rows; fixed row heights keep scrolling O(visible rows)
+        self.table_view = QTableView(self)
+        self.table_view.setModel(self.model)
+        self.table_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table_view.setWordWrap(False)
+        self.table_view.verticalHeader().setVisible(False)
+        self.table_view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table_view.horizontalHeader().setStretchLastSection(True)
+        self.table_view.setColumnWidth(0, 140)
+        self.table_view.setColumnWidth(1, 70)
         
         layout = QVBoxLayout()
-        layout.addWidget(self.text_display)
+        layout.addLayout(filter_layout)
+        layout.addWidget(self.table_view)
         
         central_widget = QWidget()
         central_widget.setLayout(layout)
         self.setCentralWidget(central_widget)
-        
-        # Load and display initial log data
-        self.load_log_data()
+
+        # New messages are picked up from the index shortly after the writer thread stores them
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(500)
+        self.refresh_timer.timeout.connect(self.load_log_data)
+
+    def current_filter(self):
+        """Return the (types, start, end) arguments of LogReader.query for the filter bar."""
+        log_type = self.type_filter.currentText()
+        types = None if log_type == "All" else (log_type,)
+        if not self.time_filter.isChecked():
+            return types, None, None
+        return types, self.start_time.dateTime().toPyDateTime(), self.end_time.dateTime().toPyDateTime()
+
+    def apply_filter(self, *args):
+        """Re-run the current filter over the whole index."""
+        types, start, end = self.current_filter()
+        self.model.set_matches(self.reader.query(types, start, end))
+        self.update_count()
 
     def load_log_data(self):
-        """Load log data from file and display it."""
-        if os.path.exists(self.log_file_path):
-            with open(self.log_file_path, 'r') as log_file:
-                log_data = json.load(log_file)
-                self.text_display.clear()
-                for entry in log_data:
-                    timestamp = entry["timestamp"]
-                    message = entry["message"]
-                    self.text_display.append(f"{timestamp}: {message}")
+        """Load index entries written since the last call and show the ones matching the filter."""
+        first_new = self.reader.refresh()
+        if first_new == 0:
+            self.apply_filter()
+            return
+        types, start, end = self.current_filter()
+        self.model.append_matches(self.reader.query(types, start, end, first=first_new))
+        self.update_count()
+
+    def update_count(self):
+        self.count_label.setText(f"{self.model.rowCount()} of {len(self.reader)} messages")
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.load_log_data()
 
     def append_message(self, timestamp, message):
-        """Append a message to the log display."""
-        self.text_display.append(f"{timestamp}: {message}")
+        """Schedule a refresh of the visible log for a new message."""
+        if self.isVisible() and not self.refresh_timer.isActive():
+            self.refresh_timer.start()
 
 class MainWindow(QMainWindow):
     orderbook_signal = pyqtSignal(dict)
@@ -99,6 +208,9 @@ class MainWindow(QMainWindow):
         self.market_user_id = market_user_id
         self.xt_market = XTSConnect(market_api_key, market_api_secret, source="WEBAPI")
         self.xt_market.token = market_data_token  # Set the token for xt_market
+        self.xt_market.add_token_listener(self.save_refreshed_token)
+        # The relay's hub, kept here so charts and strategies can read its ticks, bars and books
+        self.market_hub = market.MarketDataHub(self.xt_market, self.market_user_id, self.market_data_token)
         # Run market data in a separate thread
         self.start_market_thread()
 
@@ -106,7 +218,7 @@ class MainWindow(QMainWindow):
         """Start a separate thread for market data handling."""
         def run_market():
             try:
-                market.start_test(self.xt_market, self.market_user_id, self.market_data_token)
+                market.start_test(self.xt_market, self.market_user_id, self.market_data_token, hub=self.market_hub)
                 print("market.start_test completed successfully.")
             except Exception as e:
                 print(f"Error in market.start_test: {e}")
@@ -116,14 +228,9 @@ class MainWindow(QMainWindow):
 
         self.setWindowTitle('Interactive Socket and Orders')
         self.setGeometry(100, 100, 800, 600)
-        # Initialize log file
-        self.log_file_path = "websocket_log.json"
-        self.log_window = LogWindow(self.log_file_path)  # Ensure log_window is initialized here
-        
-        # Ensure log file exists
-        if not os.path.exists(self.log_file_path):
-            with open(self.log_file_path, 'w') as log_file:
-                json.dump([], log_file)
+        # Initialize the message log (append-only daily files under logs/, written off the GUI thread)
+        self.message_log = MessageLog("logs")
+        self.log_window = LogWindow(self.message_log)  # Ensure log_window is initialized here
         # Set up menu bar
         self.create_menu_bar()
         self.orderbook_dialog = None
@@ -160,7 +267,9 @@ class MainWindow(QMainWindow):
         # Add Quant Tab
         self.quant_tab = WebSocketClientUI()
         self.quant_tab.table_widget.subscribe_request.connect(self.websocket_client.send_subscription)
-        self.websocket_client.response_received.connect(self.quant_tab.table_widget.update_ltp_column)
+        self.quant_tab.table_widget.subscribe_request.connect(
+            lambda segment, instrument_id: self.websocket_client.dispatcher.register(
+                segment, instrument_id, self.quant_tab.table_widget.update_ltp_from_tick))  # Route LTP ticks to the order table
         self.tab_widget.addTab(self.quant_tab, "Quant")
 
 
@@ -234,10 +343,8 @@ class MainWindow(QMainWindow):
         # Check if the dialog instance already exists and is not closed
         if not hasattr(self, 'net_position_dialog') or self.net_position_dialog is None:
             # Pass self.websocket_client to the NetPositionDialog
+            # NetPositionDialog registers its instruments with the tick dispatcher when it loads positions
             self.net_position_dialog = NetPositionDialog(self.websocket_client)
-            
-            # Connect the WebSocket client's response signal to update LTP in NetPositionDialog
-            self.websocket_client.response_received.connect(self.net_position_dialog.update_ltp_column)
 
         self.net_position_dialog.exec_()
 
@@ -317,6 +424,7 @@ class MainWindow(QMainWindow):
             self.orderbook_updater.stop()
         if self.socket_thread.isRunning():
             self.socket_thread.terminate()
+        self.message_log.close()
         event.accept()
 
     def keyPressEvent(self, event):
@@ -338,29 +446,29 @@ class MainWindow(QMainWindow):
         self.log_window.append_message(timestamp, message)
 
     def save_message_to_log(self, timestamp, message):
-        """Append each message with a timestamp to the JSON log file, keeping only one day's messages."""
+        """Append a message with its timestamp to the message log; rotation and pruning happen in the writer thread."""
+        self.message_log.write(timestamp, message)
+
+    def save_refreshed_token(self, kind, token, user_id):
+        """Rewrite credentials.json after the REST client logged in again, so other processes get the new token."""
+        if kind == "market":
+            self.market_data_token = token
+            fields = {"market_data_token": token, "market_user_id": user_id}
+        else:
+            self.order_token = token
+            fields = {"order_token": token, "order_user_id": user_id}
         try:
-            if os.path.exists(self.log_file_path):
-                with open(self.log_file_path, 'r') as log_file:
-                    log_data = json.load(log_file)
-            else:
-                log_data = []
-
-            # Add new message
-            log_data.append({"timestamp": timestamp, "message": message})
-
-            # Filter messages to keep only those within the last day
-            one_day_ago = datetime.now() - timedelta(days=1)
-            log_data = [
-                entry for entry in log_data
-                if datetime.strptime(entry["timestamp"], '%Y-%m-%d %H:%M:%S') > one_day_ago
-            ]
-
-            # Write updated log data back to file
-            with open(self.log_file_path, 'w') as log_file:
-                json.dump(log_data, log_file, indent=4)
-        except Exception as e:
-            print(f"Error saving message to log: {e}")
+            with open("credentials.json", "r") as file:
+                credentials = json.load(file)
+        except (IOError, ValueError):
+            credentials = {}
+        credentials.update(fields)
+        try:
+            with open("credentials.json.tmp", "w") as file:
+                json.dump(credentials, file, indent=4)
+            os.replace("credentials.json.tmp", "credentials.json")
+        except IOError as e:
+            print(f"Error saving refreshed credentials: {e}")
     
 
 class WebSocketThread(QThread):
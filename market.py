@@ -1,26 +1,331 @@
 import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import websockets
 import json
 from MarketDataSocketClient import MDSocket_io
+from subscription_manager import SubscriptionRegistry
+from conflating_queue import ConflatingQueue
+from tick_codec import FORMAT_JSON, FORMAT_BINARY, encode_touchline
+from partial_decoder import PartialDecoder
+from tick_store import TickStore
+from candle_builder import CandleBuilder
+from tick_recorder import recorder_from_env
+from order_book import OrderBookEngine
 
-def start_test(xt_market, market_user_id, market_data_token):
-    # Initialize MarketData socket client
-    market_data_socket = MDSocket_io(market_data_token, market_user_id)
 
-    # Callback when connected to the market data socket
-    def on_connect():
+def render_depth_delta(key, levels):
+    """Return the relay message of merged depth changes: [side (0 bid, 1 ask), level, price, size, orders]."""
+    return json.dumps({
+        'status': 'depth-delta',
+        'exchangeSegment': key[1],
+        'exchangeInstrumentID': key[2],
+        'changes': [[side, level, price, size, orders]
+                    for (side, level), (price, size, orders) in sorted(levels.items())]
+    })
+
+
+class MarketDataHub:
+    """Owns the single upstream market data socket and fans each tick out to the interested WebSocket clients."""
+
+    def __init__(self, xt_market, market_user_id, market_data_token, max_flush_rate=20, seed_candles=False,
+                 tick_capacity=0):
+        self.xt_market = xt_market
+        self.max_flush_rate = max_flush_rate
+        self.market_user_id = market_user_id
+        self.market_data_token = market_data_token
+        self.loop = None
+        self.market_data_socket = None
+        self.socket_thread = None
+        self.subscriptions = None
+
+        # Per-client conflating buffers, keyed by the downstream websocket
+        self.clients = {}
+
+        # Wire format negotiated by each client (JSON text unless it asks for binary)
+        self.formats = {}
+
+        # (exchangeSegment, exchangeInstrumentID) -> set of websockets that asked for it
+        self.interest = {}
+
+        # Subscription confirmations still running (the event loop only keeps weak references to tasks)
+        self.tasks = set()
+
+        # Full per-instrument state rebuilt from partial broadcasts (broadcastMode=Partial in config.ini)
+        self.partial_decoder = PartialDecoder()
+
+        # With tick_capacity, the last that many ticks of every held instrument, for charts and indicators
+        # (about 96 bytes per tick and instrument); read them with tick_store.history or the 'ticks' action
+        self.tick_store = TickStore(tick_capacity) if tick_capacity else None
+
+        # 1s/1m/5m/15m bars built from the same ticks, corrected by 1505 candles; read them with
+        # candles.bars, candles.add_listener or the 'candles' action
+        self.candles = CandleBuilder()
+
+        # With seed_candles, each newly subscribed instrument loads its earlier bars from get_ohlc on a
+        # thread of its own, so the slow calls never hold up the subscription batches
+        self.seed_executor = ThreadPoolExecutor(1, thread_name_prefix="candle-seed") if seed_candles else None
+        self.seeding = set()
+
+        # Bid and ask ladders of every instrument with depth; the changed levels are pushed as depth-delta
+        # messages to the clients holding the instrument on 1502
+        self.order_books = OrderBookEngine()
+        self.order_books.add_listener(self.on_depth_changed)
+
+        # Writes every upstream payload to disk when XTS_TICK_RECORD names a directory
+        self.tick_recorder = None
+
+    def start(self, loop):
+        """Connect the upstream socket once, on a dedicated background thread."""
+        if self.socket_thread is not None:
+            return
+
+        self.loop = loop
+        self.subscriptions = SubscriptionRegistry(self.xt_market, loop)
+        self.market_data_socket = MDSocket_io(self.market_data_token, self.market_user_id)
+
+        # Assign callbacks for the socket events
+        self.market_data_socket.on_connect = self.on_connect
+        self.market_data_socket.on_message1501_json_full = self.on_message1501_json_full
+        self.market_data_socket.on_message1501_json_partial = self.on_message1501_json_partial
+        self.market_data_socket.on_message1502_json_full = self.on_message1502_json_full
+        self.market_data_socket.on_message1502_json_partial = self.on_message1502_json_partial
+        self.market_data_socket.on_message1505_json_full = self.on_message1505_json_full
+        self.market_data_socket.on_message1505_json_partial = self.on_message1505_json_partial
+        self.market_data_socket.on_message1512_json_full = self.on_message1512_json_full
+        self.market_data_socket.on_message1512_json_partial = self.on_message1512_json_partial
+
+        # Event listener setup
+        event_listener = self.market_data_socket.get_emitter()
+        event_listener.on('connect', self.on_connect)
+        event_listener.on('1501-json-full', self.on_message1501_json_full)
+        event_listener.on('1501-json-partial', self.on_message1501_json_partial)
+        event_listener.on('1502-json-full', self.on_message1502_json_full)
+        event_listener.on('1502-json-partial', self.on_message1502_json_partial)
+        event_listener.on('1505-json-full', self.on_message1505_json_full)
+        event_listener.on('1505-json-partial', self.on_message1505_json_partial)
+        event_listener.on('1512-json-full', self.on_message1512_json_full)
+        event_listener.on('1512-json-partial', self.on_message1512_json_partial)
+
+        self.tick_recorder = recorder_from_env()
+        if self.tick_recorder is not None:
+            self.tick_recorder.attach(self.market_data_socket)
+
+        # Reconnect with the new token when the REST client logs in again after expiry
+        self.xt_market.add_token_listener(self.on_token_refreshed)
+
+        # Connect to the market data socket (this blocks its own thread, not the event loop)
+        self.socket_thread = threading.Thread(target=self.market_data_socket.connect, daemon=True)
+        self.socket_thread.start()
+
+    def on_token_refreshed(self, kind, token, user_id):
+        """Hand a refreshed market data token to the upstream socket."""
+        if kind != "market":
+            return
+        self.market_data_token = token
+        self.market_data_socket.set_token(token)
+        print('Market data token refreshed')
+
+    def on_connect(self):
         """Handles connection to the market data socket."""
         print('Market Data Socket connected successfully!')
 
+    # 1501 ticks feed the tick store, bars and books only: interest and the client buffers are keyed by
+    # instrument, so relaying them as well would let a touchline replace a pending 1502 tick
+    def on_message1501_json_full(self, data):
+        self.on_tick_full(data, fan_out=False)
+
+    def on_message1502_json_full(self, data):
+        self.on_tick_full(data)
+
+    def on_message1501_json_partial(self, data):
+        self.on_tick_partial(1501, data, fan_out=False)
+
+    def on_message1502_json_partial(self, data):
+        self.on_tick_partial(1502, data)
+
+    def on_message1505_json_full(self, data):
+        """Correct the built bars with the exchange's one minute candle."""
+        try:
+            self.candles.reconcile(json.loads(data))
+        except ValueError:
+            return
+
+    def on_message1505_json_partial(self, data):
+        message = self.partial_decoder.decode(1505, data)
+        if message is not None:
+            self.candles.reconcile(message)
+
+    def on_message1512_json_full(self, data):
+        """LTP-only ticks feed the bars, they carry nothing for the relay clients."""
+        try:
+            self.candles.update(json.loads(data))
+        except ValueError:
+            return
+
+    def on_message1512_json_partial(self, data):
+        message = self.partial_decoder.decode(1512, data)
+        if message is not None:
+            self.candles.update(message)
+
+    def on_tick_full(self, data, fan_out=True):
+        """Decode the instrument key once, keep the tick and hand it to the event loop for fan-out."""
+        try:
+            message = json.loads(data)
+            key = (int(message['ExchangeSegment']), int(message['ExchangeInstrumentID']))
+        except (ValueError, KeyError, TypeError):
+            return
+        if self.tick_store is not None:
+            self.tick_store.record(message)
+        self.candles.update(message)
+        self.order_books.update(message)
+        if fan_out:
+            self.loop.call_soon_threadsafe(self.broadcast, key, f"{data}", message)
+
+    def on_tick_partial(self, code, data, fan_out=True):
+        """Merge a partial tick into the instrument's snapshot and fan it out as a full message."""
+        message = self.partial_decoder.decode(code, data)
+        if message is None:
+            return
+        key = (message['ExchangeSegment'], message['ExchangeInstrumentID'])
+        if self.tick_store is not None:
+            self.tick_store.record(message)
+        self.candles.update(message)
+        self.order_books.update(message)
+        if not fan_out:
+            return
+
+        # The snapshot keeps changing on this thread, hand the event loop its own touchline
+        message = dict(message, Touchline=dict(message['Touchline']))
+        self.loop.call_soon_threadsafe(self.broadcast, key, json.dumps(message), message)
+
+    def broadcast(self, key, text, message):
+        """Push a tick to every client that is interested in the instrument (runs on the event loop)."""
+        frame = None
+        for websocket in self.interest.get(key, ()):
+            queue = self.clients.get(websocket)
+            if queue is None:
+                continue
+            if self.formats.get(websocket) == FORMAT_BINARY:
+                # Encode at most once per tick, however many binary clients there are
+                if frame is None:
+                    frame = encode_touchline(message)
+                queue.put_tick(key, frame)
+            else:
+                queue.put_tick(key, text)
+
+    def on_depth_changed(self, key, book, changes):
+        """Hand the changed levels of a book to the event loop, if any client follows its depth."""
+        if self.subscriptions is not None and key + (1502,) in self.subscriptions.refs:
+            self.loop.call_soon_threadsafe(self.broadcast_depth, key, changes)
+
+    def broadcast_depth(self, key, changes):
+        """Push changed depth levels to the clients holding the instrument on 1502 (runs on the event loop)."""
+        levels = {(side, level): (price, size, orders) for side, level, price, size, orders in changes}
+        for websocket in self.subscriptions.refs.get(key + (1502,), ()):
+            queue = self.clients.get(websocket)
+            if queue is not None:
+                queue.put_merged(("depth",) + key, levels, render_depth_delta)
+
+    def add_client(self, websocket):
+        """Register a downstream client and return its outgoing buffer."""
+        queue = ConflatingQueue(self.max_flush_rate)
+        self.clients[websocket] = queue
+        return queue
+
+    def remove_client(self, websocket):
+        """Forget a downstream client, release its subscriptions and drop its instrument interest."""
+        self.clients.pop(websocket, None)
+        self.formats.pop(websocket, None)
+        self.subscriptions.release(websocket)
+        for key in list(self.interest):
+            if websocket not in self.interest[key]:
+                continue
+            self.interest[key].discard(websocket)
+            if not self.interest[key]:
+                del self.interest[key]
+            if not self.subscriptions.holders(*key):
+                self.forget(*key)
+
+    def add_interest(self, websocket, exchange_segment, exchange_instrument_id):
+        """Route ticks for an instrument to the given client."""
+        self.interest.setdefault((exchange_segment, exchange_instrument_id), set()).add(websocket)
+
+    def remove_interest(self, websocket, exchange_segment, exchange_instrument_id):
+        """Stop routing ticks for an instrument to the given client."""
+        key = (exchange_segment, exchange_instrument_id)
+        if key in self.interest:
+            self.interest[key].discard(websocket)
+            if not self.interest[key]:
+                del self.interest[key]
+
+    async def subscribe(self, websocket, exchange_segment, exchange_instrument_id, xts_message_code, queue):
+        """Hold an instrument for a client and queue the confirmation once its batch has been sent."""
+        instruments = [{'exchangeSegment': exchange_segment, 'exchangeInstrumentID': exchange_instrument_id}]
+        try:
+            self.add_interest(websocket, exchange_segment, exchange_instrument_id)
+            subscription_response = await self.subscriptions.subscribe(
+                websocket, exchange_segment, exchange_instrument_id, xts_message_code)
+
+            # The full quotes of the response are the base the partial broadcasts are applied to
+            self.partial_decoder.seed_quotes(subscription_response)
+
+            # Load the session's earlier bars once per instrument, off the event loop
+            key = (exchange_segment, exchange_instrument_id)
+            if self.seed_executor is not None and key not in self.seeding \
+                    and not self.candles.is_seeded(exchange_segment, exchange_instrument_id):
+                self.seeding.add(key)
+                seeding = self.loop.run_in_executor(self.seed_executor, self.candles.seed, self.xt_market,
+                                                    exchange_segment, exchange_instrument_id)
+                # A failed seed is tried again by the next subscription
+                seeding.add_done_callback(lambda _: self.seeding.discard(key))
+
+            # Prepare the response as JSON
+            response_data = {
+                'status': 'subscribed',
+                'instruments': instruments,
+                'subscription_response': subscription_response
+            }
+        except Exception as e:
+            response_data = {'status': 'error', 'instruments': instruments, 'message': f"Subscription failed: {e}"}
+        queue.put_control(json.dumps(response_data))
+
+    def unsubscribe(self, websocket, exchange_segment, exchange_instrument_id, xts_message_code):
+        """Release a client's hold on an instrument."""
+        self.subscriptions.unsubscribe(websocket, exchange_segment, exchange_instrument_id, xts_message_code)
+        holders = self.subscriptions.holders(exchange_segment, exchange_instrument_id)
+        if websocket not in holders:
+            self.remove_interest(websocket, exchange_segment, exchange_instrument_id)
+        if not holders:
+            self.forget(exchange_segment, exchange_instrument_id)
+
+    def forget(self, exchange_segment, exchange_instrument_id):
+        """Release the state kept for an instrument that no client holds any more."""
+        self.partial_decoder.forget(exchange_segment, exchange_instrument_id)
+        self.order_books.forget(exchange_segment, exchange_instrument_id)
+        if self.tick_store is not None:
+            self.tick_store.drop(exchange_segment, exchange_instrument_id)
+
+    def stats(self):
+        """Return the buffer counters of every connected client."""
+        return [queue.stats() for queue in self.clients.values()]
+
+
+def start_test(xt_market, market_user_id, market_data_token, max_flush_rate=20, seed_candles=False, hub=None):
+    # One upstream market data connection shared by every WebSocket client; a caller that passes its own
+    # hub can read the ticks, bars and books it keeps from other threads
+    hub = hub or MarketDataHub(xt_market, market_user_id, market_data_token, max_flush_rate, seed_candles)
+
     # Async function to continuously send messages to WebSocket clients
     async def send_message(websocket, queue):
         while True:
-            # Fetch the next message from the queue
-            message = await queue.get()
+            # Fetch everything that is pending, at most max_flush_rate times per second
+            batch = await queue.get_batch()
 
             try:
-                # Send the message to the WebSocket client
-                await websocket.send(message)
+                # Send the messages to the WebSocket client
+                for message in batch:
+                    await websocket.send(message)
             except websockets.ConnectionClosed:
                 print("Connection closed, unable to send message")
                 break
@@ -29,66 +334,86 @@ def start_test(xt_market, market_user_id, market_data_token):
     async def process_message(websocket, message, queue):
         try:
             data = json.loads(message)
-            if data.get('action') == 'subscribe':
+            if data.get('action') in ('subscribe', 'unsubscribe'):
                 # Extract the exchangeSegment and exchangeInstrumentID from the message
                 exchange_segment = int(data.get('exchangeSegment'))
                 exchange_instrument_id = int(data.get('exchangeInstrumentID'))
+                xts_message_code = int(data.get('xtsMessageCode', 1502))
 
-                # Subscribe to the instrument
-                instruments = [{'exchangeSegment': exchange_segment, 'exchangeInstrumentID': exchange_instrument_id}]
-                print(f"Subscribing to: {instruments}")
-
-                subscription_response = xt_market.send_subscription(instruments, 1502)
-
-                # Prepare the response as JSON
-                response_data = {
-                    'status': 'subscribed',
-                    'instruments': instruments,
-                    'subscription_response': subscription_response
-                }
-
-                # Send confirmation back to the WebSocket client as JSON
-                await queue.put(json.dumps(response_data))
+                if data['action'] == 'subscribe':
+                    # Confirm asynchronously so that the next requests can join the same batch
+                    task = asyncio.create_task(hub.subscribe(
+                        websocket, exchange_segment, exchange_instrument_id, xts_message_code, queue))
+                    hub.tasks.add(task)
+                    task.add_done_callback(hub.tasks.discard)
+                else:
+                    hub.unsubscribe(websocket, exchange_segment, exchange_instrument_id, xts_message_code)
+                    queue.put_control(json.dumps({
+                        'status': 'unsubscribed',
+                        'instruments': [{'exchangeSegment': exchange_segment,
+                                         'exchangeInstrumentID': exchange_instrument_id}]
+                    }))
+            elif data.get('action') == 'format':
+                # Negotiate the tick framing for this client
+                wire_format = data.get('format', FORMAT_JSON)
+                if wire_format not in (FORMAT_JSON, FORMAT_BINARY):
+                    raise ValueError(f"Unsupported format: {wire_format}")
+                hub.formats[websocket] = wire_format
+                queue.put_control(json.dumps({'status': 'format', 'format': wire_format}))
+            elif data.get('action') == 'depth':
+                # Current ladder and derived figures of one instrument, copied while the socket thread waits
+                queue.put_control(json.dumps({
+                    'status': 'depth',
+                    'exchangeSegment': int(data.get('exchangeSegment')),
+                    'exchangeInstrumentID': int(data.get('exchangeInstrumentID')),
+                    'depth': hub.order_books.snapshot(int(data.get('exchangeSegment')),
+                                                      int(data.get('exchangeInstrumentID')),
+                                                      int(data.get('levels', 5)))
+                }))
+            elif data.get('action') == 'candles':
+                # Bars of one instrument and interval (seconds), oldest first, the last one still forming
+                interval = int(data.get('interval', 60))
+                if interval not in hub.candles.intervals:
+                    raise ValueError(f"Unsupported interval: {interval}, use one of {hub.candles.intervals}")
+                bars = hub.candles.bars(int(data.get('exchangeSegment')), int(data.get('exchangeInstrumentID')),
+                                        interval)
+                count = int(data.get('count', len(bars)))
+                queue.put_control(json.dumps({
+                    'status': 'candles',
+                    'exchangeSegment': int(data.get('exchangeSegment')),
+                    'exchangeInstrumentID': int(data.get('exchangeInstrumentID')),
+                    'interval': interval,
+                    'bars': [bar.as_dict() for bar in bars[len(bars) - min(count, len(bars)):]]
+                }))
+            elif data.get('action') == 'ticks':
+                # Recent tick history of one instrument, as one list per column, oldest first
+                if hub.tick_store is None:
+                    raise ValueError("Tick history is not kept (tick_capacity is 0)")
+                count = data.get('count')
+                queue.put_control(json.dumps({
+                    'status': 'ticks',
+                    'exchangeSegment': int(data.get('exchangeSegment')),
+                    'exchangeInstrumentID': int(data.get('exchangeInstrumentID')),
+                    'ticks': hub.tick_store.history(int(data.get('exchangeSegment')),
+                                                    int(data.get('exchangeInstrumentID')),
+                                                    int(count) if count is not None else None)
+                }))
+            elif data.get('action') == 'stats':
+                # Report this client's dropped and coalesced update counters
+                queue.put_control(json.dumps({'status': 'stats', 'stats': queue.stats()}))
             else:
-                await queue.put(json.dumps({"status": "error", "message": "Invalid action specified"}))
+                queue.put_control(json.dumps({"status": "error", "message": "Invalid action specified"}))
         except Exception as e:
-            await queue.put(json.dumps({"status": "error", "message": f"Error processing message: {str(e)}"}))
-
-    # Function to handle socket communication and event callbacks
-    def handle_socket(queue, websocket, loop):
-        """Handles market data socket events and forwards messages to the WebSocket."""
-        
-        # Callback for receiving 1501 Touchline full data
-        def on_message1502_json_full(data):
-            # Send the received data to the WebSocket queue
-            asyncio.run_coroutine_threadsafe(queue.put(f"{data}"), loop)
-
-        # Assign callbacks for the socket events
-        market_data_socket.on_connect = on_connect
-        market_data_socket.on_message1502_json_full = on_message1502_json_full
-
-        # Event listener setup
-        event_listener = market_data_socket.get_emitter()
-        event_listener.on('connect', on_connect)
-        event_listener.on('1502-json-full', on_message1502_json_full)
-
-        # Connect to the market data socket (this blocks the thread)
-        market_data_socket.connect()
+            queue.put_control(json.dumps({"status": "error", "message": f"Error processing message: {str(e)}"}))
 
     # Main function to handle WebSocket communication and socket integration
     async def main(websocket, path):
-        # Create an asyncio queue to store messages from the market data socket
-        queue = asyncio.Queue()
-
-        # Get the current event loop
-        loop = asyncio.get_event_loop()
+        # Register the client with the shared hub and get its outgoing queue
+        queue = hub.add_client(websocket)
 
         # Notify the WebSocket client about the connection
         await websocket.send("WebSocket server connected. You can now send subscription requests.")
 
-        # Run the market data socket handler in a separate thread/executor
-        loop.run_in_executor(None, handle_socket, queue, websocket, loop)
-
         # Run the WebSocket message sender concurrently
         send_task = asyncio.create_task(send_message(websocket, queue))
 
@@ -98,13 +423,18 @@ def start_test(xt_market, market_user_id, market_data_token):
                 await process_message(websocket, message, queue)
         except websockets.ConnectionClosed:
             print("WebSocket connection closed")
+        finally:
+            hub.remove_client(websocket)
 
-        # Wait for the send_message task to finish
-        await send_task
+        # The sender has nothing left to deliver once the client is gone
+        send_task.cancel()
 
     # Function to start the WebSocket server
     async def start_server():
-        # Start a WebSocket server on localhost:8765
+        # Start the shared upstream socket before accepting clients
+        hub.start(asyncio.get_running_loop())
+
+        # Start a WebSocket server on localhost:8766
         async with websockets.serve(main, "localhost", 8766):
             await asyncio.Future()  # Keep the server running indefinitely
 
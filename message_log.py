@@ -0,0 +1,342 @@
+"""
+    message_log.py
+
+    Append-only log of the messages shown in the main window.
+
+    Records are written as one JSON object per line ({"timestamp": ..., "message": ...}) by a background
+    thread, so logging a message never blocks the GUI. Files are named <prefix>-YYYYMMDD-NNN.ndjson and
+    roll over when the day changes or a file reaches `max_bytes`. Old days are pruned by deleting whole
+    files, never by rewriting one.
+
+    Every log file has a sidecar .idx file with one fixed-size entry per record: the byte offset of the
+    line, its time as epoch seconds and its message type. `LogReader` loads only these entries, filters
+    them by type and time range, and reads a record from disk when it is actually displayed.
+"""
+import bisect
+import json
+import os
+import queue
+import re
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Message types, in index code order
+MESSAGE_TYPES = ("other", "order", "trade", "position", "connect")
+
+# Index entry: record offset, epoch seconds, message type code
+_INDEX_ENTRY = struct.Struct('<QIB')
+
+
+def classify_message(message):
+    """Return the type of a log message, one of MESSAGE_TYPES."""
+    text = str(message)
+    if text.startswith("Order"):
+        return "order"
+    if text.startswith("Trade"):
+        return "trade"
+    if text.startswith("Position"):
+        return "position"
+    lowered = text[:80].lower()
+    if "connect" in lowered or "joined" in lowered or "closed" in lowered:
+        return "connect"
+    return "other"
+
+
+def _index_entry(offset, timestamp, message, previous):
+    """Return an index entry and its time; a record whose timestamp cannot be read gets the `previous` time."""
+    try:
+        seconds = int(datetime.strptime(timestamp, TIMESTAMP_FORMAT).timestamp())
+    except (TypeError, ValueError):
+        seconds = previous  # Keeps the times in order for bisect
+    return _INDEX_ENTRY.pack(offset, seconds, MESSAGE_TYPES.index(classify_message(message))), seconds
+
+
+def index_path(log_path):
+    """Return the path of the index file of a log file."""
+    return log_path[:-len(".ndjson")] + ".idx"
+
+
+def build_index(log_path):
+    """Write the index file of a log file that has none, scanning its records once."""
+    with open(log_path, "rb") as log_file, open(index_path(log_path), "wb") as index_file:
+        offset = 0
+        seconds = 0
+        for line in log_file:
+            if not line.endswith(b"\n"):
+                break  # Partly written last line
+            try:
+                record = json.loads(line)
+                entry, seconds = _index_entry(offset, record.get("timestamp"), record.get("message"), seconds)
+                index_file.write(entry)
+            except ValueError:
+                pass
+            offset += len(line)
+
+
+class MessageLog:
+    def __init__(self, directory="logs", prefix="websocket_log", max_bytes=16 * 1024 * 1024, retention_days=1):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.retention_days = retention_days
+        self._file_pattern = re.compile(re.escape(prefix) + r"-(\d{8})-(\d{3})\.ndjson$")
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._queue = queue.Queue()
+        self._file = None
+        self._index_file = None
+        self._day = None
+        self._sequence = 0
+        self._last_seconds = 0  # Time of the last record indexed
+
+        self._thread = threading.Thread(target=self._run, name="message-log", daemon=True)
+        self._thread.start()
+
+    def write(self, timestamp, message):
+        """Queue a record for the writer thread. Safe to call from any thread."""
+        self._queue.put((timestamp, message))
+
+    def close(self):
+        """Write out queued records and stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def files(self):
+        """Return the existing log files, oldest first."""
+        names = [name for name in os.listdir(self.directory) if self._file_pattern.match(name)]
+        return [os.path.join(self.directory, name) for name in sorted(names)]
+
+    def iter_entries(self):
+        """Yield the logged records oldest first, reading one line at a time."""
+        for path in self.files():
+            try:
+                with open(path, "r", encoding="utf-8") as log_file:
+                    for line in log_file:
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            continue  # Partly written last line
+            except OSError as e:
+                print(f"Error reading log file {path}: {e}")
+
+    # Writer thread
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            stop = record is None
+            lines = [] if stop else [record]
+
+            # Drain whatever else is queued so a burst costs one write and one flush
+            while not stop:
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                else:
+                    lines.append(record)
+
+            if lines:
+                try:
+                    self._write(lines)
+                except OSError as e:
+                    print(f"Error saving message to log: {e}")
+
+            if stop:
+                self._close_files()
+                return
+
+    def _write(self, records):
+        log_file = self._current_file()
+        entries = bytearray()
+        for timestamp, message in records:
+            line = (json.dumps({"timestamp": timestamp, "message": message}) + "\n").encode("utf-8")
+            entry, self._last_seconds = _index_entry(log_file.tell(), timestamp, message, self._last_seconds)
+            entries += entry
+            log_file.write(line)
+            if log_file.tell() >= self.max_bytes:
+                self._flush(entries)
+                entries = bytearray()
+                self._sequence += 1
+                log_file = self._open(self._day, self._sequence)
+        self._flush(entries)
+
+    def _flush(self, entries):
+        # Index entries only once their records are written out, so an entry never points past the end of
+        # its log file
+        self._file.flush()
+        self._index_file.write(entries)
+        self._index_file.flush()
+
+    def _current_file(self):
+        day = datetime.now().strftime("%Y%m%d")
+        if self._file is None or day != self._day:
+            # Continue the newest file of the day after a restart
+            sequences = [int(match.group(2)) for match in map(self._file_pattern.match, os.listdir(self.directory))
+                         if match and match.group(1) == day]
+            self._sequence = max(sequences) if sequences else 0
+            self._open(day, self._sequence)
+            self._prune()
+        return self._file
+
+    def _open(self, day, sequence):
+        self._close_files()
+        self._day = day
+        path = os.path.join(self.directory, f"{self.prefix}-{day}-{sequence:03d}.ndjson")
+        if os.path.exists(path) and not os.path.exists(index_path(path)):
+            build_index(path)
+        self._file = open(path, "ab")
+        self._index_file = open(index_path(path), "ab")
+        return self._file
+
+    def _close_files(self):
+        if self._file:
+            self._file.close()
+            self._index_file.close()
+            self._file = self._index_file = None
+
+    def _prune(self):
+        """Delete the files of days older than the retention period."""
+        oldest = (datetime.now() - timedelta(days=self.retention_days)).strftime("%Y%m%d")
+        for path in self.files():
+            match = self._file_pattern.match(os.path.basename(path))
+            if match.group(1) < oldest:
+                for stale in (path, index_path(path)):
+                    try:
+                        if os.path.exists(stale):
+                            os.remove(stale)
+                    except OSError as e:
+                        print(f"Error removing old log file {stale}: {e}")
+
+
+class LogReader:
+    """
+    Random access to the records of a MessageLog through its index files.
+
+    Entries are numbered in log order. Only the compact index is held in memory; records are read
+    from disk on demand and the most recent ones are kept in a small cache.
+    """
+
+    def __init__(self, message_log, cache_size=2048):
+        self.message_log = message_log
+        self.cache_size = cache_size
+        self._reset()
+
+    def _reset(self):
+        self.paths = []
+        self.file_numbers = array('H')
+        self.offsets = array('Q')
+        self.times = array('I')
+        self.types = array('B')
+        self._index_read = {}  # path -> bytes of its index already loaded
+        self._cache = OrderedDict()
+        self._handles = {}
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def refresh(self):
+        """
+        Load index entries written since the last call.
+
+        Returns the number of the first new entry, or 0 when the whole index was reloaded
+        (for example after old files were pruned).
+        """
+        paths = self.message_log.files()
+        if any(path not in paths for path in self.paths):
+            self.close()
+            self._reset()
+
+        first_new = len(self.offsets)
+        for path in paths:
+            idx = index_path(path)
+            if path not in self._index_read:
+                if not os.path.exists(idx):
+                    try:
+                        build_index(path)
+                    except OSError as e:
+                        print(f"Error indexing log file {path}: {e}")
+                        continue
+                self.paths.append(path)
+                self._index_read[path] = 0
+
+            try:
+                with open(idx, "rb") as index_file:
+                    index_file.seek(self._index_read[path])
+                    data = index_file.read()
+            except OSError as e:
+                print(f"Error reading log index {idx}: {e}")
+                continue
+
+            whole = len(data) - len(data) % _INDEX_ENTRY.size
+            file_number = self.paths.index(path)
+            for offset, seconds, type_code in _INDEX_ENTRY.iter_unpack(data[:whole]):
+                if seconds == 0 and self.times:
+                    seconds = self.times[-1]  # Unreadable timestamp in an older index file
+                self.file_numbers.append(file_number)
+                self.offsets.append(offset)
+                self.times.append(seconds)
+                self.types.append(type_code)
+            self._index_read[path] += whole
+        return first_new
+
+    def query(self, types=None, start=None, end=None, first=0):
+        """
+        Return the numbers of the entries from `first` on that match the filters.
+
+        `types` is a collection of MESSAGE_TYPES names (None for all); `start` and `end` are
+        datetimes bounding the record time (None for open ends).
+        """
+        low, high = first, len(self.times)
+
+        # Records are appended in time order, so the time range is a slice of the index
+        if start is not None:
+            low = max(low, bisect.bisect_left(self.times, int(start.timestamp()), low, high))
+        if end is not None:
+            high = bisect.bisect_right(self.times, int(end.timestamp()), low, high)
+
+        if not types:
+            return array('I', range(low, high))
+        codes = {MESSAGE_TYPES.index(name) for name in types}
+        type_codes = self.types
+        return array('I', (entry for entry in range(low, high) if type_codes[entry] in codes))
+
+    def entry_type(self, entry):
+        """Return the message type of an entry without reading its record."""
+        return MESSAGE_TYPES[self.types[entry]]
+
+    def read(self, entry):
+        """Return the record of an entry as a dict."""
+        record = self._cache.get(entry)
+        if record is not None:
+            self._cache.move_to_end(entry)
+            return record
+
+        path = self.paths[self.file_numbers[entry]]
+        try:
+            handle = self._handles.get(path)
+            if handle is None:
+                handle = self._handles[path] = open(path, "rb")
+            handle.seek(self.offsets[entry])
+            record = json.loads(handle.readline())
+        except (OSError, ValueError) as e:
+            return {"timestamp": "", "message": f"Unreadable log record: {e}"}  # Not cached, read again next time
+
+        self._cache[entry] = record
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return record
+
+    def close(self):
+        """Close the open log files."""
+        for handle in self._handles.values():
+            handle.close()
+        self._handles = {}
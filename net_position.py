@@ -2,6 +2,7 @@ import json
 import requests
 from PyQt5.QtWidgets import QDialog, QVBoxLayout, QTableWidget, QTableWidgetItem, QMessageBox, QComboBox
 from shared_resources import subscribed_instruments  # Import the shared set
+from table_model import set_cell_text  # Reuses cell items on tick updates
 
 
 class NetPositionDialog(QDialog):
@@ -57,9 +58,21 @@ class NetPositionDialog(QDialog):
         self.total_realized_mtm = 0.0
         self.total_net_amount = 0.0
 
+        # (segment code, ExchangeInstrumentId) -> table rows holding that instrument, and the last MTM of each row
+        self.position_rows = {}
+        self.row_mtm = {}
+
+        # Stop receiving ticks once the dialog is closed or dismissed
+        self.finished.connect(self.release_instruments)
+
         # Load default data (Net Position)
         self.load_positions("Net Position")
 
+    def release_instruments(self):
+        """Unregister this dialog's tick callbacks; instruments no other widget holds are unsubscribed."""
+        self.websocket_client.dispatcher.unregister_all(self.update_ltp_column)
+        self.position_rows.clear()
+
     def load_positions(self, position_type):
         """Load net or day position data based on selection and display in the table."""
         url = "http://127.0.0.1:5000/net_position" if position_type == "Net Position" else "http://127.0.0.1:5000/day_position"
@@ -76,6 +89,11 @@ class NetPositionDialog(QDialog):
             self.total_realized_mtm = 0.0
             self.total_net_amount = 0.0
 
+            # Forget the rows of the previous load
+            self.position_rows.clear()
+            self.row_mtm.clear()
+            self.websocket_client.dispatcher.unregister_all(self.update_ltp_column)
+
             if "positionList" in data:
                 position_list = data["positionList"]
                 self.table_widget.setRowCount(len(position_list) + 1)  # Extra row for totals
@@ -137,15 +155,21 @@ class NetPositionDialog(QDialog):
                     exchange_segment_name = position.get("ExchangeSegment", "")
                     exchange_segment_code = self.EXCHANGE_SEGMENT_MAP.get(exchange_segment_name, "")
                     exchange_instrument_id = position.get("ExchangeInstrumentId", "")
-                    
-                    # Check if instrument is already subscribed
-                    if (exchange_segment_code, exchange_instrument_id) not in subscribed_instruments:
-                        # Add to subscribed set and send subscription request
-                        subscribed_instruments.add((exchange_segment_code, exchange_instrument_id))
-                        print(f"Subscribing to ExchangeSegment: {exchange_segment_name} (Code: {exchange_segment_code}), ExchangeInstrumentID: {exchange_instrument_id}")
-                        self.websocket_client.send_subscription(exchange_segment_code, exchange_instrument_id)
-                    else:
-                        print(f"Already subscribed to ExchangeSegment: {exchange_segment_name} (Code: {exchange_segment_code}), ExchangeInstrumentID: {exchange_instrument_id}")
+
+                    # Route ticks of this instrument to its rows
+                    if exchange_segment_code and str(exchange_instrument_id).isdigit():
+                        key = (int(exchange_segment_code), int(exchange_instrument_id))
+                        self.position_rows.setdefault(key, []).append(row)
+                        self.websocket_client.dispatcher.register(key[0], key[1], self.update_ltp_column)
+
+                        # Check if instrument is already subscribed
+                        if key not in subscribed_instruments:
+                            # Add to subscribed set and send subscription request
+                            subscribed_instruments.add(key)
+                            print(f"Subscribing to ExchangeSegment: {exchange_segment_name} (Code: {exchange_segment_code}), ExchangeInstrumentID: {exchange_instrument_id}")
+                            self.websocket_client.send_subscription(key[0], key[1])
+                        else:
+                            print(f"Already subscribed to ExchangeSegment: {exchange_segment_name} (Code: {exchange_segment_code}), ExchangeInstrumentID: {exchange_instrument_id}")
 
                 # Insert totals in the last row of the table
                 totals_row = len(position_list)
@@ -161,48 +185,32 @@ class NetPositionDialog(QDialog):
         except requests.RequestException as e:
             QMessageBox.critical(self, "Error", f"Error fetching {position_type.lower()} data: {e}")
 
-    def update_ltp_column(self, message):
-        """Process WebSocket messages to update the LTP and MTM columns in the net position table for all matching rows."""
-        try:
-            message_data = json.loads(message)
-            if "Touchline" in message_data and "ExchangeInstrumentID" in message_data:
-                instrument_id = str(message_data["ExchangeInstrumentID"])
-                segment_code = str(message_data["ExchangeSegment"])
-                exchange_segment = self.SEGMENT_MAP.get(segment_code, "Unknown")  # Convert code to NSECM/NSEFO
-
-                # Extract the LTP from the message
-                touchline = message_data["Touchline"]
-                ltp = float(touchline.get("LastTradedPrice", 0.0))
-
-                # Iterate over all rows and update each row that matches the instrument ID and segment
-                row_count = self.table_widget.rowCount()
-                self.total_mtm = 0.0  # Reset total MTM before recalculating
-                for row in range(row_count - 1):  # Exclude the last row (totals row)
-                    item_id = self.table_widget.item(row, 18)  # Assuming column 18 is ExchangeInstrumentId
-                    item_segment = self.table_widget.item(row, 1)  # Assuming column 1 is ExchangeSegment
-                    if item_id and item_segment and item_id.text() == instrument_id and item_segment.text() == exchange_segment:
-                        # Update the LTP in the table
-                        self.table_widget.setItem(row, 11, QTableWidgetItem(f"{ltp:.2f}"))
-
-                        # Calculate MTM based on the quantity and update it in the table
-                        quantity = int(self.table_widget.item(row, 10).text())
-                        buy_avg_price = float(self.table_widget.item(row, 4).text())
-                        sell_avg_price = float(self.table_widget.item(row, 9).text())
-                        realized_mtm = float(self.table_widget.item(row, 13).text())
-
-                        if quantity > 0:
-                            mtm = (ltp - buy_avg_price) * quantity + realized_mtm
-                        else:
-                            mtm = (sell_avg_price - ltp) * abs(quantity) + realized_mtm
-
-                        # Update the MTM column and accumulate total MTM
-                        self.total_mtm += mtm
-                        self.table_widget.setItem(row, 12, QTableWidgetItem(f"{mtm:.2f}"))
-                        print(f"Updated LTP and MTM for {instrument_id} in row {row}: LTP = {ltp}, MTM = {mtm}")
+    def update_ltp_column(self, tick):
+        """Update the LTP and MTM columns of every row holding the ticked instrument."""
+        rows = self.position_rows.get(tick.key)
+        if not rows:
+            return
+        ltp = tick.ltp
+
+        for row in rows:
+            # Update the LTP in the table
+            set_cell_text(self.table_widget, row, 11, f"{ltp:.2f}")
+
+            # Calculate MTM based on the quantity and update it in the table
+            quantity = int(self.table_widget.item(row, 10).text())
+            buy_avg_price = float(self.table_widget.item(row, 4).text())
+            sell_avg_price = float(self.table_widget.item(row, 9).text())
+            realized_mtm = float(self.table_widget.item(row, 13).text())
+
+            if quantity > 0:
+                mtm = (ltp - buy_avg_price) * quantity + realized_mtm
+            else:
+                mtm = (sell_avg_price - ltp) * abs(quantity) + realized_mtm
 
-                # Update the MTM total in the totals row
-                totals_row = row_count - 1
-                self.table_widget.setItem(totals_row, 12, QTableWidgetItem(f"Total: {self.total_mtm:.2f}"))
+            self.row_mtm[row] = mtm
+            set_cell_text(self.table_widget, row, 12, f"{mtm:.2f}")
 
-        except json.JSONDecodeError:
-            print("Error decoding WebSocket message.")
+        # Update the MTM total in the totals row
+        self.total_mtm = sum(self.row_mtm.values())
+        totals_row = self.table_widget.rowCount() - 1
+        set_cell_text(self.table_widget, totals_row, 12, f"Total: {self.total_mtm:.2f}")
@@ -1,9 +1,13 @@
 import sys
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from PyQt5.QtWidgets import QDialog, QLineEdit, QPushButton, QVBoxLayout, QGridLayout, QMessageBox, QComboBox, QLabel, QDoubleSpinBox, QSpinBox, QApplication, QHBoxLayout
 from PyQt5.QtCore import Qt, QThreadPool, QRunnable, pyqtSignal, QObject
 from PyQt5.QtGui import QFont
 
+# /place_orders is served by backend_fastapi (uvicorn, port 8000); single orders go to the Flask server
+BULK_ORDER_URL = 'http://127.0.0.1:8000/place_orders'
+
 
 class OrderSignals(QObject):
     order_summary_signal = pyqtSignal(int, int)
@@ -28,6 +32,47 @@ class OrderPlacementTask(QRunnable):
             self.signals.order_summary_signal.emit(0, 1)  # Failure
 
 
+class BulkOrderPlacementTask(QRunnable):
+    def __init__(self, orders, signals, max_in_flight=8):
+        super().__init__()
+        self.orders = orders
+        self.signals = signals
+        self.max_in_flight = max_in_flight
+
+    def run(self):
+        """Place all orders with one request to the order backend and emit the success and failure counts."""
+        try:
+            try:
+                response = requests.post(BULK_ORDER_URL,
+                                         json={'orders': self.orders, 'max_in_flight': self.max_in_flight})
+            except requests.ConnectionError:
+                # Order backend not running
+                self.place_one_by_one()
+                return
+            if response.status_code in (404, 503):
+                # Order backend without the bulk endpoint or without an interactive session
+                self.place_one_by_one()
+            elif response.status_code == 200:
+                result = response.json()
+                self.signals.order_summary_signal.emit(result.get('succeeded', 0), result.get('failed', 0))
+            else:
+                self.signals.order_summary_signal.emit(0, len(self.orders))  # Failure
+        except Exception:
+            self.signals.order_summary_signal.emit(0, len(self.orders))  # Failure
+
+    def place_one_by_one(self):
+        """Send the orders through /place_order, still up to max_in_flight at a time."""
+        def post(order_data):
+            try:
+                return requests.post('http://127.0.0.1:5000/place_order', json=order_data).status_code == 200
+            except Exception:
+                return False
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            placed = sum(executor.map(post, self.orders))
+        self.signals.order_summary_signal.emit(placed, len(self.orders) - placed)
+
+
 class PlaceOrderApp(QDialog):
     def __init__(self, exchange_instrument_id=None, order_side=None,
                  price_band_high=None, price_band_low=None,
@@ -54,6 +99,7 @@ class PlaceOrderApp(QDialog):
         self.thread_pool = QThreadPool()
         self.success_orders = 0
         self.failed_orders = 0
+        self.expected_orders = 0
 
     def initUI(self):
         self.setWindowTitle('Place Buy/Sell Order')
@@ -291,7 +337,8 @@ class PlaceOrderApp(QDialog):
         self.order_signals = OrderSignals()
         self.order_signals.order_summary_signal.connect(self.update_order_summary)
 
-        # Create and add tasks to the thread pool with adjusted prices
+        # Build every order with its adjusted price, then send them as one basket
+        orders = []
         for i in range(multiplier):
             # Adjust the price based on split price for each order if not StopMarket
             if order_type != 'StopMarket':
@@ -323,8 +370,11 @@ class PlaceOrderApp(QDialog):
                 'orderUniqueIdentifier': f"Rattle-{i+1}"
             }
             print(f"{order_data}")
-            order_task = OrderPlacementTask(order_data, i + 1, self.order_signals)
-            self.thread_pool.start(order_task)
+            orders.append(order_data)
+
+        if orders:
+            self.expected_orders = len(orders)
+            self.thread_pool.start(BulkOrderPlacementTask(orders, self.order_signals))
 
 
     def update_order_summary(self, success, failure):
@@ -332,7 +382,7 @@ class PlaceOrderApp(QDialog):
         self.success_orders += success
         self.failed_orders += failure
 
-        if self.success_orders + self.failed_orders == self.multiplier_input.value():
+        if self.success_orders + self.failed_orders == self.expected_orders:
             QMessageBox.information(self, 'Order Summary', f"Orders placed successfully: {self.success_orders}\nFailed orders: {self.failed_orders}")
             self.close()
 
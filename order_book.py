@@ -0,0 +1,188 @@
+"""
+    order_book.py
+
+    Level 2 order book state per instrument, maintained from 1502 market depth messages.
+
+    Each DepthBook holds its bid and ask ladders in fixed arrays (price, size, orders per level) together
+    with running cumulative sizes, so best bid/ask, mid, spread, depth summed over the first N levels and
+    book imbalance are all read in constant time. Applying a message compares it level by level with the
+    held book and reports only the levels that changed; OrderBookEngine passes those changes to its
+    listeners, so consumers redraw what moved instead of re-reading the whole payload.
+
+        books = OrderBookEngine()
+        books.add_listener(lambda key, book, changes: ...)  # changes: [(side, level, price, size, orders)]
+        books.update(message)  # a decoded 1502 message (1501 updates the top level only)
+        book = books.book(2, 35003)
+        book.best_bid, book.spread, book.depth(BID, 5), book.imbalance(5)
+        books.snapshot(2, 35003)  # a consistent copy, from a thread other than the one calling update
+
+    MarketDataHub listens to its engine and relays the changed levels as depth-delta messages.
+"""
+import threading
+from array import array
+
+BID = 0
+ASK = 1
+
+# Levels carried by XTS 1502 depth messages
+LEVELS = 5
+
+
+class DepthBook:
+    """Bid and ask ladders of one instrument."""
+
+    __slots__ = ("levels", "prices", "sizes", "orders", "cumulative", "updates", "has_depth")
+
+    def __init__(self, levels=LEVELS):
+        self.levels = levels
+        # Indexed [side][level]; cumulative[side][n] is the size of the first n levels
+        self.prices = (array('d', bytes(8 * levels)), array('d', bytes(8 * levels)))
+        self.sizes = (array('q', bytes(8 * levels)), array('q', bytes(8 * levels)))
+        self.orders = (array('i', bytes(4 * levels)), array('i', bytes(4 * levels)))
+        self.cumulative = (array('q', bytes(8 * (levels + 1))), array('q', bytes(8 * (levels + 1))))
+        self.updates = 0
+        self.has_depth = False  # Set once a full 1502 ladder has been applied
+
+    @property
+    def best_bid(self):
+        return self.prices[BID][0]
+
+    @property
+    def best_ask(self):
+        return self.prices[ASK][0]
+
+    @property
+    def mid(self):
+        bid, ask = self.prices[BID][0], self.prices[ASK][0]
+        if bid and ask:
+            return (bid + ask) / 2
+        return bid or ask
+
+    @property
+    def spread(self):
+        bid, ask = self.prices[BID][0], self.prices[ASK][0]
+        return ask - bid if bid and ask else 0.0
+
+    def depth(self, side, n=LEVELS):
+        """Return the total size of the first `n` levels of a side."""
+        return self.cumulative[side][min(n, self.levels)]
+
+    def imbalance(self, n=LEVELS):
+        """Return (bid size - ask size) / (bid size + ask size) over the first `n` levels, from -1 to 1."""
+        bids, asks = self.depth(BID, n), self.depth(ASK, n)
+        return (bids - asks) / (bids + asks) if bids + asks else 0.0
+
+    def ladder(self, side, n=LEVELS):
+        """Return [(price, size, orders), ...] of the first `n` levels of a side."""
+        prices, sizes, orders = self.prices[side], self.sizes[side], self.orders[side]
+        return [(prices[level], sizes[level], orders[level]) for level in range(min(n, self.levels))]
+
+    def apply(self, side, entries):
+        """
+        Set the levels of a side from XTS depth entries (dicts with Price, Size and TotalOrders, best
+        first); levels missing from `entries` are cleared. Returns the changed levels as
+        [(side, level, price, size, orders), ...].
+        """
+        prices, sizes, orders = self.prices[side], self.sizes[side], self.orders[side]
+        changes = []
+        first_changed = None
+        for level in range(self.levels):
+            if level < len(entries):
+                entry = entries[level]
+                price = float(entry.get("Price") or 0.0)
+                size = int(entry.get("Size") or 0)
+                count = int(entry.get("TotalOrders") or 0)
+            else:
+                price, size, count = 0.0, 0, 0
+            if prices[level] != price or sizes[level] != size or orders[level] != count:
+                prices[level] = price
+                if sizes[level] != size and first_changed is None:
+                    first_changed = level
+                sizes[level] = size
+                orders[level] = count
+                changes.append((side, level, price, size, count))
+
+        if first_changed is not None:
+            cumulative = self.cumulative[side]
+            for level in range(first_changed, self.levels):
+                cumulative[level + 1] = cumulative[level] + sizes[level]
+        if changes:
+            self.updates += 1
+        return changes
+
+    def snapshot(self, n=LEVELS):
+        """Return the book as a dict, for logging or sending on."""
+        return {
+            "bids": self.ladder(BID, n), "asks": self.ladder(ASK, n), "mid": self.mid, "spread": self.spread,
+            "bid_depth": self.depth(BID, n), "ask_depth": self.depth(ASK, n), "imbalance": self.imbalance(n),
+        }
+
+
+class OrderBookEngine:
+    """DepthBooks of every instrument with market depth, fed from decoded 1501/1502 messages."""
+
+    def __init__(self, levels=LEVELS):
+        self.levels = levels
+        self.books = {}
+        self.listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener):
+        """Call `listener(key, book, changes)` whenever levels of a book change."""
+        self.listeners.append(listener)
+
+    def book(self, exchange_segment, exchange_instrument_id):
+        """Return the DepthBook of an instrument, or None if it has not had depth yet."""
+        return self.books.get((int(exchange_segment), int(exchange_instrument_id)))
+
+    def snapshot(self, exchange_segment, exchange_instrument_id, n=LEVELS):
+        """Return DepthBook.snapshot of an instrument taken under the lock, or None if it has no book."""
+        with self._lock:
+            book = self.books.get((int(exchange_segment), int(exchange_instrument_id)))
+            return book.snapshot(n) if book is not None else None
+
+    def update(self, message):
+        """Apply a decoded depth message; returns the changed levels."""
+        try:
+            key = (int(message["ExchangeSegment"]), int(message["ExchangeInstrumentID"]))
+            bids = message.get("Bids")
+            asks = message.get("Asks")
+            if bids is None or asks is None:
+                # Touchline only: the best level, leaving the rest of the ladder as it was
+                touchline = message["Touchline"]
+                bids = [touchline.get("BidInfo") or {}]
+                asks = [touchline.get("AskInfo") or {}]
+                top_only = True
+            else:
+                top_only = False
+        except (KeyError, TypeError, ValueError):
+            return []
+
+        with self._lock:
+            book = self.books.get(key)
+            if book is None:
+                book = self.books[key] = DepthBook(self.levels)
+            if top_only:
+                if book.has_depth:
+                    return []  # The 1502 ladder of the same instrument is more complete
+                bids = bids + [{"Price": price, "Size": size, "TotalOrders": orders}
+                               for price, size, orders in book.ladder(BID)[1:]]
+                asks = asks + [{"Price": price, "Size": size, "TotalOrders": orders}
+                               for price, size, orders in book.ladder(ASK)[1:]]
+            try:
+                changes = book.apply(BID, bids) + book.apply(ASK, asks)
+            except (AttributeError, TypeError, ValueError):
+                return []
+            book.has_depth = book.has_depth or not top_only
+
+        if changes:
+            for listener in self.listeners:
+                listener(key, book, changes)
+        return changes
+
+    def forget(self, exchange_segment, exchange_instrument_id):
+        with self._lock:
+            self.books.pop((int(exchange_segment), int(exchange_instrument_id)), None)
+
+    def stats(self):
+        return {'books': len(self.books), 'updates': sum(book.updates for book in self.books.values())}
@@ -1,7 +1,7 @@
 import asyncio
+import os
 import websockets
 import json
-from Connect import XTSConnect
 from InteractiveSocketClient import OrderSocket_io
 
 # Path to the JSON file where credentials are saved
@@ -14,6 +14,21 @@ def load_credentials():
         return json.load(f)
 
 
+def update_credentials(fields):
+    """Merge `fields` into the JSON file, replacing it in one step so readers never see half of it."""
+    try:
+        credentials = load_credentials()
+    except (IOError, ValueError):
+        credentials = {}
+    credentials.update(fields)
+    try:
+        with open(CREDENTIALS_FILE + '.tmp', 'w') as f:
+            json.dump(credentials, f, indent=4)
+        os.replace(CREDENTIALS_FILE + '.tmp', CREDENTIALS_FILE)
+    except IOError as e:
+        print(f"Error saving refreshed credentials: {e}")
+
+
 async def send_message(websocket, path, queue):
     # Send a connection confirmation as soon as the WebSocket connection is made
     await websocket.send("WebSocket connection established. Waiting for updates...")
@@ -43,14 +58,21 @@ def handle_socket(queue, websocket, loop):
     credentials = load_credentials()
     order_user_id = credentials['order_user_id']
     order_token = credentials['order_token']
-    source = "WEBAPI"
-
-    # Initialize XTSConnect instance with loaded credentials
-    xt = XTSConnect("", "", source)  # Keys not needed for session reconnect
 
     # Connect to the Interactive socket
     soc = OrderSocket_io(order_token, order_user_id)
 
+    def on_disconnect():
+        # The order backend saves a refreshed token to credentials.json; reconnect with it
+        print('Interactive Socket disconnected!')
+        try:
+            token = load_credentials().get('order_token')
+        except (IOError, ValueError):
+            return
+        if token and token != soc.token:
+            soc.set_token(token)
+            asyncio.run_coroutine_threadsafe(queue.put('Interactive token refreshed'), loop)
+
     # Define the socket callbacks to handle events
     def on_connect():
         # Queue a message via asyncio
@@ -73,6 +95,7 @@ def handle_socket(queue, websocket, loop):
     soc.on_joined = on_joined
     soc.on_order = on_order
     soc.on_trade = on_trade
+    soc.sid.on('disconnect', on_disconnect)
 
     # Event listener for additional events
     el = soc.get_emitter()
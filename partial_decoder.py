@@ -0,0 +1,191 @@
+"""
+    partial_decoder.py
+
+    Turns XTS partial broadcasts (broadcastMode=Partial) back into full messages.
+
+    A partial message only carries the fields that changed since the previous one for the instrument, as
+    comma separated short names, e.g.
+
+        t:1_2885,ltp:2446.1,v:254,bi:0|23|2446.05|6,ai:0|15|2446.15|15
+
+    where `t` is <exchangeSegment>_<exchangeInstrumentID> and `bi`/`ai` are bid/ask depth levels as
+    level|size|price|orders. PartialDecoder keeps the last full message of every instrument and message
+    code, merges each delta into it and returns it in the same shape as the matching `-json-full` event,
+    so everything written against full mode keeps working.
+
+    Snapshots are seeded from full messages (the listQuotes of a subscription response, or any full
+    broadcast) with `seed`; until then the first partials fill in the fields as they arrive.
+"""
+import json
+import threading
+
+# Short partial field name -> full message field name, for the touchline of 1501/1502
+TOUCHLINE_FIELDS = {
+    "ltp": "LastTradedPrice",
+    "ltq": "LastTradedQunatity",
+    "tb": "TotalBuyQuantity",
+    "ts": "TotalSellQuantity",
+    "v": "TotalTradedQuantity",
+    "ap": "AverageTradedPrice",
+    "ltt": "LastTradedTime",
+    "lut": "LastUpdateTime",
+    "pc": "PercentChange",
+    "o": "Open",
+    "h": "High",
+    "l": "Low",
+    "c": "Close",
+    "vp": "TotalValueTraded",
+}
+
+# Short partial field name -> top level field name, for the message codes without a touchline
+TOP_LEVEL_FIELDS = {
+    1505: {"bt": "BarTime", "bv": "BarVolume", "o": "Open", "h": "High", "l": "Low", "c": "Close",
+           "oi": "OpenInterest", "pv": "SumOfQtyInToPrice"},
+    1510: {"oi": "OpenInterest"},
+    1512: {"ltp": "LastTradedPrice", "ltq": "LastTradedQunatity", "lut": "LastUpdateTime"},
+}
+
+PARTIAL_CODES = (1501, 1502, 1505, 1510, 1512)
+
+
+def _number(text):
+    """Parse a partial field value, keeping it as text if it is not a number."""
+    try:
+        return int(text)
+    except ValueError:
+        try:
+            return float(text)
+        except ValueError:
+            return text
+
+
+def _level(value):
+    """Parse a level|size|price|orders depth entry."""
+    level, size, price, orders = value.split("|")[:4]
+    return int(level), {"Size": int(size), "Price": float(price), "TotalOrders": int(orders),
+                        "BuyBackMarketMaker": 0}
+
+
+def parse_partial(data):
+    """Return (exchangeSegment, exchangeInstrumentID, [(name, value), ...]) of a partial message."""
+    key = None
+    fields = []
+    for item in data.split(","):
+        name, _, value = item.partition(":")
+        if name == "t":
+            segment, _, instrument_id = value.partition("_")
+            key = (int(segment), int(instrument_id))
+        elif name in ("bi", "ai"):
+            fields.append((name, _level(value)))
+        elif name:
+            fields.append((name, _number(value)))
+    if key is None:
+        raise ValueError(f"Partial message without an instrument: {data[:80]}")
+    return key[0], key[1], fields
+
+
+class PartialDecoder:
+    """Merges partial broadcasts into per-instrument snapshots; safe to use from the socket thread and others."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+        # (message code, exchangeSegment, exchangeInstrumentID) -> full message
+        self.snapshots = {}
+
+        # Counters
+        self.decoded = 0
+        self.errors = 0
+
+    def seed(self, code, message, replace=True):
+        """
+        Store a full message (dict or JSON text) as the snapshot that the next partials update. With
+        `replace` False an existing snapshot, which may be newer, is kept.
+        """
+        if isinstance(message, (str, bytes)):
+            message = json.loads(message)
+        key = (int(code), int(message["ExchangeSegment"]), int(message["ExchangeInstrumentID"]))
+        with self._lock:
+            if replace or key not in self.snapshots:
+                self.snapshots[key] = message
+            return self.snapshots[key]
+
+    def seed_quotes(self, response):
+        """
+        Seed the instruments that have no snapshot yet from the listQuotes of a send_subscription or
+        get_quote response; returns how many quotes were read.
+        """
+        try:
+            result = response["result"]
+            code = int(result["mdp"])
+            quotes = result["listQuotes"]
+        except (KeyError, TypeError, ValueError):
+            return 0
+        seeded = 0
+        for quote in quotes:
+            try:
+                self.seed(code, quote, replace=False)
+                seeded += 1
+            except (KeyError, TypeError, ValueError):
+                continue
+        return seeded
+
+    def decode(self, code, data):
+        """
+        Merge one partial message into its snapshot and return the full message, or None if it cannot be
+        parsed. The returned dict is the stored snapshot: read it, or copy it before changing it.
+        """
+        try:
+            segment, instrument_id, fields = parse_partial(data)
+        except (ValueError, TypeError):
+            self.errors += 1
+            return None
+
+        key = (code, segment, instrument_id)
+        with self._lock:
+            message = self.snapshots.get(key)
+            if message is None:
+                message = self.snapshots[key] = {"MessageCode": code, "ExchangeSegment": segment,
+                                                 "ExchangeInstrumentID": instrument_id}
+            if code in (1501, 1502):
+                self._merge_touchline(message, code, fields)
+            else:
+                names = TOP_LEVEL_FIELDS.get(code, {})
+                for name, value in fields:
+                    message[names.get(name, name)] = value
+                if "LastUpdateTime" in message:
+                    message["ExchangeTimeStamp"] = message["LastUpdateTime"]
+            self.decoded += 1
+        return message
+
+    @staticmethod
+    def _merge_touchline(message, code, fields):
+        touchline = message.get("Touchline")
+        if touchline is None:
+            touchline = message["Touchline"] = {}
+        for name, value in fields:
+            if name == "bi" or name == "ai":
+                level, entry = value
+                if level == 0:
+                    touchline["BidInfo" if name == "bi" else "AskInfo"] = entry
+                if code == 1502:
+                    side = message.get("Bids" if name == "bi" else "Asks")
+                    if side is None:
+                        side = message["Bids" if name == "bi" else "Asks"] = []
+                    while len(side) <= level:
+                        side.append({"Size": 0, "Price": 0.0, "TotalOrders": 0, "BuyBackMarketMaker": 0})
+                    side[level] = entry
+            else:
+                full_name = TOUCHLINE_FIELDS.get(name, name)
+                touchline[full_name] = value
+                if name == "lut":
+                    message["ExchangeTimeStamp"] = value
+
+    def forget(self, exchange_segment, exchange_instrument_id):
+        """Drop the snapshots of an instrument, e.g. once it is unsubscribed."""
+        with self._lock:
+            for key in [key for key in self.snapshots if key[1:] == (exchange_segment, exchange_instrument_id)]:
+                del self.snapshots[key]
+
+    def stats(self):
+        return {'snapshots': len(self.snapshots), 'decoded': self.decoded, 'errors': self.errors}
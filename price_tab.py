@@ -2,6 +2,7 @@
 import json
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QTableWidget, QTableWidgetItem, QPushButton, QLineEdit, QHeaderView
 from PyQt5.QtCore import pyqtSignal
+from tick_codec import decode_message  # Shared decoder for JSON and binary relay frames
 
 
 class PriceTab(QWidget):
@@ -89,7 +90,7 @@ class PriceTab(QWidget):
     def update_ltp_column(self, message):
         """Process WebSocket messages and update the LTP column and status."""
         try:
-            message_data = json.loads(message)
+            message_data = decode_message(message)
             if "Touchline" in message_data and "ExchangeInstrumentID" in message_data:
                 instrument_id = str(message_data["ExchangeInstrumentID"])
                 segment_code = str(message_data["ExchangeSegment"])
@@ -110,5 +111,5 @@ class PriceTab(QWidget):
                         # Update Status to "Subscribed"
                         self.price_table.setItem(row, 3, QTableWidgetItem("Subscribed"))
                         break
-        except json.JSONDecodeError:
+        except ValueError:
             pass
@@ -8,6 +8,8 @@ from PyQt5.QtGui import QPixmap
 import asyncio
 import json
 from websocket_client_backend import WebSocketClientBackend
+import tick_dispatcher
+from table_model import set_cell_text  # Reuses cell items on tick updates
 import os
 from quant_settings import SettingsWindow
 import requests
@@ -24,6 +26,10 @@ class Table(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.parent = parent
+
+        # (segment code, exchangeInstrumentID) -> rows of that instrument, so LTP updates skip the table scan
+        self.instrument_rows = {}
+
         self.init_ui()
 
     def init_ui(self):
@@ -93,14 +99,12 @@ class Table(QWidget):
         self.table.setItem(row_position, 23, QTableWidgetItem("Active"))
         self.table.setItem(row_position, 24, QTableWidgetItem("0.00"))
         self.table.setItem(row_position, 25, QTableWidgetItem(call_type))
-        
-        
+        segment_code = tick_dispatcher.segment_code(exchange_segment)
+        if segment_code is not None and str(instrument_id).isdigit():
+            self.instrument_rows.setdefault((segment_code, int(instrument_id)), []).append(row_position)
 
-        
-
-        # Emit subscription request
-        segment_code = self.SEGMENT_CODE_MAP.get(exchange_segment, "Unknown")
-        self.subscribe_request.emit(segment_code, instrument_id)
+            # Emit subscription request
+            self.subscribe_request.emit(str(segment_code), str(instrument_id))
 
         # Use the parent's execution mode
         if self.parent.execution_mode == "Manual":
@@ -278,28 +282,12 @@ class Table(QWidget):
 
 
     
-    def update_ltp_column(self, message):
+    def update_ltp_from_tick(self, tick):
         """
-        Process WebSocket messages and update the LTP column for matching rows.
+        Update the LTP column for rows of a tick delivered by the market data dispatcher.
         """
-        try:
-            message_data = json.loads(message)
-            if "Touchline" in message_data and "ExchangeInstrumentID" in message_data:
-                instrument_id = str(message_data["ExchangeInstrumentID"])
-                ltp = message_data["Touchline"].get("LastTradedPrice", "0.0")
-
-                # Update LTP for all rows with the same instrument
-                row_count = self.table.rowCount()
-                for row in range(row_count):
-                    item_id = self.table.item(row, 4)  # Column 4 is ExchangeInstrumentID
-                    if item_id and item_id.text() == instrument_id:
-                        self.table.setItem(row, 11, QTableWidgetItem(str(ltp)))  # Update LTP column
-        except json.JSONDecodeError:
-            if hasattr(self.parent, 'text_area'):
-                self.parent.text_area.append("Error: Failed to parse message for LTP update.")
-        except Exception as e:
-            if hasattr(self.parent, 'text_area'):
-                self.parent.text_area.append(f"Error processing LTP update: {e}")
+        for row in self.instrument_rows.get(tick.key, ()):
+            set_cell_text(self.table, row, 11, str(tick.ltp))  # Update LTP column
 
 
 
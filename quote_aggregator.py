@@ -0,0 +1,180 @@
+"""
+    quote_aggregator.py
+
+    Coalesces get_quote calls from many callers into a few REST requests.
+
+    Every XTSConnect sends its get_quote calls through one of these, usually for a single instrument. Requests
+    that arrive within `window` seconds of each other and share xtsMessageCode and publishFormat are sent
+    as one XTSConnect.fetch_quote call (split into chunks of `max_instruments`), and each caller gets back a
+    response of the usual shape holding only its own instruments. An optional per-instrument cache answers
+    repeated requests within `cache_ttl` seconds without any call; expired entries are dropped as new quotes
+    are written.
+
+        xt = XTSConnect(API_KEY, API_SECRET, source)
+        xt.quote_aggregator = QuoteAggregator(xt, window=0.005, cache_ttl=0.5)
+        response = xt.get_quote([{'exchangeSegment': 2, 'exchangeInstrumentID': 35003}], 1502, 'JSON')
+
+    :copyright:
+    :license: see LICENSE for details.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def _instrument_key(instrument):
+    return int(instrument['exchangeSegment']), int(instrument['exchangeInstrumentID'])
+
+
+def _quote_key(quote):
+    """Return the (segment, instrument id) of a listQuotes entry, or None if it cannot be read."""
+    try:
+        data = json.loads(quote) if isinstance(quote, str) else quote
+        return int(data['ExchangeSegment']), int(data['ExchangeInstrumentID'])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class _Batch:
+    def __init__(self):
+        self.instruments = {}  # key -> instrument dict, in arrival order
+        self.done = threading.Event()
+        self.quotes = {}  # key -> listQuotes entry
+        self.errors = {}  # key -> error response of the chunk that carried it
+        self.response = None  # last successful raw response, for the envelope fields
+
+
+class QuoteAggregator:
+    def __init__(self, xt, window=0.005, cache_ttl=0.0, max_instruments=50):
+        self.xt = xt
+        self.window = window
+        self.cache_ttl = cache_ttl
+        self.max_instruments = max_instruments
+
+        self._lock = threading.Lock()
+        self._batches = {}  # (xtsMessageCode, publishFormat) -> open _Batch
+        self._cache = OrderedDict()  # (xtsMessageCode, publishFormat, segment, id) -> (time, listQuotes entry), oldest first
+
+        # Counters
+        self.requests = 0
+        self.calls = 0
+        self.cache_hits = 0
+
+    def get_quote(self, Instruments, xtsMessageCode, publishFormat):
+        """Same arguments and response shape as XTSConnect.get_quote."""
+        code_key = (xtsMessageCode, publishFormat)
+        keys = [_instrument_key(instrument) for instrument in Instruments]
+        now = time.monotonic()
+
+        with self._lock:
+            self.requests += 1
+            quotes = {}
+            missing = []
+            for key, instrument in zip(keys, Instruments):
+                cached = self._cache.get(code_key + key) if self.cache_ttl else None
+                if cached is not None and now - cached[0] <= self.cache_ttl:
+                    quotes[key] = cached[1]
+                else:
+                    missing.append((key, instrument))
+            if not missing:
+                self.cache_hits += 1
+                return self._response(None, keys, quotes)
+
+            # Join the open batch for this code and format, or open one and lead it
+            batch = self._batches.get(code_key)
+            leader = batch is None
+            if leader:
+                batch = self._batches[code_key] = _Batch()
+            for key, instrument in missing:
+                batch.instruments.setdefault(key, instrument)
+
+        if leader:
+            time.sleep(self.window)
+            with self._lock:
+                del self._batches[code_key]
+            self._send(batch, xtsMessageCode, publishFormat)
+        else:
+            batch.done.wait()
+
+        # A caller only sees an error if one of its own instruments was in a chunk that failed
+        error = None
+        for key, _ in missing:
+            if key in batch.quotes:
+                quotes[key] = batch.quotes[key]
+            elif error is None:
+                error = batch.errors.get(key)
+        if error is not None:
+            return error
+        return self._response(batch.response, keys, quotes)
+
+    def _send(self, batch, xtsMessageCode, publishFormat):
+        """Fetch the quotes of a closed batch and wake its callers."""
+        items = list(batch.instruments.items())
+        try:
+            for start in range(0, len(items), self.max_instruments):
+                chunk = items[start:start + self.max_instruments]
+                try:
+                    response = self.xt.fetch_quote([instrument for _, instrument in chunk], xtsMessageCode,
+                                                   publishFormat)
+                except Exception as e:
+                    response = str(e)
+                with self._lock:
+                    self.calls += 1
+                if not isinstance(response, dict) or response.get('type') != 'success':
+                    for key, _ in chunk:
+                        batch.errors[key] = response
+                    continue
+                batch.response = response
+
+                list_quotes = (response.get('result') or {}).get('listQuotes') or []
+                now = time.monotonic()
+                for position, quote in enumerate(list_quotes):
+                    key = _quote_key(quote)
+                    if key is None and len(list_quotes) == len(chunk):
+                        key = chunk[position][0]  # Entries come back in request order
+                    if key is None:
+                        continue
+                    batch.quotes[key] = quote
+                    if self.cache_ttl:
+                        self._cache_quote((xtsMessageCode, publishFormat) + key, now, quote)
+        finally:
+            batch.done.set()
+
+    def _cache_quote(self, cache_key, now, quote):
+        """Cache a quote and drop the entries that have expired."""
+        with self._lock:
+            self._cache.pop(cache_key, None)
+            self._cache[cache_key] = (now, quote)
+            while self._cache:
+                oldest = next(iter(self._cache.values()))
+                if now - oldest[0] <= self.cache_ttl:
+                    break
+                self._cache.popitem(last=False)
+
+    @staticmethod
+    def _response(raw, keys, quotes):
+        """Build a get_quote style response holding the quotes of one caller from a successful raw response."""
+        envelope = dict(raw) if raw else {'type': 'success', 'code': 's-quotes-0001',
+                                          'description': 'Get quotes successfully!'}
+        result = dict((raw or {}).get('result') or {})
+        found = [key for key in keys if key in quotes]
+        result['listQuotes'] = [quotes[key] for key in found]
+        result['quotesList'] = [{'exchangeSegment': segment, 'exchangeInstrumentID': instrument_id}
+                                for segment, instrument_id in found]
+        envelope['result'] = result
+        return envelope
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        """Return the aggregation counters."""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'calls': self.calls,
+                'cache_hits': self.cache_hits,
+                'requests_per_call': self.requests / self.calls if self.calls else 0.0
+            }
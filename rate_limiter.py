@@ -0,0 +1,215 @@
+"""
+    rate_limiter.py
+
+    Client-side throttle for XTS REST routes.
+
+    Every route key of XTSConnect._routes has its own token bucket, and an optional global bucket caps the
+    total rate of the client. Callers that find no token wait in priority lanes: order entry first, then
+    ordinary calls, then polling and bulk data (books, positions, quotes, master, OHLC). A waiting order is
+    never overtaken by a lower-priority call, so under throttling it is the low-value calls that are
+    delayed instead of orders being rejected by the broker.
+
+    :copyright:
+    :license: see LICENSE for details.
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+
+# Priority lanes, lowest number first
+PRIORITY_ORDER = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_LOW = 2
+
+LANE_NAMES = {PRIORITY_ORDER: "order", PRIORITY_DEFAULT: "default", PRIORITY_LOW: "low"}
+
+ORDER_ROUTES = {
+    "order.place", "order.modify", "order.cancel", "order.cancelall",
+    "bracketorder.place", "bracketorder.modify", "bracketorder.cancel",
+    "order.place.cover", "order.exit.cover",
+    "portfolio.squareoff", "portfolio.positions.convert",
+}
+
+LOW_PRIORITY_ROUTES = {
+    "order.status", "order.dealer.status", "order.history", "trades", "dealer.trades",
+    "portfolio.positions", "portfolio.dealerpositions", "portfolio.holdings", "user.balance",
+    "market.instruments.quotes", "market.instruments.master", "market.instruments.ohlc",
+}
+
+# (requests per second, burst) of a route without an explicit limit
+DEFAULT_ROUTE_LIMIT = (10, 10)
+
+# Routes the broker throttles harder
+DEFAULT_ROUTE_LIMITS = {
+    "market.instruments.master": (1, 1),
+}
+
+# (requests per second, burst) of all routes together; the lanes decide who gets these tokens
+DEFAULT_GLOBAL_LIMIT = (20, 20)
+
+
+def route_priority(route):
+    """Return the priority lane of an XTS route name."""
+    if route in ORDER_ROUTES:
+        return PRIORITY_ORDER
+    if route in LOW_PRIORITY_ROUTES:
+        return PRIORITY_LOW
+    return PRIORITY_DEFAULT
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate` tokens per second, holding at most `burst` tokens."""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Return 0 if a token is available, else the seconds until one is."""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class RateLimiter:
+    """
+    Per-route token buckets with priority lanes, shared by all threads (and event loops) using a client.
+
+    - `route_limits` maps a route key to (requests per second, burst) and overrides DEFAULT_ROUTE_LIMITS.
+    - `global_limit` is the (requests per second, burst) of all routes together, or None for no global cap.
+    """
+
+    def __init__(self, route_limits=None, default_limit=DEFAULT_ROUTE_LIMIT, global_limit=DEFAULT_GLOBAL_LIMIT):
+        self.route_limits = dict(DEFAULT_ROUTE_LIMITS)
+        self.route_limits.update(route_limits or {})
+        self.default_limit = default_limit
+        self.buckets = {}
+        self.global_bucket = TokenBucket(*global_limit) if global_limit else None
+
+        self._condition = threading.Condition()
+        self._waiting = []  # heap of (priority, sequence, route)
+        self._sequence = itertools.count()
+
+        # Queue-wait counters per lane
+        self.lane_counts = {lane: 0 for lane in LANE_NAMES}
+        self.lane_delayed = {lane: 0 for lane in LANE_NAMES}
+        self.lane_wait_total = {lane: 0.0 for lane in LANE_NAMES}
+        self.lane_wait_max = {lane: 0.0 for lane in LANE_NAMES}
+
+    def _bucket(self, route):
+        bucket = self.buckets.get(route)
+        if bucket is None:
+            bucket = self.buckets[route] = TokenBucket(*self.route_limits.get(route, self.default_limit))
+        return bucket
+
+    def _try_take(self, ticket, now):
+        """
+        Grant `ticket` if its buckets have tokens and no waiter with a better lane is ready before it.
+        Returns 0 when granted, else the seconds to wait before trying again. Called with the lock held.
+        """
+        route = ticket[2]
+        wait = self._bucket(route).wait_time(now)
+        if self.global_bucket is not None:
+            wait = max(wait, self.global_bucket.wait_time(now))
+        if wait > 0:
+            return wait
+
+        # A waiter ahead of this one (better lane, or same lane and earlier) that could go now takes
+        # the shared token first: the route token if it is on the same route, else the global one
+        for other in self._waiting:
+            if other < ticket and (other[2] == route or self.global_bucket is not None) \
+                    and self._bucket(other[2]).wait_time(now) == 0:
+                self._condition.notify_all()
+                return 0.001
+
+        self._bucket(route).take()
+        if self.global_bucket is not None:
+            self.global_bucket.take()
+        return 0.0
+
+    def _enter(self, route):
+        ticket = (route_priority(route), next(self._sequence), route)
+        heapq.heappush(self._waiting, ticket)
+        return ticket
+
+    def _leave(self, ticket, waited):
+        self._waiting.remove(ticket)
+        heapq.heapify(self._waiting)
+
+        lane = ticket[0]
+        self.lane_counts[lane] += 1
+        if waited >= 0.001:
+            self.lane_delayed[lane] += 1
+        self.lane_wait_total[lane] += waited
+        self.lane_wait_max[lane] = max(self.lane_wait_max[lane], waited)
+        self._condition.notify_all()
+
+    def _abandon(self, ticket):
+        """Drop the ticket of a caller that stopped waiting (cancelled, timed out or interrupted)."""
+        if ticket in self._waiting:
+            self._waiting.remove(ticket)
+            heapq.heapify(self._waiting)
+            self._condition.notify_all()
+
+    def acquire(self, route):
+        """Block until a request on `route` may be sent. Returns the seconds spent waiting."""
+        started = time.monotonic()
+        with self._condition:
+            ticket = self._enter(route)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._try_take(ticket, now)
+                    if wait == 0:
+                        waited = now - started
+                        self._leave(ticket, waited)
+                        return waited
+                    self._condition.wait(wait)
+            finally:
+                self._abandon(ticket)
+
+    async def acquire_async(self, route):
+        """Like acquire, but waits with asyncio.sleep so the event loop keeps running."""
+        started = time.monotonic()
+        with self._condition:
+            ticket = self._enter(route)
+        try:
+            while True:
+                with self._condition:
+                    now = time.monotonic()
+                    wait = self._try_take(ticket, now)
+                    if wait == 0:
+                        waited = now - started
+                        self._leave(ticket, waited)
+                        return waited
+                await asyncio.sleep(wait)
+        finally:
+            # A waiter left behind would hold back every later caller
+            with self._condition:
+                self._abandon(ticket)
+
+    def stats(self):
+        """Return queue-wait counters per lane and the number of callers waiting now."""
+        with self._condition:
+            lanes = {}
+            for lane, name in LANE_NAMES.items():
+                count = self.lane_counts[lane]
+                lanes[name] = {
+                    'requests': count,
+                    'delayed': self.lane_delayed[lane],
+                    'wait_avg_ms': self.lane_wait_total[lane] / count * 1000 if count else 0.0,
+                    'wait_max_ms': self.lane_wait_max[lane] * 1000
+                }
+            return {'waiting': len(self._waiting), 'lanes': lanes}
@@ -0,0 +1,221 @@
+"""
+    replay_transport.py
+
+    Record and replay transports for the XTS Connect REST wrapper, for repeatable offline benchmarks.
+
+    RecordingTransport sends requests like PooledTransport and appends every exchange (route, method,
+    parameters, status, content type, body and latency) as one JSON line to an append-only file.
+    ReplayTransport answers requests from such a file without any network, sleeping for the recorded
+    latency multiplied by `latency_scale` (1 keeps the original timing, 0 replays as fast as possible).
+
+        xt = XTSConnect(API_KEY, API_SECRET, source, transport=RecordingTransport("xts_session.ndjson"))
+        xt = XTSConnect(API_KEY, API_SECRET, source, transport=ReplayTransport("xts_session.ndjson"))
+
+    Every XTSConnect in a process (the backends included) can also be switched without code changes by
+    setting XTS_RECORD=<file> or XTS_REPLAY=<file>, and optionally XTS_REPLAY_LATENCY_SCALE. AsyncXTSConnect
+    sends through aiohttp instead, but writes to and serves from the same files.
+
+    Replayed requests are matched on method, route and parameters, falling back to the next recording of
+    the same method and route, so runs whose order ids or timestamps differ still replay.
+
+    :copyright:
+    :license: see LICENSE for details.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import Exception as ex
+from transport import PooledTransport
+
+# Parameters never written to a recording
+_SECRET_FIELDS = ("appKey", "secretKey")
+
+# Recording files shared by every RecordingTransport of the process: path -> (file, lock)
+_recordings = {}
+_recordings_lock = threading.Lock()
+
+
+def _open_recording(path):
+    with _recordings_lock:
+        if path not in _recordings:
+            # Unbuffered, so each exchange is a single append write even with several processes recording
+            _recordings[path] = (open(path, "ab", buffering=0), threading.Lock())
+        return _recordings[path]
+
+
+def _canonical_params(params):
+    """Return request parameters as text that is stable across runs."""
+    if params is None:
+        return ""
+    if isinstance(params, (bytes, bytearray)):
+        return bytes(params).decode("utf8")
+    if isinstance(params, dict):
+        params = {key: "***" if key in _SECRET_FIELDS else value for key, value in params.items()}
+        return json.dumps(params, sort_keys=True, default=str)
+    return str(params)
+
+
+class RecordingTransport(PooledTransport):
+    """PooledTransport that also appends every exchange to the NDJSON file at `path`."""
+
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._file, self._file_lock = _open_recording(path)
+
+    def request(self, route, method, url, **kwargs):
+        kwargs.pop("stream", None)  # The body is read here in full to record it
+        started = time.perf_counter()
+        response = super().request(route, method, url, **kwargs)
+        body = response.content
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        params = kwargs.get("data") if kwargs.get("data") is not None else kwargs.get("params")
+        self.record(route, method, params, response.status_code, response.headers.get("content-type", ""), body,
+                    elapsed_ms, response.elapsed.total_seconds() * 1000)
+        return response
+
+    def record(self, route, method, params, status, content_type, body, elapsed_ms, ttfb_ms):
+        """Append one exchange to the recording."""
+        line = json.dumps({
+            "time": time.time(),
+            "route": route,
+            "method": method,
+            "params": _canonical_params(params),
+            "status": status,
+            "content_type": content_type,
+            "body": bytes(body).decode("utf8", errors="replace"),
+            "elapsed_ms": round(elapsed_ms, 3),
+            "ttfb_ms": round(ttfb_ms, 3)
+        }, separators=(",", ":"))
+        with self._file_lock:
+            self._file.write((line + "\n").encode("utf8"))
+
+
+class ReplayTransport:
+    """Transport serving the exchanges recorded by RecordingTransport, with no network."""
+
+    def __init__(self, path, latency_scale=1.0, loop=True, default_timeout=7):
+        self.path = path
+        self.latency_scale = latency_scale
+        self.loop = loop
+        self.session = None
+        self.default_timeout = default_timeout
+        self.timeouts = dict(PooledTransport.DEFAULT_TIMEOUTS)
+
+        self._lock = threading.Lock()
+        self._exact = {}  # (method, route, params) -> deque of recorded exchanges
+        self._by_route = {}  # (method, route) -> deque of recorded exchanges
+        self.load(path)
+
+        # Counters
+        self.requests = 0
+        self.exact_matches = 0
+        self.route_matches = 0
+        self.misses = 0
+
+    def load(self, path):
+        """Add the exchanges recorded in `path`."""
+        with open(path, "r", encoding="utf8") as recording:
+            for line in recording:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    exchange = json.loads(line)
+                except ValueError:
+                    continue  # A line cut short when the recording process stopped
+                self._exact.setdefault((exchange["method"], exchange["route"], exchange["params"]),
+                                       deque()).append(exchange)
+                self._by_route.setdefault((exchange["method"], exchange["route"]), deque()).append(exchange)
+
+    def timeout_for(self, route):
+        return PooledTransport.timeout_for(self, route)
+
+    def _next(self, exchanges):
+        """Take the next recorded exchange of a queue; with `loop`, recordings are reused in order."""
+        while exchanges:
+            exchange = exchanges.popleft()
+            if self.loop:
+                exchanges.append(exchange)
+            elif exchange.get("served"):
+                continue  # Already replayed through the other queue
+            exchange["served"] = True
+            return exchange
+        return None
+
+    def exchange(self, route, method, params):
+        """Return the recorded exchange that answers a request."""
+        with self._lock:
+            self.requests += 1
+            exchange = self._next(self._exact.get((method, route, _canonical_params(params))))
+            if exchange is not None:
+                self.exact_matches += 1
+            else:
+                exchange = self._next(self._by_route.get((method, route)))
+                if exchange is None:
+                    self.misses += 1
+                    raise ex.XTSNetworkException(f"No recorded response for {method} {route}")
+                self.route_matches += 1
+        return exchange
+
+    def request(self, route, method, url, **kwargs):
+        """Return the recorded requests.Response for a request, after the scaled recorded latency."""
+        params = kwargs.get("data") if kwargs.get("data") is not None else kwargs.get("params")
+        exchange = self.exchange(route, method, params)
+        if self.latency_scale:
+            time.sleep(exchange["elapsed_ms"] * self.latency_scale / 1000)
+
+        response = requests.Response()
+        response.status_code = exchange["status"]
+        response.headers = CaseInsensitiveDict({"content-type": exchange["content_type"]})
+        response._content = exchange["body"].encode("utf8")
+        response._content_consumed = True
+        response.url = url
+        response.elapsed = timedelta(milliseconds=exchange.get("ttfb_ms", exchange["elapsed_ms"]) * self.latency_scale)
+        response.connect_timings = (None, None, None)
+        return response
+
+    async def replay_async(self, route, method, params):
+        """Return (status, content type, body, ttfb_ms) of the recorded exchange, awaiting the scaled latency."""
+        exchange = self.exchange(route, method, params)
+        if self.latency_scale:
+            await asyncio.sleep(exchange["elapsed_ms"] * self.latency_scale / 1000)
+        return (exchange["status"], exchange["content_type"], exchange["body"].encode("utf8"),
+                exchange.get("ttfb_ms", exchange["elapsed_ms"]) * self.latency_scale)
+
+    def stats(self):
+        """Return the replay counters."""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'exact_matches': self.exact_matches,
+                'route_matches': self.route_matches,
+                'misses': self.misses
+            }
+
+    def close(self):
+        pass
+
+
+def transport_from_env(**kwargs):
+    """
+    Return a RecordingTransport or ReplayTransport if XTS_RECORD or XTS_REPLAY is set, else None.
+    `kwargs` are passed to RecordingTransport's PooledTransport.
+    """
+    replay_path = os.environ.get("XTS_REPLAY")
+    if replay_path:
+        return ReplayTransport(replay_path, float(os.environ.get("XTS_REPLAY_LATENCY_SCALE", "1")),
+                               default_timeout=kwargs.get("default_timeout", 7))
+    record_path = os.environ.get("XTS_RECORD")
+    if record_path:
+        return RecordingTransport(record_path, **kwargs)
+    return None
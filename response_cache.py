@@ -0,0 +1,170 @@
+"""
+    response_cache.py
+
+    Cache for XTS REST routes whose data changes at most once a day (instrument metadata, client config).
+
+    Successful responses are kept in a size-bounded LRU keyed by route, method and parameters, each route
+    with its own time to live. With a `path`, the cache is also saved to disk and reloaded on start, so a
+    warm start answers these calls without touching the network.
+
+    :copyright:
+    :license: see LICENSE for details.
+"""
+import atexit
+import copy
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+HOUR = 3600
+
+# Seconds a response of each cached route stays valid
+DEFAULT_ROUTE_TTLS = {
+    "market.config": 24 * HOUR,
+    "market.instruments.indexlist": 8 * HOUR,
+    "market.instruments.instrument.series": 8 * HOUR,
+    "market.instruments.instrument.equitysymbol": 8 * HOUR,
+    "market.instruments.instrument.expirydate": 8 * HOUR,
+    "market.instruments.instrument.futuresymbol": 8 * HOUR,
+    "market.instruments.instrument.optionsymbol": 8 * HOUR,
+    "market.instruments.instrument.optiontype": 8 * HOUR,
+    "market.search.instrumentsbyid": 8 * HOUR,
+}
+
+
+class ResponseCache:
+    """
+    LRU of API responses with per-route TTLs and optional persistence.
+
+    - `max_entries` bounds the number of cached responses across all routes.
+    - `route_ttls` maps a route key to its TTL in seconds and overrides DEFAULT_ROUTE_TTLS;
+      a TTL of 0 or None stops a route from being cached.
+    - `path` is a JSON file the cache is loaded from and saved to, at most every `save_interval` seconds.
+    """
+
+    def __init__(self, max_entries=2048, route_ttls=None, path=None, save_interval=5.0):
+        self.max_entries = max_entries
+        self.route_ttls = dict(DEFAULT_ROUTE_TTLS)
+        self.route_ttls.update(route_ttls or {})
+        self.path = path
+        self.save_interval = save_interval
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires at, response)
+        self._dirty = False
+        self._last_save = 0.0
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+        if self.path:
+            self.load()
+            atexit.register(self.save)  # Entries added since the last periodic save
+
+    def cacheable(self, route):
+        """Return True if responses of `route` are cached."""
+        return bool(self.route_ttls.get(route))
+
+    @staticmethod
+    def _key(route, method, params):
+        if isinstance(params, (bytes, bytearray)):
+            params = params.decode("utf8")
+        elif isinstance(params, (dict, list)):
+            params = json.dumps(params, sort_keys=True, default=str)
+        return f"{method} {route} {params or ''}"
+
+    def get(self, route, method, params):
+        """Return a copy of the cached response, or None."""
+        key = self._key(route, method, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                self._dirty = True
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            response = entry[1]
+        return copy.deepcopy(response)
+
+    def put(self, route, method, params, response):
+        """Cache a successful response of a cacheable route."""
+        ttl = self.route_ttls.get(route)
+        if not ttl or not isinstance(response, dict) or response.get("type") != "success":
+            return
+        key = self._key(route, method, params)
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, copy.deepcopy(response))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+            self._dirty = True
+        if self.path and time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+
+    def invalidate(self, route=None):
+        """Drop the cached responses of one route, or everything."""
+        with self._lock:
+            if route is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key.split(" ", 2)[1] == route]:
+                    del self._entries[key]
+            self._dirty = True
+
+    def load(self):
+        """Load the unexpired entries saved at `path`."""
+        try:
+            with open(self.path, "r") as cache_file:
+                saved = json.load(cache_file)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        with self._lock:
+            for key, expires, response in saved.get("entries", []):
+                if expires > now:
+                    self._entries[key] = (expires, response)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def save(self):
+        """Write the cache to `path` if it changed since the last save."""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = [[key, expires, response] for key, (expires, response) in self._entries.items()]
+            self._dirty = False
+            self._last_save = time.monotonic()
+        try:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as cache_file:
+                json.dump({"entries": entries}, cache_file)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error saving response cache: {e}")
+
+    def stats(self):
+        """Return the cache counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'expired': self.expired,
+                'evicted': self.evicted
+            }
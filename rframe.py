@@ -3,6 +3,8 @@ import os
 from PyQt5.QtCore import pyqtSignal
 from PyQt5.QtWidgets import QFrame, QVBoxLayout, QTabWidget, QWidget, QTableWidget, QTableWidgetItem
 from shared_resources import subscribed_instruments  # Import the shared subscribed_instruments set
+from table_model import set_cell_text  # Reuses cell items on tick updates
+import tick_dispatcher
 
 
 class RightTable(QWidget):
@@ -13,9 +15,6 @@ class RightTable(QWidget):
 
         self.setup_table()
 
-        # Connect the WebSocket client signal to this table's response handler
-        self.websocket_thread.response_received.connect(self.display_response)
-
         # Dictionary to keep track of row positions for each instrument
         self.instrument_row_mapping = {}
 
@@ -48,6 +47,8 @@ class RightTable(QWidget):
         self.right_table.clearContents()
         self.right_table.setRowCount(0)
         self.current_strategy_instruments.clear()  # Clear current strategy instruments
+        self.instrument_row_mapping.clear()
+        self.websocket_thread.dispatcher.unregister_all(self.display_response)  # Stop ticks for the previous strategy
         self.cmp_sum = 0.0  # Reset the CMP sum when clearing the table
 
     def add_data(self, table_data):
@@ -69,52 +70,46 @@ class RightTable(QWidget):
             # Keep track of instruments for the current strategy
             self.current_strategy_instruments.add(exchange_instrument_id)
 
+            # Route ticks of this instrument to display_response
+            exchange_segment = row_data[1]  # Assuming Exchange Segment is at index 1
+            segment_code = tick_dispatcher.segment_code(exchange_segment)
+            if segment_code is None or not str(exchange_instrument_id).isdigit():
+                print(f"Not subscribing to {exchange_segment} {exchange_instrument_id}: unknown instrument")
+                continue
+            self.websocket_thread.dispatcher.register(segment_code, exchange_instrument_id, self.display_response)
+
             # Send subscription request only if the instrument isn't already subscribed
-            if exchange_instrument_id not in subscribed_instruments:
-                exchange_segment = row_data[1]  # Assuming Exchange Segment is at index 1
-                segment_code = 1 if exchange_segment == "NSECM" else 2  # Adjust segment codes as needed
+            if (segment_code, int(exchange_instrument_id)) not in subscribed_instruments:
                 self.websocket_thread.send_subscription(segment_code, int(exchange_instrument_id))
 
                 # Mark this instrument as subscribed in the shared set
-                subscribed_instruments.add(exchange_instrument_id)
+                subscribed_instruments.add((segment_code, int(exchange_instrument_id)))
 
         # Update the CMP sum after adding data
         self.update_cmp_sum()
 
-    def display_response(self, message):
-        """Update the CMP and Last Traded Price (Price) based on WebSocket responses."""
-        try:
-            message_data = json.loads(message)
-            if "Touchline" in message_data and "ExchangeInstrumentID" in message_data:
-                instrument_id = str(message_data["ExchangeInstrumentID"])
-
-                # Update only if the instrument belongs to the current strategy
-                if instrument_id in self.current_strategy_instruments:
-                    bid_price = message_data["Touchline"]["BidInfo"].get("Price", "0.0")
-                    ask_price = message_data["Touchline"]["AskInfo"].get("Price", "0.0")
-                    last_traded_price = message_data["Touchline"].get("LastTradedPrice", "0.0")
-
-                    # Find the row corresponding to the instrument ID
-                    if instrument_id in self.instrument_row_mapping:
-                        row = self.instrument_row_mapping[instrument_id]
-                        action = self.right_table.item(row, 0).text()  # Get the action (Buy/Sell)
-
-                        # Update the CMP (Column 13) based on Buy or Sell action
-                        if action == "Buy":
-                            self.right_table.setItem(row, 13, QTableWidgetItem(str(ask_price)))  # Set Ask Price as CMP
-                        elif action == "Sell":
-                            self.right_table.setItem(row, 13, QTableWidgetItem(str(bid_price)))  # Set Bid Price as CMP
-
-                        # Update the Last Traded Price (Column 15)
-                        self.right_table.setItem(row, 15, QTableWidgetItem(str(last_traded_price)))
-
-                        # Update the CMP sum after the response
-                        self.update_cmp_sum()
-
-                        # Emit the signal with the updated CMP sum
-                        self.cmp_updated.emit(self.cmp_sum)
-        except json.JSONDecodeError:
-            pass  # Ignore JSON decode errors
+    def display_response(self, tick):
+        """Update the CMP and Last Traded Price (Price) from a dispatched tick."""
+        # Find the row corresponding to the instrument ID
+        row = self.instrument_row_mapping.get(str(tick.exchange_instrument_id))
+        if row is None:
+            return
+        action = self.right_table.item(row, 0).text()  # Get the action (Buy/Sell)
+
+        # Update the CMP (Column 13) based on Buy or Sell action
+        if action == "Buy":
+            set_cell_text(self.right_table, row, 13, str(tick.ask_price))  # Set Ask Price as CMP
+        elif action == "Sell":
+            set_cell_text(self.right_table, row, 13, str(tick.bid_price))  # Set Bid Price as CMP
+
+        # Update the Last Traded Price (Column 15)
+        set_cell_text(self.right_table, row, 15, str(tick.ltp))
+
+        # Update the CMP sum after the response
+        self.update_cmp_sum()
+
+        # Emit the signal with the updated CMP sum
+        self.cmp_updated.emit(self.cmp_sum)
 
     def update_cmp_sum(self):
         """Calculate and update the sum of CMP values in the table."""
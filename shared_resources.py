@@ -1,4 +1,5 @@
 # shared_resources.py
 
-# Shared set of subscribed instruments (ExchangeInstrumentID)
+# Shared set of subscribed instruments, as (segment code, ExchangeInstrumentID) integer pairs; WebSocketClient
+# removes an instrument once no widget holds it any more
 subscribed_instruments = set()
\ No newline at end of file
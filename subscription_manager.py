@@ -0,0 +1,164 @@
+import asyncio
+
+
+class SubscriptionRegistry:
+    """
+    Reference-counted registry of market data subscriptions.
+
+    Every (exchangeSegment, exchangeInstrumentID, xtsMessageCode) key remembers which consumers hold it.
+    New keys and released keys are collected for `batch_window` seconds and then sent to XTS as one
+    subscription and one unsubscription request per message code. An instrument is only unsubscribed
+    upstream once its last consumer has released it.
+    """
+
+    def __init__(self, xt_market, loop, batch_window=0.05):
+        self.xt_market = xt_market
+        self.loop = loop
+        self.batch_window = batch_window
+
+        # key -> set of consumers holding it
+        self.refs = {}
+
+        # consumer -> set of keys it holds
+        self.consumers = {}
+
+        # Keys currently subscribed with XTS
+        self.active = set()
+
+        # Keys sent to XTS whose response has not arrived yet
+        self.in_flight = set()
+
+        # Keys waiting for the next batch
+        self.pending_subscribe = set()
+        self.pending_unsubscribe = set()
+
+        # key -> futures waiting for the subscription response
+        self.waiters = {}
+
+        self._flush_handle = None
+
+    async def subscribe(self, consumer, exchange_segment, exchange_instrument_id, xts_message_code=1502):
+        """Hold an instrument for a consumer and return the XTS response of the batch that subscribed it."""
+        key = (int(exchange_segment), int(exchange_instrument_id), int(xts_message_code))
+        self.refs.setdefault(key, set()).add(consumer)
+        self.consumers.setdefault(consumer, set()).add(key)
+
+        # A release that has not been sent yet is simply cancelled
+        if key in self.pending_unsubscribe:
+            self.pending_unsubscribe.discard(key)
+            return {"type": "success", "description": "Instrument already subscribed"}
+
+        if key in self.active and key not in self.in_flight:
+            return {"type": "success", "description": "Instrument already subscribed"}
+
+        # Wait for the batch that carries this key
+        future = self.loop.create_future()
+        self.waiters.setdefault(key, []).append(future)
+        if key not in self.in_flight:
+            self.pending_subscribe.add(key)
+            self._schedule_flush()
+        return await future
+
+    def unsubscribe(self, consumer, exchange_segment, exchange_instrument_id, xts_message_code=1502):
+        """Drop one consumer's hold on an instrument."""
+        key = (int(exchange_segment), int(exchange_instrument_id), int(xts_message_code))
+        self.consumers.get(consumer, set()).discard(key)
+        self._release_key(consumer, key)
+
+    def release(self, consumer):
+        """Drop every instrument held by a consumer, e.g. when its connection closes."""
+        for key in self.consumers.pop(consumer, set()):
+            self._release_key(consumer, key)
+
+    def holders(self, exchange_segment, exchange_instrument_id):
+        """Return the consumers holding an instrument under any message code."""
+        holders = set()
+        for (segment, instrument_id, _), consumers in self.refs.items():
+            if segment == exchange_segment and instrument_id == exchange_instrument_id:
+                holders |= consumers
+        return holders
+
+    def _release_key(self, consumer, key):
+        consumers = self.refs.get(key)
+        if consumers is None:
+            return
+        consumers.discard(consumer)
+        if consumers:
+            return
+
+        # Last consumer is gone
+        del self.refs[key]
+        if key in self.pending_subscribe:
+            # Never reached XTS, so there is nothing to unsubscribe
+            self.pending_subscribe.discard(key)
+            self._resolve(key, {"type": "success", "description": "Subscription released before it was sent"})
+        elif key in self.active:
+            self.pending_unsubscribe.add(key)
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_handle is None:
+            self._flush_handle = self.loop.call_later(self.batch_window, self._start_flush)
+
+    def _start_flush(self):
+        self._flush_handle = None
+        asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Send the pending subscriptions and unsubscriptions, one REST call per message code."""
+        subscribe_keys, self.pending_subscribe = self.pending_subscribe, set()
+        unsubscribe_keys, self.pending_unsubscribe = self.pending_unsubscribe, set()
+        self.in_flight |= subscribe_keys | unsubscribe_keys
+
+        for xts_message_code, keys in self._group_by_code(subscribe_keys).items():
+            instruments = self._instruments(keys)
+            print(f"Subscribing to: {instruments}")
+            try:
+                response = await self.loop.run_in_executor(
+                    None, self.xt_market.send_subscription, instruments, xts_message_code)
+            except Exception as e:
+                response = {"type": "error", "description": f"Subscription failed: {e}"}
+            else:
+                self.active.update(keys)
+            for key in keys:
+                self.in_flight.discard(key)
+                self._resolve(key, response)
+
+                # Released by every consumer while the request was in flight
+                if key in self.active and key not in self.refs:
+                    self.pending_unsubscribe.add(key)
+                    self._schedule_flush()
+
+        for xts_message_code, keys in self._group_by_code(unsubscribe_keys).items():
+            instruments = self._instruments(keys)
+            print(f"Unsubscribing from: {instruments}")
+            try:
+                await self.loop.run_in_executor(
+                    None, self.xt_market.send_unsubscription, instruments, xts_message_code)
+            except Exception as e:
+                print(f"Unsubscription failed: {e}")
+            for key in keys:
+                self.in_flight.discard(key)
+                self.active.discard(key)
+
+                # Acquired again while the release was in flight
+                if key in self.refs:
+                    self.pending_subscribe.add(key)
+                    self._schedule_flush()
+
+    def _resolve(self, key, response):
+        for future in self.waiters.pop(key, []):
+            if not future.done():
+                future.set_result(response)
+
+    @staticmethod
+    def _group_by_code(keys):
+        grouped = {}
+        for key in keys:
+            grouped.setdefault(key[2], []).append(key)
+        return grouped
+
+    @staticmethod
+    def _instruments(keys):
+        return [{'exchangeSegment': segment, 'exchangeInstrumentID': instrument_id}
+                for segment, instrument_id, _ in keys]
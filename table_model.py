@@ -0,0 +1,253 @@
+import time
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, QObject, Qt, QTimer, pyqtSignal
+from PyQt5.QtWidgets import QTableWidgetItem
+
+
+def set_cell_text(table, row, column, text):
+    """Set the text of a QTableWidget cell, reusing its item instead of allocating a new one per update."""
+    item = table.item(row, column)
+    if item is None:
+        table.setItem(row, column, QTableWidgetItem(text))
+    elif item.text() != text:
+        item.setText(text)
+
+
+class TickTableModel(QAbstractTableModel):
+    """
+    Table model for views that receive live ticks.
+
+    Cells are kept in one list per column and rows are indexed by an instrument key such as
+    (exchangeSegment, exchangeInstrumentID), so a tick finds its row with one dict lookup and only
+    the cells it changed are signalled to the view. Nothing is allocated per cell update.
+    """
+
+    def __init__(self, headers, parent=None):
+        super().__init__(parent)
+        self.headers = list(headers)
+        self.columns = [[] for _ in self.headers]
+
+        # row -> key and key -> row
+        self.keys = []
+        self.row_index = {}
+
+        # When set, cell changes are reported to the scheduler and signalled once per frame
+        self.scheduler = None
+
+    # Qt model interface
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.keys)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        value = self.columns[index.column()][index.row()]
+        return "" if value is None else str(value)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.headers[section] if section < len(self.headers) else None
+        return str(section + 1)
+
+    # Row access
+
+    def value(self, row, column):
+        """Return the raw value of a cell."""
+        return self.columns[column][row]
+
+    def row_values(self, row):
+        """Return the raw values of a row, in column order."""
+        return [column[row] for column in self.columns]
+
+    def row_of(self, key):
+        """Return the row holding `key`, or None."""
+        return self.row_index.get(key)
+
+    def column_of(self, header):
+        """Return the column index of a header."""
+        return self.headers.index(header)
+
+    def append_row(self, values, key=None):
+        """Append a row of values (missing trailing values are left empty) and index it under `key`."""
+        row = len(self.keys)
+        self.beginInsertRows(QModelIndex(), row, row)
+        for column, cells in enumerate(self.columns):
+            cells.append(values[column] if column < len(values) else "")
+        self.keys.append(key)
+        if key is not None:
+            self.row_index[key] = row
+        self.endInsertRows()
+        return row
+
+    def remove_row(self, row):
+        """Remove a row and return its key."""
+        self.beginRemoveRows(QModelIndex(), row, row)
+        for cells in self.columns:
+            del cells[row]
+        key = self.keys.pop(row)
+        if key is not None and self.row_index.get(key) == row:
+            del self.row_index[key]
+
+        # Rows below the removed one move up by one
+        for below in range(row, len(self.keys)):
+            if self.keys[below] is not None:
+                self.row_index[self.keys[below]] = below
+        self.endRemoveRows()
+
+        # Pending changes may point past the last row now
+        if self.scheduler is not None:
+            self.scheduler.discard(self)
+        return key
+
+    def clear(self):
+        """Remove every row."""
+        self.beginResetModel()
+        self.columns = [[] for _ in self.headers]
+        self.keys = []
+        self.row_index = {}
+        self.endResetModel()
+        if self.scheduler is not None:
+            self.scheduler.discard(self)
+
+    # Updates
+
+    def set_value(self, row, column, value):
+        """Set one cell and signal it if it changed."""
+        cells = self.columns[column]
+        if cells[row] == value:
+            return
+        cells[row] = value
+        self.cells_changed(row, column, column)
+
+    def update_row(self, key, values):
+        """
+        Apply a {column: value} mapping to the row of `key`.
+
+        Emits a single dataChanged spanning the changed cells. Returns False if `key` has no row.
+        """
+        row = self.row_index.get(key)
+        if row is None:
+            return False
+
+        first = last = None
+        for column, value in values.items():
+            cells = self.columns[column]
+            if cells[row] == value:
+                continue
+            cells[row] = value
+            if first is None or column < first:
+                first = column
+            if last is None or column > last:
+                last = column
+
+        if first is not None:
+            self.cells_changed(row, first, last)
+        return True
+
+    def cells_changed(self, row, first, last):
+        """Signal changed cells of a row now, or on the next frame when a scheduler is attached."""
+        if self.scheduler is not None:
+            self.scheduler.mark(self, row, first, last)
+        else:
+            self.dataChanged.emit(self.index(row, first), self.index(row, last), [Qt.DisplayRole])
+
+
+class UpdateScheduler(QObject):
+    """
+    Frame-rate limiter for TickTableModel views.
+
+    Models attached to the scheduler only record which cells changed. At most `refresh_hz` times per
+    second the scheduler emits one dataChanged per model, spanning every cell changed since the last
+    frame, so a burst of ticks costs one repaint instead of one per tick.
+    """
+    frame_flushed = pyqtSignal(int)  # Number of cell updates coalesced into the frame
+
+    def __init__(self, refresh_hz=20, parent=None):
+        super().__init__(parent)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(int(1000 / refresh_hz))
+        self.timer.timeout.connect(self.flush)
+
+        # model -> [first row, last row, first column, last column] changed since the last frame
+        self.dirty = {}
+        self.pending_updates = 0
+
+        # Counters
+        self.frames = 0
+        self.updates = 0
+        self.last_frame_updates = 0
+        self.max_frame_updates = 0
+        self.last_flush_ms = 0.0
+
+    def attach(self, model):
+        """Route the cell changes of a model through this scheduler."""
+        model.scheduler = self
+
+    def detach(self, model):
+        """Signal the pending changes of a model and go back to immediate updates."""
+        self.flush()
+        model.scheduler = None
+
+    def set_refresh_rate(self, refresh_hz):
+        """Change the number of frames per second."""
+        self.timer.setInterval(int(1000 / refresh_hz))
+
+    def mark(self, model, row, first, last):
+        """Record changed cells of a row and make sure a frame is scheduled."""
+        self.pending_updates += 1
+        area = self.dirty.get(model)
+        if area is None:
+            self.dirty[model] = [row, row, first, last]
+        else:
+            if row < area[0]:
+                area[0] = row
+            elif row > area[1]:
+                area[1] = row
+            if first < area[2]:
+                area[2] = first
+            if last > area[3]:
+                area[3] = last
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def discard(self, model):
+        """Forget pending changes of a model whose rows were removed or reset (the view repaints those anyway)."""
+        self.dirty.pop(model, None)
+
+    def flush(self):
+        """Emit one dataChanged per model for everything changed since the last frame."""
+        self.timer.stop()
+        if not self.dirty:
+            return
+        started = time.perf_counter()
+        dirty, self.dirty = self.dirty, {}
+        for model, (first_row, last_row, first_column, last_column) in dirty.items():
+            last_row = min(last_row, model.rowCount() - 1)
+            if last_row < first_row:
+                continue
+            model.dataChanged.emit(model.index(first_row, first_column), model.index(last_row, last_column), [Qt.DisplayRole])
+
+        coalesced, self.pending_updates = self.pending_updates, 0
+        self.frames += 1
+        self.updates += coalesced
+        self.last_frame_updates = coalesced
+        self.max_frame_updates = max(self.max_frame_updates, coalesced)
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+        self.frame_flushed.emit(coalesced)
+
+    def stats(self):
+        """Return the frame counters."""
+        return {
+            'frames': self.frames,
+            'updates': self.updates,
+            'updates_per_frame': self.updates / self.frames if self.frames else 0.0,
+            'last_frame_updates': self.last_frame_updates,
+            'max_frame_updates': self.max_frame_updates,
+            'last_flush_ms': self.last_flush_ms
+        }
@@ -1,10 +1,12 @@
 import pandas as pd
 import json
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QTableWidget,QDialog,QLabel, QTableWidgetItem, QMessageBox, QAbstractItemView, QFrame, QHBoxLayout, QMenu, QFileDialog
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QTableView,QDialog,QLabel, QMessageBox, QAbstractItemView, QFrame, QHBoxLayout, QMenu, QFileDialog
 from PyQt5.QtCore import Qt, QPoint,QEvent
 from scriptbar import Application  # Import Application from scriptbar.py
 from order import PlaceOrderApp  # Import the OrderWindow class
 from shared_resources import subscribed_instruments  # Import the shared subscribed_instruments set
+from table_model import TickTableModel, UpdateScheduler  # Column-array model with an instrument -> row index
+import tick_dispatcher
 
 
 class TerminalTab(QWidget):
@@ -13,8 +15,6 @@ class TerminalTab(QWidget):
 
         # Initialize WebSocket client
         self.websocket_client = websocket_client
-      
-        self.websocket_client.response_received.connect(self.update_ltp_column)  # Connect signal to update LTP
 
         # Start WebSocket client in a separate thread
         self.websocket_client.start()
@@ -56,8 +56,7 @@ class TerminalTab(QWidget):
         # Add the top frame to the main layout
         main_layout.addWidget(top_frame)
 
-        # Bottom frame (for the table)
-        self.table_widget = QTableWidget(0, 34)  # Start with 0 rows, 34 columns
+        # Bottom frame (for the table), rows keyed by (segment code, ExchangeInstrumentID)
         # Set the column headers in the specified order
         column_headers = [
             "ExchangeSegment", "Series", "ContractExpiration", "StrikePrice", "OptionType", "Name", "BidQty", "Bid Price",
@@ -66,10 +65,16 @@ class TerminalTab(QWidget):
             "TickSize", "LotSize", "Multiplier", "UnderlyingIndexName",
             "ISIN", "displayName", "ExchangeInstrumentID",  "UnderlyingInstrumentId"
         ]
-        self.table_widget.setHorizontalHeaderLabels(column_headers)
+        self.model = TickTableModel(column_headers, self)
+
+        # Ticks only mark cells dirty; the view repaints them at most refresh_hz times per second
+        self.update_scheduler = UpdateScheduler(refresh_hz=20, parent=self)
+        self.update_scheduler.attach(self.model)
+        self.table_widget = QTableView()
+        self.table_widget.setModel(self.model)
         self.table_widget.verticalHeader().setVisible(False)
-        self.table_widget.setSelectionBehavior(self.table_widget.SelectRows)
-        self.table_widget.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table_widget.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table_widget.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.table_widget.setSelectionMode(QAbstractItemView.SingleSelection)
 
         # Enable right-click context menu
@@ -105,21 +110,21 @@ class TerminalTab(QWidget):
         
     def open_order_window(self, order_side):
         """Open the order window and pass the selected instrument's details to PlaceOrderApp."""
-        selected_row = self.table_widget.currentRow()  # Get the selected row index
+        selected_row = self.table_widget.currentIndex().row()  # Get the selected row index
         if selected_row < 0:  # If no row is selected, show a warning
             QMessageBox.warning(self, "No selection", "Please select a row first.")
             return
 
         # Retrieve instrument details from the selected row
-        exchange_instrument_id = self.table_widget.item(selected_row, 32).text()  # Assuming column 32 holds ExchangeInstrumentID
-        exchange_segment = self.table_widget.item(selected_row, 0).text()  # Assuming column 0 holds ExchangeSegment
-        price_band_high = float(self.table_widget.item(selected_row, 23).text())  # Column 24 for PriceBandHigh
-        price_band_low = float(self.table_widget.item(selected_row, 24).text())  # Column 25 for PriceBandLow
-        freeze_qty = self.table_widget.item(selected_row, 25).text()  # Column 26 for FreezeQty
-        tick_size = float(self.table_widget.item(selected_row, 26).text())  # Column 27 for TickSize
-        lot_size = int(self.table_widget.item(selected_row, 27).text())  # Column 28 for LotSize
-        bid_price = float(self.table_widget.item(selected_row, 7).text())  # Column 7 for Bid Price
-        ask_price = float(self.table_widget.item(selected_row, 8).text())  # Column 8 for Ask Price
+        exchange_instrument_id = str(self.model.value(selected_row, 32))  # Assuming column 32 holds ExchangeInstrumentID
+        exchange_segment = str(self.model.value(selected_row, 0))  # Assuming column 0 holds ExchangeSegment
+        price_band_high = float(self.model.value(selected_row, 23))  # Column 24 for PriceBandHigh
+        price_band_low = float(self.model.value(selected_row, 24))  # Column 25 for PriceBandLow
+        freeze_qty = str(self.model.value(selected_row, 25))  # Column 26 for FreezeQty
+        tick_size = float(self.model.value(selected_row, 26))  # Column 27 for TickSize
+        lot_size = int(float(self.model.value(selected_row, 27)))  # Column 28 for LotSize
+        bid_price = float(self.model.value(selected_row, 7))  # Column 7 for Bid Price
+        ask_price = float(self.model.value(selected_row, 8))  # Column 8 for Ask Price
 
         # Open the PlaceOrderApp dialog and pass the collected details
         order_window = PlaceOrderApp(
@@ -142,9 +147,11 @@ class TerminalTab(QWidget):
 
     def delete_selected_row(self):
         """Deletes the currently selected row."""
-        selected_row = self.table_widget.currentRow()
+        selected_row = self.table_widget.currentIndex().row()
         if selected_row >= 0:
-            self.table_widget.removeRow(selected_row)
+            key = self.model.remove_row(selected_row)
+            if key is not None:
+                self.websocket_client.dispatcher.unregister(key[0], key[1], self.update_ltp_column)
         else:
             QMessageBox.warning(self, "No selection", "Please select a row to delete.")
 
@@ -166,14 +173,10 @@ class TerminalTab(QWidget):
         file_path, _ = QFileDialog.getSaveFileName(self, "Save Market Watch", "", "JSON Files (*.json)")
         if file_path:
             table_data = []
-            row_count = self.table_widget.rowCount()
-            col_count = self.table_widget.columnCount()
-
-            for row in range(row_count):
+            for row in range(self.model.rowCount()):
                 row_data = {}
-                for col in range(col_count):
-                    item = self.table_widget.item(row, col)
-                    row_data[self.table_widget.horizontalHeaderItem(col).text()] = item.text() if item else ""
+                for header, value in zip(self.model.headers, self.model.row_values(row)):
+                    row_data[header] = "" if value is None else str(value)
                 table_data.append(row_data)
 
             with open(file_path, "w") as file:
@@ -187,22 +190,20 @@ class TerminalTab(QWidget):
             with open(file_path, "r") as file:
                 table_data = json.load(file)
 
-            self.table_widget.setRowCount(0)  # Clear the table before loading new data
+            self.model.clear()  # Clear the table before loading new data
+            self.websocket_client.dispatcher.unregister_all(self.update_ltp_column)
             for row_data in table_data:
-                next_row = self.table_widget.rowCount()
-                self.table_widget.insertRow(next_row)
-
-                # Add the data to the table and send subscription request
-                for col, header in enumerate(self.table_widget.horizontalHeaderItem(i).text() for i in range(self.table_widget.columnCount())):
-                    value = row_data.get(header, "")
-                    self.table_widget.setItem(next_row, col, QTableWidgetItem(str(value)))
-
                 # Extract the necessary values to send a subscription request
                 exchange_segment = row_data.get("ExchangeSegment")
                 exchange_instrument_id = row_data.get("ExchangeInstrumentID")
 
+                # Add the data to the table and send subscription request
+                values = [str(row_data.get(header, "")) for header in self.model.headers]
+                self.model.append_row(values, self.instrument_key(exchange_segment, exchange_instrument_id))
+
                 # Send subscription request for each instrument loaded from file
                 if exchange_segment and exchange_instrument_id:
+                    self.track_instrument(exchange_segment, exchange_instrument_id)
                     self.subscribe_to_instrument(exchange_segment, exchange_instrument_id)
 
             QMessageBox.information(self, "Success", "Market Watch loaded successfully!")
@@ -210,12 +211,7 @@ class TerminalTab(QWidget):
 
     def is_duplicate_instrument(self, exchange_instrument_id):
         """Checks if the ExchangeInstrumentID already exists in column 32 of the table."""
-        row_count = self.table_widget.rowCount()
-        for row in range(row_count):
-            item = self.table_widget.item(row, 32)  # Assuming ExchangeInstrumentID is in column 32
-            if item and item.text() == exchange_instrument_id:
-                return True
-        return False
+        return str(exchange_instrument_id) in self.model.columns[32]  # Assuming ExchangeInstrumentID is in column 32
 
     def update_table(self, data):
         """Update the table by adding the selected data to a new row, replacing NaN with an empty string."""
@@ -226,103 +222,59 @@ class TerminalTab(QWidget):
             QMessageBox.warning(self, "Duplicate Entry", f"Instrument ID {exchange_instrument_id} already exists.")
             return
 
-        # Get the next available row (the current row count)
-        next_row = self.table_widget.rowCount()
-
-        # Insert a new row at the next available position
-        self.table_widget.insertRow(next_row)
-
         # Add the data to the table, replacing NaN with an empty string
-        headers = [self.table_widget.horizontalHeaderItem(i).text() for i in range(self.table_widget.columnCount())]
-        for col, header in enumerate(headers):
-            if header in data:
-                value = data[header]
-                if pd.isna(value):  # Check if the value is NaN for **any** column
-                    value = ""  # Replace NaN with an empty string
-                self.table_widget.setItem(next_row, col, QTableWidgetItem(str(value)))
+        values = []
+        for header in self.model.headers:
+            value = data.get(header, "")
+            if pd.isna(value):  # Check if the value is NaN for **any** column
+                value = ""  # Replace NaN with an empty string
+            values.append(str(value))
 
-        # Send WebSocket subscription request for the new row
         exchange_segment = data.get("ExchangeSegment")
+        self.model.append_row(values, self.instrument_key(exchange_segment, exchange_instrument_id))
+
+        # Send WebSocket subscription request for the new row
         if exchange_segment and exchange_instrument_id:
+            self.track_instrument(exchange_segment, exchange_instrument_id)
             self.subscribe_to_instrument(exchange_segment, exchange_instrument_id)
 
+    @staticmethod
+    def instrument_key(exchange_segment, exchange_instrument_id):
+        """Return the (segment code, ExchangeInstrumentID) row key, or None if the row has no instrument."""
+        segment_code = tick_dispatcher.segment_code(exchange_segment)
+        if segment_code is None or not str(exchange_instrument_id).isdigit():
+            return None
+        return segment_code, int(exchange_instrument_id)
+
+    def track_instrument(self, exchange_segment, exchange_instrument_id):
+        """Route ticks of an instrument to this tab."""
+        key = self.instrument_key(exchange_segment, exchange_instrument_id)
+        if key is not None:
+            self.websocket_client.dispatcher.register(key[0], key[1], self.update_ltp_column)
+
     def subscribe_to_instrument(self, exchange_segment, exchange_instrument_id):
         """Send subscription request for real-time updates via WebSocket only if not already subscribed."""
-        if exchange_instrument_id not in subscribed_instruments:
-            # Determine the exchange segment code
-            segment_code = 1 if exchange_segment == "NSECM" else 2  # Adjust segment codes as per your requirement
-            self.websocket_client.send_subscription(segment_code, int(exchange_instrument_id))
+        key = self.instrument_key(exchange_segment, exchange_instrument_id)
+        if key is not None and key not in subscribed_instruments:
+            self.websocket_client.send_subscription(key[0], key[1])
 
             # Add the instrument to the subscribed instruments set
-            subscribed_instruments.add(exchange_instrument_id)
-
-    def update_ltp_column(self, message):
-        """Update the LTP, ATP, Open, High, Low, Close, BidQty, BidPrice, AskQty, AskPrice, LTQ columns with WebSocket messages."""
-        try:
-            message_data = json.loads(message)
-            if "Touchline" in message_data and "ExchangeInstrumentID" in message_data:
-                instrument_id = str(message_data["ExchangeInstrumentID"])
-
-                # Find the row corresponding to the instrument ID
-                row_count = self.table_widget.rowCount()
-                for row in range(row_count):
-                    item = self.table_widget.item(row, 32)  # Assuming ExchangeInstrumentID is in column 32
-                    if item and item.text() == instrument_id:
-                        touchline = message_data["Touchline"]
-
-                        # Update BidQty (Column 6)
-                        bid_qty = touchline["BidInfo"].get("Size", "0")
-                        self.table_widget.setItem(row, 6, QTableWidgetItem(str(bid_qty)))
-
-                        # Update BidPrice (Column 7)
-                        bid_price = touchline["BidInfo"].get("Price", "0.0")
-                        self.table_widget.setItem(row, 7, QTableWidgetItem(str(bid_price)))
-
-                        # Update AskPrice (Column 8)
-                        ask_price = touchline["AskInfo"].get("Price", "0.0")
-                        self.table_widget.setItem(row, 8, QTableWidgetItem(str(ask_price)))
-
-                        # Update AskQty (Column 9)
-                        ask_qty = touchline["AskInfo"].get("Size", "0")
-                        self.table_widget.setItem(row, 9, QTableWidgetItem(str(ask_qty)))
-
-                        # Update LTP (Column 10)
-                        ltp = touchline.get("LastTradedPrice", "0.0")
-                        self.table_widget.setItem(row, 10, QTableWidgetItem(str(ltp)))
-
-                        # Update Change % (Column 11)
-                        change_percent = touchline.get("PercentChange", "0.0")
-                        self.table_widget.setItem(row, 11, QTableWidgetItem(f"{float(change_percent):.2f}"))
-
-                        # Update Change Value (Column 12, calculate as LTP - Close)
-                        close_price = touchline.get("Close", "0.0")
-                        change_value = float(ltp) - float(close_price)
-                        self.table_widget.setItem(row, 12, QTableWidgetItem(f"{change_value:.2f}"))
-
-                        # Update LTQ (Last Traded Quantity) (Column 13)
-                        ltq = touchline.get("LastTradedQunatity", "0")
-                        self.table_widget.setItem(row, 13, QTableWidgetItem(str(ltq)))
-
-                        # Update ATP (Column 14)
-                        atp = touchline.get("AverageTradedPrice", "0.0")
-                        self.table_widget.setItem(row, 14, QTableWidgetItem(str(atp)))
-
-                        # Update Open (Column 15)
-                        open_price = touchline.get("Open", "0.0")
-                        self.table_widget.setItem(row, 15, QTableWidgetItem(str(open_price)))
-
-                        # Update High (Column 16)
-                        high_price = touchline.get("High", "0.0")
-                        self.table_widget.setItem(row, 16, QTableWidgetItem(str(high_price)))
-
-                        # Update Low (Column 17)
-                        low_price = touchline.get("Low", "0.0")
-                        self.table_widget.setItem(row, 17, QTableWidgetItem(str(low_price)))
-
-                        # Update Close (Column 18)
-                        close_price = touchline.get("Close", "0.0")
-                        self.table_widget.setItem(row, 18, QTableWidgetItem(str(close_price)))
-
-                        break
-        except json.JSONDecodeError:
-            pass  
\ No newline at end of file
+            subscribed_instruments.add(key)
+
+    def update_ltp_column(self, tick):
+        """Update the LTP, ATP, Open, High, Low, Close, BidQty, BidPrice, AskQty, AskPrice, LTQ columns from a dispatched tick."""
+        self.model.update_row(tick.key, {
+            6: tick.bid_size,  # BidQty
+            7: tick.bid_price,  # Bid Price
+            8: tick.ask_price,  # Ask Price
+            9: tick.ask_size,  # Ask Qty
+            10: tick.ltp,  # LTP
+            11: f"{tick.percent_change:.2f}",  # % Change
+            12: f"{tick.ltp - tick.close:.2f}",  # Change Value (LTP - Close)
+            13: tick.ltq,  # LTQ
+            14: tick.atp,  # ATP
+            15: tick.open,  # Open
+            16: tick.high,  # High
+            17: tick.low,  # Low
+            18: tick.close,  # Close
+        })
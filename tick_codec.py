@@ -0,0 +1,80 @@
+"""
+    tick_codec.py
+
+    Wire formats of the local tick relay on ws://localhost:8766.
+
+    - JSON text frames carry the XTS payload exactly as received. This is the default and is handy for debugging.
+    - Binary frames carry the touchline fields in a fixed little-endian struct layout. A client asks for them
+      by sending {"action": "format", "format": "binary"} after connecting.
+
+    `decode_message` turns either kind of frame back into the dict shape every widget already reads
+    (ExchangeSegment, ExchangeInstrumentID and a Touchline dict).
+"""
+import json
+import struct
+
+FORMAT_JSON = "json"
+FORMAT_BINARY = "binary"
+
+# First byte of every binary tick frame, followed by the layout version
+MAGIC = 0xA5
+VERSION = 1
+
+# magic, version, segment, instrument id, message code,
+# LTP, LTQ, ATP, % change, open, high, low, close,
+# total traded / buy / sell quantity, last traded time, last update time,
+# bid size, bid price, ask size, ask price
+_TOUCHLINE = struct.Struct('<BBHIH dIdddddd QQQ II IdId')
+
+_TOUCHLINE_FIELDS = (
+    ("LastTradedPrice", float), ("LastTradedQunatity", int), ("AverageTradedPrice", float), ("PercentChange", float),
+    ("Open", float), ("High", float), ("Low", float), ("Close", float),
+    ("TotalTradedQuantity", int), ("TotalBuyQuantity", int), ("TotalSellQuantity", int),
+    ("LastTradedTime", int), ("LastUpdateTime", int),
+)
+_TOUCHLINE_NAMES = tuple(name for name, _ in _TOUCHLINE_FIELDS)
+
+
+def encode_touchline(message):
+    """Pack the touchline of a decoded XTS 1501/1502 payload into a binary frame."""
+    touchline = message["Touchline"]
+    bid = touchline.get("BidInfo") or {}
+    ask = touchline.get("AskInfo") or {}
+    return _TOUCHLINE.pack(
+        MAGIC, VERSION,
+        int(message["ExchangeSegment"]), int(message["ExchangeInstrumentID"]), int(message.get("MessageCode") or 0),
+        *(kind(touchline.get(name) or 0) for name, kind in _TOUCHLINE_FIELDS),
+        int(bid.get("Size") or 0), float(bid.get("Price") or 0.0),
+        int(ask.get("Size") or 0), float(ask.get("Price") or 0.0),
+    )
+
+
+def decode_message(message):
+    """
+    Decode a relay frame into a dict.
+
+    Binary frames are unpacked from the struct layout, text frames are parsed as JSON
+    (raising json.JSONDecodeError for non-JSON text, as json.loads does).
+    """
+    if isinstance(message, (bytes, bytearray, memoryview)):
+        return _decode_touchline(message)
+    return json.loads(message)
+
+
+def _decode_touchline(frame):
+    try:
+        values = _TOUCHLINE.unpack(frame)
+    except struct.error as e:
+        raise ValueError(f"Malformed binary tick frame: {e}")
+    if values[0] != MAGIC or values[1] != VERSION:
+        raise ValueError("Unknown binary tick frame")
+
+    touchline = dict(zip(_TOUCHLINE_NAMES, values[5:18]))
+    touchline["BidInfo"] = {"Size": values[18], "Price": values[19]}
+    touchline["AskInfo"] = {"Size": values[20], "Price": values[21]}
+    return {
+        "MessageCode": values[4],
+        "ExchangeSegment": values[2],
+        "ExchangeInstrumentID": values[3],
+        "Touchline": touchline,
+    }
@@ -0,0 +1,103 @@
+from PyQt5.QtCore import QObject, pyqtSignal
+
+# XTS exchange segment codes, for callers that hold the segment name instead of the code
+SEGMENT_CODES = {"NSECM": 1, "NSEFO": 2, "NSECD": 3, "BSECM": 11, "BSEFO": 12, "MCXFO": 51}
+
+
+def segment_code(exchange_segment):
+    """Return the numeric XTS segment for a code or a name such as "NSEFO", or None if it is unknown."""
+    if isinstance(exchange_segment, int):
+        return exchange_segment
+    exchange_segment = str(exchange_segment).strip()
+    if exchange_segment.isdigit():
+        return int(exchange_segment)
+    return SEGMENT_CODES.get(exchange_segment.upper())
+
+
+class Tick:
+    """A decoded touchline update."""
+
+    __slots__ = (
+        "exchange_segment", "exchange_instrument_id", "message_code",
+        "ltp", "ltq", "atp", "percent_change", "open", "high", "low", "close",
+        "bid_size", "bid_price", "ask_size", "ask_price", "volume", "last_update_time", "message",
+    )
+
+    def __init__(self, message):
+        """Build a tick from a decoded relay message that carries a Touchline."""
+        touchline = message["Touchline"]
+        bid = touchline.get("BidInfo") or {}
+        ask = touchline.get("AskInfo") or {}
+
+        self.exchange_segment = int(message["ExchangeSegment"])
+        self.exchange_instrument_id = int(message["ExchangeInstrumentID"])
+        self.message_code = message.get("MessageCode")
+        self.ltp = float(touchline.get("LastTradedPrice") or 0.0)
+        self.ltq = int(touchline.get("LastTradedQunatity") or 0)
+        self.atp = float(touchline.get("AverageTradedPrice") or 0.0)
+        self.percent_change = float(touchline.get("PercentChange") or 0.0)
+        self.open = float(touchline.get("Open") or 0.0)
+        self.high = float(touchline.get("High") or 0.0)
+        self.low = float(touchline.get("Low") or 0.0)
+        self.close = float(touchline.get("Close") or 0.0)
+        self.bid_size = int(bid.get("Size") or 0)
+        self.bid_price = float(bid.get("Price") or 0.0)
+        self.ask_size = int(ask.get("Size") or 0)
+        self.ask_price = float(ask.get("Price") or 0.0)
+        self.volume = int(touchline.get("TotalTradedQuantity") or 0)
+        self.last_update_time = int(touchline.get("LastUpdateTime") or 0)
+
+        # Full decoded payload, for consumers that need more than the touchline
+        self.message = message
+
+    @property
+    def key(self):
+        return self.exchange_segment, self.exchange_instrument_id
+
+
+class TickDispatcher(QObject):
+    """
+    Routes decoded ticks to the widgets that hold the instrument.
+
+    Ticks are decoded on the WebSocket thread and arrive here on the GUI thread. Callbacks are indexed by
+    (exchangeSegment, exchangeInstrumentID), so a tick only costs the callbacks registered for its instrument.
+    `released` is emitted with the key once its last callback is unregistered.
+    """
+
+    released = pyqtSignal(int, int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.callbacks = {}
+
+    def register(self, exchange_segment, exchange_instrument_id, callback):
+        """Call `callback(tick)` for every tick of the instrument. Registering twice has no effect."""
+        code = segment_code(exchange_segment)
+        if code is None:
+            return
+        callbacks = self.callbacks.setdefault((code, int(exchange_instrument_id)), [])
+        if callback not in callbacks:
+            callbacks.append(callback)
+
+    def unregister(self, exchange_segment, exchange_instrument_id, callback):
+        """Stop delivering ticks of the instrument to `callback`."""
+        code = segment_code(exchange_segment)
+        if code is None:
+            return
+        key = (code, int(exchange_instrument_id))
+        callbacks = self.callbacks.get(key)
+        if callbacks and callback in callbacks:
+            callbacks.remove(callback)
+            if not callbacks:
+                del self.callbacks[key]
+                self.released.emit(*key)
+
+    def unregister_all(self, callback):
+        """Stop delivering any tick to `callback`."""
+        for key in list(self.callbacks):
+            self.unregister(key[0], key[1], callback)
+
+    def dispatch(self, tick):
+        """Deliver a tick to the callbacks registered for its instrument (runs on the GUI thread)."""
+        for callback in tuple(self.callbacks.get(tick.key, ())):
+            callback(tick)
@@ -0,0 +1,328 @@
+"""
+    tick_recorder.py
+
+    Records the market data socket to disk and plays it back, to reproduce production bursts offline.
+
+    TickRecorder wraps the 1501/1502/1505/1510/1512 event handlers of an MDSocket_io and appends every
+    payload it receives, with the local receive time, to a daily segment file <directory>/ticks-YYYYMMDD.xtt.
+    The socket thread only queues the payload; a background thread writes the queue every `flush_interval`
+    seconds as one zlib-compressed block, so a crash loses at most that much. A day whose segment ends with
+    a block torn by a crash continues in ticks-YYYYMMDD-001.xtt, and readers skip damaged blocks.
+
+    Segment layout: the magic b"XTT1", then blocks of
+        <uint32 compressed length> <uint32 record count> <zlib data>
+    and inside each block, records of
+        <float64 receive time> <uint16 message code> <uint8 partial> <uint32 length> <payload>
+
+    TickReplayer memory-maps segments and feeds the payloads back through the same callbacks, either an
+    MDSocket_io's registered handlers or any object with on_message<code>_json_<full|partial> methods such
+    as MarketDataHub, at the recorded pace times `speed` (None replays as fast as possible).
+
+        recorder = TickRecorder("ticks")
+        recorder.attach(md_socket)  # after the consumer has registered its handlers
+        TickReplayer("ticks/ticks-20241126.xtt", speed=10).replay(hub)
+
+        python tick_recorder.py stats ticks/ticks-20241126.xtt
+        python tick_recorder.py replay ticks/ticks-20241126.xtt --speed 10
+
+    MarketDataHub records automatically when XTS_TICK_RECORD is set to a directory.
+"""
+import argparse
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+
+MAGIC = b"XTT1"
+RECORDED_CODES = (1501, 1502, 1505, 1510, 1512)
+
+_BLOCK = struct.Struct("<II")
+_RECORD = struct.Struct("<dHBI")
+
+
+def segment_path(directory, when=None):
+    """Return the segment file of the day of `when` (epoch seconds, now by default)."""
+    day = datetime.fromtimestamp(when if when is not None else time.time())
+    return os.path.join(directory, f"ticks-{day:%Y%m%d}.xtt")
+
+
+class TickRecorder:
+    """Appends received market data payloads to compressed daily segment files."""
+
+    def __init__(self, directory="ticks", codes=RECORDED_CODES, flush_interval=0.5, level=1):
+        self.directory = directory
+        self.codes = codes
+        self.flush_interval = flush_interval
+        self.level = level
+        os.makedirs(directory, exist_ok=True)
+
+        self._pending = []
+        self._lock = threading.Lock()
+        self._file = None
+        self._path = None
+        self._stop = threading.Event()
+        self._writer = threading.Thread(target=self._run, name="tick-recorder", daemon=True)
+        self._writer.start()
+
+        # Counters
+        self.records = 0
+        self.raw_bytes = 0
+        self.written_bytes = 0
+
+    def record(self, code, partial, payload):
+        """Queue one payload; called on the socket thread."""
+        if isinstance(payload, str):
+            payload = payload.encode("utf8")
+        with self._lock:
+            self._pending.append((time.time(), code, partial, payload))
+
+    def attach(self, md_socket):
+        """Record every payload of the recorded codes that reaches `md_socket`, then pass it on as before."""
+        handlers = md_socket.get_emitter().handlers.setdefault("/", {})
+        for code in self.codes:
+            for partial, mode in ((0, "full"), (1, "partial")):
+                event = f"{code}-json-{mode}"
+                handler = handlers.get(event) or getattr(md_socket, f"on_message{code}_json_{mode}", None)
+                handlers[event] = self._recording(code, partial, handler)
+
+    def _recording(self, code, partial, handler):
+        def on_message(data):
+            self.record(code, partial, data)
+            if handler is not None:
+                handler(data)
+        return on_message
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """Write the queued payloads as one block per day."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        by_day = {}
+        for entry in pending:
+            by_day.setdefault(segment_path(self.directory, entry[0]), []).append(entry)
+        for path, entries in by_day.items():
+            raw = bytearray()
+            for received, code, partial, payload in entries:
+                raw += _RECORD.pack(received, code, partial, len(payload))
+                raw += payload
+            block = zlib.compress(bytes(raw), self.level)
+            try:
+                segment = self._segment(path)
+                segment.write(_BLOCK.pack(len(block), len(entries)) + block)
+                segment.flush()
+            except OSError as e:
+                print(f"Tick recorder could not write {path}: {e}")
+                continue
+            self.records += len(entries)
+            self.raw_bytes += len(raw)
+            self.written_bytes += _BLOCK.size + len(block)
+
+    def _segment(self, path):
+        if path != self._path:
+            if self._file is not None:
+                self._file.close()
+            # Blocks appended after a torn one would be hard to find again, so such a day continues
+            # in ticks-YYYYMMDD-001.xtt, -002 and so on
+            target, number = path, 0
+            while os.path.exists(target) and os.path.getsize(target) and not _is_complete(target):
+                number += 1
+                target = f"{path[:-len('.xtt')]}-{number:03d}.xtt"
+            if target != path:
+                print(f"Tick recorder: {path} ends with a partial block, continuing in {target}")
+            is_new = not os.path.exists(target) or os.path.getsize(target) == 0
+            self._file = open(target, "ab")
+            self._path = path
+            if is_new:
+                self._file.write(MAGIC)
+        return self._file
+
+    def close(self):
+        self._stop.set()
+        self._writer.join()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stats(self):
+        return {'records': self.records, 'raw_bytes': self.raw_bytes, 'written_bytes': self.written_bytes,
+                'queued': len(self._pending)}
+
+
+def recorder_from_env():
+    """Return a TickRecorder writing to the XTS_TICK_RECORD directory, or None if it is not set."""
+    directory = os.environ.get("XTS_TICK_RECORD")
+    return TickRecorder(directory) if directory else None
+
+
+def _is_complete(path):
+    """Return True if the blocks of a segment end exactly at the end of the file."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as segment:
+        if segment.read(len(MAGIC)) != MAGIC:
+            return False
+        offset = len(MAGIC)
+        while offset + _BLOCK.size <= size:
+            length, _ = _BLOCK.unpack(segment.read(_BLOCK.size))
+            offset += _BLOCK.size + length
+            segment.seek(offset)
+        return offset == size
+
+
+def _blocks(mapped, view):
+    """Yield (record count, decompressed data) of every readable block of a mapped segment."""
+    offset = len(MAGIC)
+    while offset + _BLOCK.size <= len(mapped):
+        length, count = _BLOCK.unpack_from(mapped, offset)
+        start = offset + _BLOCK.size
+        raw = None
+        if start + length <= len(mapped):
+            try:
+                raw = zlib.decompress(view[start:start + length])
+            except zlib.error:
+                pass
+        if raw is not None:
+            yield count, raw
+            offset = start + length
+            continue
+        # A block cut short when the recording process stopped, possibly followed by blocks appended
+        # after a restart: try again at the next header followed by a zlib stream (which starts with 0x78)
+        found = mapped.find(b"\x78", offset + 1 + _BLOCK.size)
+        if found < 0:
+            break
+        offset = found - _BLOCK.size
+
+
+def read_segment(path):
+    """Yield (receive time, code, partial, payload bytes) for every record of a segment, in order."""
+    with open(path, "rb") as segment:
+        if os.fstat(segment.fileno()).st_size <= len(MAGIC):
+            return
+        with mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if mapped[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a tick segment")
+            view = memoryview(mapped)
+            try:
+                for count, raw in _blocks(mapped, view):
+                    position = 0
+                    for _ in range(count):
+                        if position + _RECORD.size > len(raw):
+                            break
+                        received, code, partial, size = _RECORD.unpack_from(raw, position)
+                        position += _RECORD.size
+                        yield received, code, partial, raw[position:position + size]
+                        position += size
+            finally:
+                view.release()
+
+
+class TickReplayer:
+    """Feeds recorded segments back through market data callbacks."""
+
+    def __init__(self, paths, speed=1.0, codes=None):
+        self.paths = [paths] if isinstance(paths, str) else list(paths)
+        self.speed = speed
+        self.codes = codes
+
+        # Counters
+        self.replayed = 0
+        self.skipped = 0
+        self.lag = 0.0  # Largest delay behind the recorded pace, in seconds
+
+    @staticmethod
+    def _handlers(target):
+        """Return event name -> callback for an MDSocket_io (its registered handlers) or any other object."""
+        emitter = getattr(target, "get_emitter", None)
+        registered = emitter().handlers.get("/", {}) if emitter is not None else {}
+        handlers = {}
+        for code in RECORDED_CODES:
+            for mode in ("full", "partial"):
+                event = f"{code}-json-{mode}"
+                handler = registered.get(event) or getattr(target, f"on_message{code}_json_{mode}", None)
+                if handler is not None:
+                    handlers[(code, mode == "partial")] = handler
+        return handlers
+
+    def replay(self, target):
+        """Replay every record into `target`; returns the wall-clock seconds taken."""
+        handlers = self._handlers(target)
+        started = time.perf_counter()
+        first = None
+        for path in self.paths:
+            for received, code, partial, payload in read_segment(path):
+                handler = handlers.get((code, bool(partial)))
+                if handler is None or (self.codes and code not in self.codes):
+                    self.skipped += 1
+                    continue
+                if self.speed:
+                    if first is None:
+                        first = received
+                    due = (received - first) / self.speed - (time.perf_counter() - started)
+                    if due > 0:
+                        time.sleep(due)
+                    else:
+                        self.lag = max(self.lag, -due)
+                handler(payload.decode("utf8"))
+                self.replayed += 1
+        return time.perf_counter() - started
+
+    def stats(self):
+        return {'replayed': self.replayed, 'skipped': self.skipped, 'lag_s': round(self.lag, 3)}
+
+
+class _Counter:
+    """Replay target that counts messages per code and per recorded second, for the command line."""
+
+    def __init__(self):
+        self.by_code = {}
+
+    def __getattr__(self, name):
+        if not name.startswith("on_message"):
+            raise AttributeError(name)
+        code = int(name[len("on_message"):len("on_message") + 4])
+
+        def on_message(data):
+            self.by_code[code] = self.by_code.get(code, 0) + 1
+        return on_message
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or replay recorded market data segments")
+    parser.add_argument("command", choices=("stats", "replay"))
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--speed", type=float, default=0, help="pace multiple of the recording, 0 for max")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        for path in args.paths:
+            per_second = {}
+            by_code = {}
+            records = payload_bytes = 0
+            for received, code, partial, payload in read_segment(path):
+                records += 1
+                payload_bytes += len(payload)
+                by_code[code] = by_code.get(code, 0) + 1
+                per_second[int(received)] = per_second.get(int(received), 0) + 1
+            peak = max(per_second.items(), key=lambda item: item[1]) if per_second else (0, 0)
+            print(f"{path}: {records} records, {payload_bytes / 1e6:.1f} MB of payload in "
+                  f"{os.path.getsize(path) / 1e6:.1f} MB, by code {by_code}, peak {peak[1]}/s at "
+                  f"{datetime.fromtimestamp(peak[0]):%H:%M:%S}")
+    else:
+        counter = _Counter()
+        replayer = TickReplayer(args.paths, speed=args.speed or None)
+        elapsed = replayer.replay(counter)
+        print(f"replayed {replayer.replayed} messages in {elapsed:.2f}s ({replayer.replayed / elapsed:.0f}/s), "
+              f"by code {counter.by_code}, {replayer.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+    tick_store.py
+
+    In-memory tick history per instrument, for charts and indicators.
+
+    Every instrument gets a TickRing of fixed capacity holding time, LTP, LTQ, bid, ask and volume in
+    preallocated arrays, so memory is known up front (TickRing.nbytes) and never grows. Each column is
+    stored twice, back to back ("mirrored"), which makes any window of up to `capacity` ticks one contiguous
+    run: `last` and `since` return memoryview slices of the arrays themselves, with no copy, that numpy can
+    wrap directly.
+
+        store = TickStore(capacity=4096)
+        store.record(message)                        # a decoded 1501/1502 message
+        ring = store.ring(2, 35003)
+        ltp = numpy.frombuffer(ring.last("ltp", 500))  # oldest first
+        store.history(2, 35003, 100)                 # {column: [values]}, copied, from any thread
+
+    A slice keeps pointing into the ring, so it is only valid until `capacity` more ticks of the instrument
+    have been written; copy it (bytes(), numpy.array, array(...)) to keep it longer.
+"""
+import threading
+from array import array
+from bisect import bisect_left
+
+# XTS timestamps count seconds from 1980-01-01
+XTS_EPOCH_OFFSET = 315532800
+
+# Column name -> array typecode
+COLUMNS = (("time", 'd'), ("ltp", 'd'), ("ltq", 'q'), ("bid", 'd'), ("ask", 'd'), ("volume", 'q'))
+
+
+class TickRing:
+    """Fixed-capacity tick history of one instrument."""
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.count = 0  # Ticks written since creation; the newest is at (count - 1) % capacity
+        self.columns = {name: array(typecode, bytes(array(typecode).itemsize * 2 * capacity))
+                        for name, typecode in COLUMNS}
+        self._views = {name: memoryview(column) for name, column in self.columns.items()}
+        self._time = self.columns["time"]
+        self._ltp = self.columns["ltp"]
+        self._ltq = self.columns["ltq"]
+        self._bid = self.columns["bid"]
+        self._ask = self.columns["ask"]
+        self._volume = self.columns["volume"]
+
+    @property
+    def nbytes(self):
+        return sum(column.itemsize * len(column) for column in self.columns.values())
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, time, ltp, ltq, bid, ask, volume):
+        """Write one tick, replacing the oldest once the ring is full."""
+        index = self.count % self.capacity
+        mirror = index + self.capacity
+        self._time[index] = self._time[mirror] = time
+        self._ltp[index] = self._ltp[mirror] = ltp
+        self._ltq[index] = self._ltq[mirror] = ltq
+        self._bid[index] = self._bid[mirror] = bid
+        self._ask[index] = self._ask[mirror] = ask
+        self._volume[index] = self._volume[mirror] = volume
+        self.count += 1
+
+    def last(self, column, n=None):
+        """Return the newest `n` values of a column (all held values by default), oldest first, without copying."""
+        held = len(self)
+        n = held if n is None else max(0, min(n, held))
+        end = self.count % self.capacity + (self.capacity if self.count >= self.capacity else 0)
+        return self._views[column][end - n:end]
+
+    def since(self, column, start_time):
+        """Return the values of a column for the ticks at or after `start_time` (epoch seconds), without copying."""
+        times = self.last("time")
+        return self.last(column, len(times) - bisect_left(times, start_time))
+
+    def newest(self):
+        """Return the newest tick as a (time, ltp, ltq, bid, ask, volume) tuple, or None if the ring is empty."""
+        if not self.count:
+            return None
+        index = (self.count - 1) % self.capacity
+        return (self._time[index], self._ltp[index], self._ltq[index], self._bid[index], self._ask[index],
+                self._volume[index])
+
+
+class TickStore:
+    """TickRings for every instrument that has ticked, fed from decoded 1501/1502 messages."""
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.rings = {}
+        self._lock = threading.Lock()
+
+        # Counters
+        self.recorded = 0
+        self.duplicates = 0
+
+    def ring(self, exchange_segment, exchange_instrument_id):
+        """Return the TickRing of an instrument, creating it on first use."""
+        key = (int(exchange_segment), int(exchange_instrument_id))
+        ring = self.rings.get(key)
+        if ring is None:
+            with self._lock:
+                ring = self.rings.get(key)
+                if ring is None:
+                    ring = self.rings[key] = TickRing(self.capacity)
+        return ring
+
+    def record(self, message):
+        """Store the touchline of a decoded 1501/1502 message; returns False if it was not a new tick."""
+        try:
+            touchline = message["Touchline"]
+            ring = self.ring(message["ExchangeSegment"], message["ExchangeInstrumentID"])
+            bid = touchline.get("BidInfo") or {}
+            ask = touchline.get("AskInfo") or {}
+            tick = ((touchline.get("LastUpdateTime") or 0) + XTS_EPOCH_OFFSET,
+                    float(touchline.get("LastTradedPrice") or 0.0),
+                    int(touchline.get("LastTradedQunatity") or 0),
+                    float(bid.get("Price") or 0.0),
+                    float(ask.get("Price") or 0.0),
+                    int(touchline.get("TotalTradedQuantity") or 0))
+        except (KeyError, TypeError, ValueError):
+            return False
+
+        # The same update arrives twice when an instrument is subscribed with both 1501 and 1502
+        if ring.newest() == tick:
+            self.duplicates += 1
+            return False
+        ring.append(*tick)
+        self.recorded += 1
+        return True
+
+    def history(self, exchange_segment, exchange_instrument_id, n=None):
+        """Return a copy of the newest `n` ticks of an instrument as {column: [values]}, or None if it has none."""
+        ring = self.rings.get((int(exchange_segment), int(exchange_instrument_id)))
+        if ring is None:
+            return None
+        return {name: ring.last(name, n).tolist() for name, _ in COLUMNS}
+
+    def drop(self, exchange_segment, exchange_instrument_id):
+        """Release the history of an instrument."""
+        with self._lock:
+            self.rings.pop((int(exchange_segment), int(exchange_instrument_id)), None)
+
+    def stats(self):
+        return {'instruments': len(self.rings), 'recorded': self.recorded, 'duplicates': self.duplicates,
+                'bytes': sum(ring.nbytes for ring in self.rings.values())}
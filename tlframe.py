@@ -4,6 +4,8 @@ from PyQt5.QtWidgets import QFrame, QVBoxLayout, QHBoxLayout, QLabel, QPushButto
 from PyQt5.QtCore import pyqtSignal, Qt
 from fetch import Application  # Import the Application class from fetch.py
 from shared_resources import subscribed_instruments  # Import the shared subscribed_instruments set
+from table_model import set_cell_text  # Reuses cell items on tick updates
+import tick_dispatcher
 
 
 class TopLeftFrame(QFrame):
@@ -12,10 +14,11 @@ class TopLeftFrame(QFrame):
     def __init__(self, websocket_thread):
         super().__init__()
         self.websocket_thread = websocket_thread  # Use the centralized WebSocketClient
-        self.initUI()
 
-        # Connect WebSocketClient to handle responses
-        self.websocket_thread.response_received.connect(self.display_response)
+        # (segment code, InstrumentID) -> InstrumentID cell of the instrument's row
+        self.instrument_items = {}
+
+        self.initUI()
 
     def initUI(self):
         # Main layout for the TopLeftFrame
@@ -122,6 +125,7 @@ class TopLeftFrame(QFrame):
             table_data.append(row_data)
 
         self.data_submitted.emit([strategy_name, table_data])
+        self.untrack_all()
         self.top_left_table.clearContents()
         self.top_left_table.setRowCount(0)
 
@@ -133,6 +137,7 @@ class TopLeftFrame(QFrame):
 
     def on_reset_clicked(self):
         """Handle the Reset button click."""
+        self.untrack_all()
         self.top_left_table.clearContents()
         self.top_left_table.setRowCount(0)
         self.spread_value_label.setText("Spread Value: 0")
@@ -173,49 +178,61 @@ class TopLeftFrame(QFrame):
         self.top_left_table.setItem(row_position, 14, QTableWidgetItem("0"))  # Lot
         self.top_left_table.setItem(row_position, 15, QTableWidgetItem("0"))  # Price
 
-        # Automatically subscribe after adding the data to the table if not already subscribed
-        if exchange_instrument_id not in subscribed_instruments:  # Check if not already subscribed
-            exchange_segment = data.get('Exchange Segment', '')
-            segment_code = 1 if exchange_segment == "NSECM" else 2  # Adjust segment codes if needed
-            self.websocket_thread.send_subscription(segment_code, int(exchange_instrument_id))
+        # Route ticks of this instrument to display_response
+        exchange_segment = data.get('Exchange Segment', '')
+        segment_code = tick_dispatcher.segment_code(exchange_segment)
+        if segment_code is not None and str(exchange_instrument_id).isdigit():
+            self.instrument_items[(segment_code, int(exchange_instrument_id))] = self.top_left_table.item(row_position, 7)
+            self.websocket_thread.dispatcher.register(segment_code, exchange_instrument_id, self.display_response)
+
+            # Automatically subscribe after adding the data to the table if not already subscribed
+            if (segment_code, int(exchange_instrument_id)) not in subscribed_instruments:  # Check if not already subscribed
+                self.websocket_thread.send_subscription(segment_code, int(exchange_instrument_id))
 
-            # Add the instrument to the shared subscribed_instruments set
-            subscribed_instruments.add(exchange_instrument_id)
+                # Add the instrument to the shared subscribed_instruments set
+                subscribed_instruments.add((segment_code, int(exchange_instrument_id)))
+        else:
+            print(f"Not subscribing to {exchange_segment} {exchange_instrument_id}: unknown instrument")
 
         # Recalculate values after adding a row
         self.calculate_spread_value()
         self.calculate_net_premium()
 
-    def display_response(self, message):
-        """Update the CMP and Last Traded Price (Price) based on WebSocket responses."""
-        try:
-            message_data = json.loads(message)
-            if "Touchline" in message_data and "ExchangeInstrumentID" in message_data:
-                instrument_id = str(message_data["ExchangeInstrumentID"])
-                bid_price = message_data["Touchline"]["BidInfo"].get("Price", "0.0")
-                ask_price = message_data["Touchline"]["AskInfo"].get("Price", "0.0")
-                last_traded_price = message_data["Touchline"].get("LastTradedPrice", "0.0")
-
-                # Find the row corresponding to the instrument ID
-                for row in range(self.top_left_table.rowCount()):
-                    if self.top_left_table.item(row, 7).text() == instrument_id:
-                        action = self.top_left_table.item(row, 0).text()  # Get the action (Buy/Sell)
-
-                        # Update the CMP (Column 13) based on Buy or Sell action
-                        if action == "Buy":
-                            self.top_left_table.setItem(row, 13, QTableWidgetItem(str(ask_price)))  # Set Ask Price as CMP
-                        elif action == "Sell":
-                            self.top_left_table.setItem(row, 13, QTableWidgetItem(str(bid_price)))  # Set Bid Price as CMP
-
-                        # Update the Last Traded Price (Column 15)
-                        self.top_left_table.setItem(row, 15, QTableWidgetItem(str(last_traded_price)))
-
-                        # Recalculate Spread Value and Net Premium after updating the price
-                        self.calculate_spread_value()
-                        self.calculate_net_premium()
-                        break
-        except json.JSONDecodeError:
-            pass  # Ignore JSON decode errors
+    def display_response(self, tick):
+        """Update the CMP and Last Traded Price (Price) from a dispatched tick."""
+        item = self.instrument_items.get(tick.key)
+        if item is None:
+            return
+        row = self.top_left_table.row(item)
+        if row < 0:
+            return
+        action = self.top_left_table.item(row, 0).text()  # Get the action (Buy/Sell)
+
+        # Update the CMP (Column 13) based on Buy or Sell action
+        if action == "Buy":
+            set_cell_text(self.top_left_table, row, 13, str(tick.ask_price))  # Set Ask Price as CMP
+        elif action == "Sell":
+            set_cell_text(self.top_left_table, row, 13, str(tick.bid_price))  # Set Bid Price as CMP
+
+        # Update the Last Traded Price (Column 15)
+        set_cell_text(self.top_left_table, row, 15, str(tick.ltp))
+
+        # Recalculate Spread Value and Net Premium after updating the price
+        self.calculate_spread_value()
+        self.calculate_net_premium()
+
+    def untrack_row(self, row):
+        """Stop routing ticks to a row that is about to be removed."""
+        id_item = self.top_left_table.item(row, 7)
+        for key, item in list(self.instrument_items.items()):
+            if item is id_item:
+                del self.instrument_items[key]
+                self.websocket_thread.dispatcher.unregister(key[0], key[1], self.display_response)
+
+    def untrack_all(self):
+        """Stop routing ticks to this table before it is cleared."""
+        self.instrument_items.clear()
+        self.websocket_thread.dispatcher.unregister_all(self.display_response)
 
     def on_cell_changed(self, row, column):
         """Handle cell changes, especially for the Lot column."""
@@ -228,6 +245,7 @@ class TopLeftFrame(QFrame):
         if event.key() == Qt.Key_Delete:
             selected_rows = sorted(set(index.row() for index in self.top_left_table.selectedIndexes()))
             for row in reversed(selected_rows):  # Delete rows from bottom to top to avoid reindexing issues
+                self.untrack_row(row)
                 self.top_left_table.removeRow(row)
             # Recalculate values after rows are deleted
             self.calculate_spread_value()
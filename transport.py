@@ -0,0 +1,154 @@
+"""
+    transport.py
+
+    Pooled HTTP transport for the XTS Connect REST wrapper.
+
+    One requests.Session with a sized connection pool mounted for both http:// and https://. Connections
+    (and the TLS sessions on them) are kept alive and reused across calls, every call gets connect and read
+    timeouts for its route class, and the transport keeps counters about how well the pool is used.
+
+    :copyright:
+    :license: see LICENSE for details.
+"""
+import threading
+import time
+
+import requests
+
+from instrumentation import TimedHTTPAdapter, pop_connect_timings
+
+# Route classes
+ROUTE_ORDER = "order"
+ROUTE_MASTER = "master"
+ROUTE_DEFAULT = "default"
+
+# Routes that move large payloads (instrument master, historical candles)
+_MASTER_ROUTES = ("market.instruments.master", "market.instruments.ohlc")
+
+
+def route_class(route):
+    """Return the class of an XTS route name: order entry, bulk download or everything else."""
+    if route in _MASTER_ROUTES:
+        return ROUTE_MASTER
+    if route.startswith(("order.", "bracketorder.")):
+        return ROUTE_ORDER
+    return ROUTE_DEFAULT
+
+
+class PooledTransport:
+    """
+    Shared keep-alive session with per-route-class timeouts and pool statistics.
+
+    - `pool_connections` is the number of host pools to keep, `pool_maxsize` the connections kept per host.
+      At most `pool_maxsize` requests are in flight at once; further callers wait for a free slot instead of
+      opening connections the pool would throw away.
+    - `timeouts` maps a route class to a (connect, read) tuple in seconds. A read timeout of None
+      uses `default_timeout`.
+    """
+
+    DEFAULT_TIMEOUTS = {
+        ROUTE_ORDER: (3.05, None),
+        ROUTE_MASTER: (5, 120),
+        ROUTE_DEFAULT: (3.05, None),
+    }
+
+    def __init__(self, pool_connections=4, pool_maxsize=16, max_retries=0, pool_block=False, timeouts=None,
+                 default_timeout=7):
+        self.default_timeout = default_timeout
+        self.timeouts = dict(self.DEFAULT_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+
+        self.session = requests.Session()
+        self.adapter = TimedHTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                        max_retries=max_retries, pool_block=pool_block)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+        self.pool_maxsize = pool_maxsize
+        self._slots = threading.BoundedSemaphore(pool_maxsize)
+
+        # Counters
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def timeout_for(self, route):
+        """Return the (connect, read) timeout of a route."""
+        connect, read = self.timeouts.get(route_class(route), self.timeouts[ROUTE_DEFAULT])
+        return connect, read if read is not None else self.default_timeout
+
+    def request(self, route, method, url, **kwargs):
+        """
+        Send a request for an XTS route through the pool and return the requests.Response. Its
+        `connect_timings` are the (dns, connect, tls) milliseconds if a new connection was opened for it.
+
+        With stream=True the connection stays busy until the body is read, so the request keeps its slot
+        until the caller reads the body (json_codec.read_body does) or calls `response.release_slot()`.
+        """
+        kwargs.setdefault("timeout", self.timeout_for(route))
+        streamed = kwargs.get("stream", False)
+
+        started = time.perf_counter()
+        self._slots.acquire()
+        waited = time.perf_counter() - started
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        release = self._slot_releaser()
+        try:
+            pop_connect_timings()
+            response = self.session.request(method, url, **kwargs)
+            response.connect_timings = pop_connect_timings()
+        except BaseException:
+            release()
+            raise
+        response.release_slot = release
+        if not streamed:
+            release()  # The body has been read already
+        return response
+
+    def _slot_releaser(self):
+        """Return a function that gives back the slot of one request, once however often it is called."""
+        released = []
+
+        def release():
+            with self._lock:
+                if released:
+                    return
+                released.append(True)
+                self.in_flight -= 1
+            self._slots.release()
+
+        return release
+
+    def stats(self):
+        """Return the pool counters."""
+        created = idle = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            created += pool.num_connections
+            idle += sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0
+
+        with self._lock:
+            requests_sent = self.requests
+            return {
+                'requests': requests_sent,
+                'in_flight': self.in_flight,
+                'connections_created': created,
+                'open_connections': idle + self.in_flight,
+                'idle_connections': idle,
+                'reuse_ratio': 1.0 - created / requests_sent if requests_sent else 0.0,
+                'wait_avg_ms': self.wait_total / requests_sent * 1000 if requests_sent else 0.0,
+                'wait_max_ms': self.wait_max * 1000
+            }
+
+    def close(self):
+        """Close the pooled connections."""
+        self.session.close()
@@ -89,6 +89,24 @@ class WebSocketClientBackend:
             self._update_ui(f"Error placing order: {e}")
             return {"status": "error", "message": str(e)}
         
+    def place_orders(self, orders, max_in_flight=8):
+        """
+        Send a basket of orders to the order backend (backend_fastapi) in one request.
+        :param orders: A list of order dictionaries, as for place_order.
+        :param max_in_flight: Number of orders the server sends at the same time.
+        """
+        try:
+            response = requests.post("http://127.0.0.1:8000/place_orders",
+                                     json={"orders": orders, "max_in_flight": max_in_flight})
+            response.raise_for_status()
+            result = response.json()
+            self._update_ui(f"Orders placed: {result.get('succeeded')} succeeded, {result.get('failed')} failed "
+                            f"in {result.get('elapsed_ms', 0):.0f} ms")
+            return result
+        except requests.RequestException as e:
+            self._update_ui(f"Error placing orders: {e}")
+            return {"status": "error", "message": str(e)}
+
     def fetch_margin(self):
         """
         Fetch margin details from the API and return the netMarginAvailable value.
@@ -112,12 +112,9 @@ class WebSocketClient(QWidget):
                         data.get("OrderUniqueIdentifier", "N/A")
                     ]
 
-                    # Add the data into the respective columns
+                    # Add the data into the respective columns; the table repaints on the next event loop pass
                     for column, value in enumerate(column_data):
                         self.table.setItem(row_position, column, QTableWidgetItem(value))
 
-                    # Ensure the table updates immediately
-                    self.table.repaint()
-
             except json.JSONDecodeError:
                 print("Failed to decode JSON:", json_message)
@@ -0,0 +1,1102 @@
+"""
+    xts_simulator.py
+
+    Local stand-in for the XTS REST API and its market data and interactive socket.io servers, for load
+    and latency testing on a developer box.
+
+    It serves the REST routes of XTSConnect._routes, streams the 1501/1502/1505/1507/1510/1512 events read
+    by MDSocket_io (JSON, full and partial broadcast mode) and the order/trade/position events read by
+    OrderSocket_io. Prices follow a random walk at a configurable tick rate, and orders are matched against
+    the simulated touchline: market orders fill at once, limit orders when the price reaches them, stop
+    orders trigger on the last traded price, IOC orders that cannot fill are cancelled.
+
+        python xts_simulator.py --port 8080 --speed 10 --latency-ms 5 --jitter-ms 2
+
+    then point `root` under [root_url] in config.ini at http://localhost:8080. Any token is accepted, so
+    the tokens saved by the login flow work unchanged; tokens issued by the simulator's own login routes
+    expire after --token-ttl seconds, to exercise re-login.
+
+    :copyright:
+    :license: see LICENSE for details.
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import logging
+import math
+import random
+import time
+import uuid
+from urllib.parse import parse_qs
+
+import socketio
+from aiohttp import web
+
+from Connect import XTSConnect
+
+log = logging.getLogger(__name__)
+
+SEGMENT_CODES = {"NSECM": 1, "NSEFO": 2, "NSECD": 3, "BSECM": 11, "BSEFO": 12, "MCXFO": 51}
+SEGMENT_NAMES = {code: name for name, code in SEGMENT_CODES.items()}
+
+# XTS timestamps count seconds from 1980-01-01
+XTS_EPOCH_OFFSET = 315532800
+
+MARKET_DATA_CODES = (1501, 1502, 1505, 1507, 1510, 1512)
+PARTIAL_CODES = (1501, 1502, 1505, 1510, 1512)
+
+DEPTH_LEVELS = 5
+
+OPEN_STATUSES = ("PendingNew", "New", "Replaced", "PartiallyFilled")
+
+
+def xts_time(now=None):
+    return int(now if now is not None else time.time()) - XTS_EPOCH_OFFSET
+
+
+def order_time(now=None):
+    return datetime.datetime.fromtimestamp(now if now is not None else time.time()).strftime("%d-%m-%Y %H:%M:%S")
+
+
+def next_expiry(today=None):
+    """Return the next Thursday, the weekly index expiry."""
+    today = today or datetime.date.today()
+    return today + datetime.timedelta(days=(3 - today.weekday()) % 7 or 7)
+
+
+class _GatherManager(socketio.AsyncManager):
+    """
+    python-socketio 4 passes bare coroutines to asyncio.wait, which Python 3.11 refuses; gather them
+    instead. Version 5 already does, and is used as is.
+    """
+
+    async def emit(self, event, data, namespace, room=None, skip_sid=None, callback=None, **kwargs):
+        if namespace not in self.rooms or room not in self.rooms[namespace]:
+            return
+        skip_sid = skip_sid if isinstance(skip_sid, list) else [skip_sid]
+        await asyncio.gather(*[
+            self.server._emit_internal(sid, event, data, namespace,
+                                       self._generate_ack_id(sid, namespace, callback) if callback else None)
+            for sid in self.get_participants(namespace, room) if sid not in skip_sid])
+
+
+def _socket_server():
+    kwargs = {"async_mode": "aiohttp", "cors_allowed_origins": "*"}
+    if socketio.__version__.startswith("4."):
+        kwargs["client_manager"] = _GatherManager()
+    return socketio.AsyncServer(**kwargs)
+
+
+async def _maybe_await(result):
+    """Room calls return coroutines from python-socketio 5 and None from 4."""
+    if asyncio.iscoroutine(result):
+        await result
+
+
+def encode_partial(segment, instrument_id, fields):
+    """Encode partial broadcast fields as "t:<segment>_<id>,<name>:<value>,..."."""
+    return ",".join([f"t:{segment}_{instrument_id}"] + [f"{name.split('#')[0]}:{value}" for name, value in fields])
+
+
+########################################################################################################
+# Instruments
+########################################################################################################
+
+class SimInstrument:
+    """One tradable instrument with a random-walk price, a five level book and a running bar."""
+
+    def __init__(self, segment, instrument_id, name, series, price, lot_size=1, tick_size=0.05, expiry=None,
+                 strike=None, option_type=None, volatility=0.0004, rng=None):
+        self.segment = segment
+        self.instrument_id = instrument_id
+        self.name = name
+        self.series = series
+        self.lot_size = lot_size
+        self.tick_size = tick_size
+        self.expiry = expiry
+        self.strike = strike
+        self.option_type = option_type
+        self.volatility = volatility
+        self.rng = rng or random.Random()
+
+        self.close = self.round_price(price)
+        self.ltp = self.close
+        self.open = self.high = self.low = self.close
+        self.ltq = 0
+        self.volume = 0
+        self.turnover = 0.0
+        self.total_buy = self.total_sell = 0
+        self.open_interest = 0 if series in ("EQ", "INDEX") else lot_size * self.rng.randint(1000, 50000)
+        self.last_traded_time = self.last_update_time = xts_time()
+        self.bids = []
+        self.asks = []
+        self.bar = None
+        self.build_depth()
+
+    @property
+    def key(self):
+        return self.segment, self.instrument_id
+
+    @property
+    def display_name(self):
+        if self.option_type:
+            return f"{self.name} {self.expiry:%d%b%Y} {self.option_type} {self.strike:g}".upper()
+        if self.expiry:
+            return f"{self.name} {self.expiry:%d%b%Y} FUT".upper()
+        return self.name
+
+    def round_price(self, price):
+        return round(max(self.tick_size, round(price / self.tick_size) * self.tick_size), 2)
+
+    def build_depth(self):
+        spread = self.tick_size * self.rng.randint(1, 3)
+        best_bid = self.round_price(self.ltp - spread / 2)
+        best_ask = self.round_price(max(best_bid + self.tick_size, self.ltp + spread / 2))
+        lots = (1, 40) if self.series != "INDEX" else (0, 0)
+        self.bids = [[self.round_price(best_bid - level * self.tick_size), self.lot_size * self.rng.randint(*lots),
+                      self.rng.randint(1, 20)] for level in range(DEPTH_LEVELS)]
+        self.asks = [[self.round_price(best_ask + level * self.tick_size), self.lot_size * self.rng.randint(*lots),
+                      self.rng.randint(1, 20)] for level in range(DEPTH_LEVELS)]
+        self.total_buy = sum(level[1] for level in self.bids) * 20
+        self.total_sell = sum(level[1] for level in self.asks) * 20
+
+    def step(self, now, bar_seconds):
+        """Trade once at a new price and rebuild the book around it."""
+        self.ltp = self.round_price(self.ltp * math.exp(self.rng.gauss(0, self.volatility)))
+        self.ltq = 0 if self.series == "INDEX" else self.lot_size * self.rng.randint(1, 10)
+        self.volume += self.ltq
+        self.turnover += self.ltq * self.ltp
+        self.high = max(self.high, self.ltp)
+        self.low = min(self.low, self.ltp)
+        if self.open_interest and self.rng.random() < 0.1:
+            self.open_interest = max(0, self.open_interest + self.lot_size * self.rng.randint(-50, 50))
+        self.last_traded_time = self.last_update_time = xts_time(now)
+        self.build_depth()
+
+        bar_time = int(now // bar_seconds * bar_seconds)
+        if self.bar is None or self.bar["time"] != bar_time:
+            self.bar = {"time": bar_time, "open": self.ltp, "high": self.ltp, "low": self.ltp, "volume": 0}
+        self.bar["high"] = max(self.bar["high"], self.ltp)
+        self.bar["low"] = min(self.bar["low"], self.ltp)
+        self.bar["volume"] += self.ltq
+
+    def best_bid(self):
+        return self.bids[0][0]
+
+    def best_ask(self):
+        return self.asks[0][0]
+
+    ####################################################################################################
+    # Broadcast messages
+    ####################################################################################################
+
+    def _header(self, code):
+        return {"MessageCode": code, "MessageVersion": 4, "ApplicationType": 0, "TokenID": 0,
+                "ExchangeSegment": self.segment, "ExchangeInstrumentID": self.instrument_id,
+                "ExchangeTimeStamp": self.last_update_time}
+
+    @staticmethod
+    def _level(level):
+        return {"Size": level[1], "Price": level[0], "TotalOrders": level[2], "BuyBackMarketMaker": 0}
+
+    def touchline(self):
+        return {
+            "BidInfo": self._level(self.bids[0]),
+            "AskInfo": self._level(self.asks[0]),
+            "LastTradedPrice": self.ltp,
+            "LastTradedQunatity": self.ltq,
+            "TotalBuyQuantity": self.total_buy,
+            "TotalSellQuantity": self.total_sell,
+            "TotalTradedQuantity": self.volume,
+            "AverageTradedPrice": round(self.turnover / self.volume, 2) if self.volume else self.ltp,
+            "LastTradedTime": self.last_traded_time,
+            "LastUpdateTime": self.last_update_time,
+            "PercentChange": round((self.ltp - self.close) / self.close * 100, 2),
+            "Open": self.open,
+            "High": self.high,
+            "Low": self.low,
+            "Close": self.close,
+            "TotalValueTraded": round(self.turnover, 2),
+        }
+
+    def message(self, code):
+        """Return the full broadcast message of an XTS message code."""
+        message = self._header(code)
+        if code == 1501:
+            message["Touchline"] = self.touchline()
+        elif code == 1502:
+            message.update({"Bids": [self._level(level) for level in self.bids],
+                            "Asks": [self._level(level) for level in self.asks],
+                            "Touchline": self.touchline(), "BookType": 1, "XMarketType": 1})
+        elif code == 1505:
+            bar = self.bar or {"time": int(time.time()), "open": self.ltp, "high": self.ltp, "low": self.ltp,
+                               "volume": 0}
+            message.update({"BarTime": xts_time(bar["time"]), "BarVolume": bar["volume"],
+                            "OpenInterest": self.open_interest, "SumOfQtyInToPrice": 0,
+                            "Open": bar["open"], "High": bar["high"], "Low": bar["low"], "Close": self.ltp})
+        elif code == 1507:
+            message.update({"MarketType": 1, "TradingSession": 2, "message": "Normal market open"})
+        elif code == 1510:
+            message.update({"XTSMarketType": 1, "OpenInterest": self.open_interest})
+        elif code == 1512:
+            message.update({"LastTradedPrice": self.ltp, "LastTradedQunatity": self.ltq,
+                            "LastUpdateTime": self.last_update_time})
+        return message
+
+    def partial_fields(self, code):
+        """Return the (name, value) pairs of a partial broadcast message; depth levels are keyed by level."""
+        if code in (1501, 1502):
+            fields = [("ltp", self.ltp), ("ltq", self.ltq), ("tb", self.total_buy), ("ts", self.total_sell),
+                      ("v", self.volume), ("ap", round(self.turnover / self.volume, 2) if self.volume else self.ltp),
+                      ("ltt", self.last_traded_time), ("lut", self.last_update_time),
+                      ("pc", round((self.ltp - self.close) / self.close * 100, 2)),
+                      ("o", self.open), ("h", self.high), ("l", self.low), ("c", self.close)]
+            levels = DEPTH_LEVELS if code == 1502 else 1
+            for level in range(levels):
+                bid, ask = self.bids[level], self.asks[level]
+                fields.append((f"bi#{level}", f"{level}|{bid[1]}|{bid[0]}|{bid[2]}"))
+                fields.append((f"ai#{level}", f"{level}|{ask[1]}|{ask[0]}|{ask[2]}"))
+            return fields
+        if code == 1505:
+            bar = self.bar or {"time": int(time.time()), "open": self.ltp, "high": self.ltp, "low": self.ltp,
+                               "volume": 0}
+            return [("bt", xts_time(bar["time"])), ("o", bar["open"]), ("h", bar["high"]), ("l", bar["low"]),
+                    ("c", self.ltp), ("bv", bar["volume"]), ("oi", self.open_interest)]
+        if code == 1510:
+            return [("oi", self.open_interest)]
+        if code == 1512:
+            return [("ltp", self.ltp), ("ltq", self.ltq), ("lut", self.last_update_time)]
+        return []
+
+    ####################################################################################################
+    # Instrument metadata
+    ####################################################################################################
+
+    def master_row(self):
+        """Return the instrument as a pipe-delimited master row (19 columns, as read by fetch.py)."""
+        segment = SEGMENT_NAMES[self.segment]
+        expiry = f"{self.expiry:%Y-%m-%d}T14:30:00" if self.expiry else "1970-01-01T00:00:00"
+        option_type = {"CE": 3, "PE": 4}.get(self.option_type, 1)
+        band = (self.round_price(self.close * 1.2), self.round_price(self.close * 0.8))
+        return "|".join(str(value) for value in (
+            segment, self.instrument_id, 8 if self.segment != 1 else 8, self.name, self.display_name,
+            self.series, f"{self.name}-{self.series}", 2_000_000_000 + self.instrument_id, band[0], band[1],
+            self.lot_size * 72, self.tick_size, self.lot_size, 1, -1 if not self.expiry else 26000,
+            self.name if self.expiry else "", expiry, f"{self.strike:g}" if self.strike else "", option_type))
+
+    def search_result(self):
+        return {
+            "ExchangeSegment": self.segment,
+            "ExchangeInstrumentID": self.instrument_id,
+            "InstrumentType": 8,
+            "Name": self.name,
+            "DisplayName": self.display_name,
+            "Description": self.display_name,
+            "Series": self.series,
+            "LotSize": self.lot_size,
+            "TickSize": self.tick_size,
+            "ContractExpiration": f"{self.expiry:%Y-%m-%d}T14:30:00" if self.expiry else None,
+            "StrikePrice": self.strike,
+            "OptionType": self.option_type,
+            "PriceBand": {"High": self.round_price(self.close * 1.2), "Low": self.round_price(self.close * 0.8)},
+        }
+
+
+def default_instruments(extra_strikes=0, rng=None):
+    """A few equities, the NIFTY index, its future and options around the money."""
+    rng = rng or random.Random()
+    instruments = [
+        SimInstrument(1, 22, "ACC", "EQ", 2300, rng=rng),
+        SimInstrument(1, 1333, "HDFCBANK", "EQ", 1650, rng=rng),
+        SimInstrument(1, 1594, "INFY", "EQ", 1800, rng=rng),
+        SimInstrument(1, 2885, "RELIANCE", "EQ", 2450, rng=rng),
+        SimInstrument(1, 11536, "TCS", "EQ", 3900, rng=rng),
+        SimInstrument(1, 26000, "NIFTY 50", "INDEX", 24000, rng=rng),
+        SimInstrument(1, 26001, "NIFTY BANK", "INDEX", 51000, rng=rng),
+    ]
+    expiry = next_expiry()
+    instruments.append(SimInstrument(2, 35003, "NIFTY", "FUTIDX", 24050, lot_size=25, expiry=expiry, rng=rng))
+    instruments.append(SimInstrument(2, 35004, "BANKNIFTY", "FUTIDX", 51100, lot_size=15, expiry=expiry, rng=rng))
+
+    instrument_id = 40000
+    strikes = 5 + extra_strikes
+    for strike in range(24000 - strikes * 100, 24000 + strikes * 100 + 1, 100):
+        for option_type in ("CE", "PE"):
+            intrinsic = max(0, 24000 - strike) if option_type == "CE" else max(0, strike - 24000)
+            price = intrinsic + 120 * math.exp(-abs(strike - 24000) / 400)
+            instruments.append(SimInstrument(2, instrument_id, "NIFTY", "OPTIDX", price, lot_size=25,
+                                             expiry=expiry, strike=strike, option_type=option_type,
+                                             volatility=0.003, rng=rng))
+            instrument_id += 1
+    return instruments
+
+
+########################################################################################################
+# Server
+########################################################################################################
+
+def _authorised(handler):
+    """Answer "Invalid Token" unless the request carries a live token; pass the session and parameters on."""
+    async def wrapper(self, request):
+        session = self._session(request)
+        if session is None:
+            return self._error("Invalid Token", code="e-session-0002")
+        return await handler(self, request, session, await self._params(request))
+    wrapper.__name__ = handler.__name__
+    return wrapper
+
+
+class XTSSimulator:
+    """
+    REST and socket.io stand-in for an XTS server.
+
+    - `latency_ms` and `jitter_ms` delay every REST response by latency +/- a uniform jitter.
+    - `tick_rate` is the number of trades per second per subscribed instrument at `speed` 1; `speed` also
+      shortens the bar interval of 1505 candles, so speed 10 replays a market ten times as busy.
+    - `token_ttl` expires tokens issued by the login routes after that many seconds (0 keeps them).
+    """
+
+    def __init__(self, instruments=None, latency_ms=0.0, jitter_ms=0.0, tick_rate=2.0, speed=1.0, bar_seconds=60,
+                 token_ttl=0, user_id="SIMUSER", seed=None):
+        self.rng = random.Random(seed)
+        self.instruments = {instrument.key: instrument for instrument in
+                            (instruments or default_instruments(rng=self.rng))}
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tick_rate = tick_rate
+        self.speed = speed
+        self.bar_seconds = bar_seconds
+        self.token_ttl = token_ttl
+        self.user_id = user_id
+
+        # Sessions: token -> {"userID", "kind", "expires"}
+        self.sessions = {}
+
+        # Market data: token -> set of (code, key) subscribed; socket sid -> (token, broadcast mode)
+        self.subscriptions = {}
+        self.market_sids = {}
+        self.rooms = {}  # room -> set of sids
+        self.partial_state = {}  # (code, key) -> {field name: last value sent}
+
+        # Orders: AppOrderID -> order dict; trades and positions by userID
+        self.order_ids = itertools.count(int(time.time()) % 100000 * 10000)
+        self.execution_ids = itertools.count(1)
+        self.orders = {}
+        self.order_history = {}
+        self.trades = {}
+        self.positions = {}
+
+        # Counters
+        self.rest_requests = 0
+        self.ticks = 0
+        self.messages = 0
+
+        self.market_sio = _socket_server()
+        self.order_sio = _socket_server()
+        self.app = web.Application(middlewares=[self._latency_middleware])
+        self.market_sio.attach(self.app, socketio_path="apimarketdata/socket.io")
+        self.order_sio.attach(self.app, socketio_path="interactive/socket.io")
+        self.market_sio.on("connect", self.on_market_connect)
+        self.market_sio.on("disconnect", self.on_market_disconnect)
+        self.order_sio.on("connect", self.on_order_connect)
+        self._add_routes()
+        self.app.on_startup.append(self._start_ticker)
+        self.app.on_cleanup.append(self._stop_ticker)
+        self._ticker = None
+
+    ####################################################################################################
+    # Plumbing
+    ####################################################################################################
+
+    @web.middleware
+    async def _latency_middleware(self, request, handler):
+        if request.path.startswith(("/apimarketdata/socket.io", "/interactive/socket.io")):
+            return await handler(request)
+        self.rest_requests += 1
+        delay = self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        return await handler(request)
+
+    def _add_routes(self):
+        handlers = {
+            "user.login": ("POST", self.interactive_login),
+            "user.logout": ("DELETE", self.logout),
+            "user.profile": ("GET", self.profile),
+            "user.balance": ("GET", self.balance),
+            "order.status": ("GET", self.order_book),
+            "order.place": ("POST", self.place_order),
+            "order.modify": ("PUT", self.modify_order),
+            "order.cancel": ("DELETE", self.cancel_order),
+            "order.cancelall": ("POST", self.cancel_all),
+            "bracketorder.place": ("POST", self.place_bracket_order),
+            "bracketorder.modify": ("PUT", self.modify_order),
+            "bracketorder.cancel": ("DELETE", self.cancel_order),
+            "order.place.cover": ("POST", self.place_cover_order),
+            "order.exit.cover": ("PUT", self.exit_cover_order),
+            "trades": ("GET", self.trade_book),
+            "order.dealer.status": ("GET", self.order_book),
+            "dealer.trades": ("GET", self.trade_book),
+            "portfolio.positions": ("GET", self.position_book),
+            "portfolio.dealerpositions": ("GET", self.position_book),
+            "portfolio.holdings": ("GET", self.holdings),
+            "portfolio.positions.convert": ("PUT", self.convert_position),
+            "portfolio.squareoff": ("PUT", self.squareoff),
+            "market.login": ("POST", self.market_login),
+            "market.logout": ("DELETE", self.logout),
+            "market.config": ("GET", self.client_config),
+            "market.instruments.master": ("POST", self.master),
+            "market.instruments.subscription": ("POST", self.subscribe),
+            "market.instruments.unsubscription": ("PUT", self.unsubscribe),
+            "market.instruments.ohlc": ("GET", self.ohlc),
+            "market.instruments.indexlist": ("GET", self.index_list),
+            "market.instruments.quotes": ("POST", self.quotes),
+            "market.search.instrumentsbyid": ("POST", self.search_by_id),
+            "market.search.instrumentsbystring": ("GET", self.search_by_string),
+            "market.instruments.instrument.series": ("GET", self.series),
+            "market.instruments.instrument.equitysymbol": ("GET", self.equity_symbol),
+            "market.instruments.instrument.futuresymbol": ("GET", self.future_symbol),
+            "market.instruments.instrument.optionsymbol": ("GET", self.option_symbol),
+            "market.instruments.instrument.optiontype": ("GET", self.option_type),
+            "market.instruments.instrument.expirydate": ("GET", self.expiry_date),
+        }
+        registered = set()
+        for route, (method, handler) in handlers.items():
+            path = "/" + XTSConnect._routes[route].lstrip("/")
+            if (method, path) not in registered:  # Routes sharing a method and path share a handler
+                registered.add((method, path))
+                self.app.router.add_route(method, path, handler)
+
+    @staticmethod
+    def _response(result, code="s-response-0001", description="Request successful"):
+        return web.json_response({"type": "success", "code": code, "description": description, "result": result},
+                                 dumps=lambda data: json.dumps(data, separators=(",", ":")))
+
+    @staticmethod
+    def _error(description, code="e-response-0005", status=400, result=None):
+        return web.json_response({"type": "error", "code": code, "description": description,
+                                  "result": result if result is not None else {}}, status=status)
+
+    @staticmethod
+    async def _params(request):
+        """Return the query parameters merged with a JSON or form body."""
+        params = dict(request.query)
+        body = await request.read()
+        if body:
+            try:
+                params.update(json.loads(body))
+            except ValueError:
+                params.update({key: values[-1] for key, values in parse_qs(body.decode("utf8")).items()})
+        return params
+
+    def _session(self, request):
+        """Return the session of the request's token, or None if it is missing or expired."""
+        token = request.headers.get("Authorization")
+        if not token:
+            return None
+        session = self.sessions.get(token)
+        if session is None:
+            # A token issued elsewhere (the login flow), accepted as is
+            session = self.sessions[token] = {"userID": self.user_id, "kind": "external", "expires": None}
+        if session["expires"] is not None and session["expires"] < time.time():
+            return None
+        return session
+
+    def _instrument(self, segment, instrument_id):
+        segment = SEGMENT_CODES.get(segment, segment)
+        try:
+            return self.instruments.get((int(segment), int(instrument_id)))
+        except (TypeError, ValueError):
+            return None
+
+    ####################################################################################################
+    # Sessions
+    ####################################################################################################
+
+    def _login(self, kind, params):
+        if not params.get("appKey") or not params.get("secretKey"):
+            return self._error("Invalid appKey or secretKey", code="e-session-0001")
+        token = uuid.uuid4().hex
+        self.sessions[token] = {"userID": self.user_id, "kind": kind,
+                                "expires": time.time() + self.token_ttl if self.token_ttl else None}
+        result = {"token": token, "userID": self.user_id, "appVersion": "simulator",
+                  "application_expiry_date": "31-12-2099"}
+        if kind == "interactive":
+            result.update({"isInvestorClient": True, "clientCodes": [self.user_id], "exchangeSegmentArray": []})
+        return self._response(result, code="s-user-0001", description="Valid User.")
+
+    async def interactive_login(self, request):
+        return self._login("interactive", await self._params(request))
+
+    async def market_login(self, request):
+        return self._login("market", await self._params(request))
+
+    @_authorised
+    async def logout(self, request, session, params):
+        self.sessions.pop(request.headers.get("Authorization"), None)
+        return self._response({}, description="User logged out successfully")
+
+    @_authorised
+    async def profile(self, request, session, params):
+        return self._response({"ClientId": session["userID"], "ClientName": "Simulated Client",
+                               "EmailId": "", "MobileNo": "", "PAN": "", "IncludeInAutoSquareoff": False,
+                               "ClientExchangeDetailsList": {name: {"ClientCode": session["userID"],
+                                                                    "Enabled": True} for name in SEGMENT_CODES}})
+
+    @_authorised
+    async def balance(self, request, session, params):
+        limits = {"AccountID": session["userID"], "marginAvailable": {"CashMarginAvailable": "1000000"},
+                  "marginUtilized": {"MTMUnrealized": "0", "MTMRealized": "0"}}
+        return self._response({"BalanceList": [{"limitHeader": "ALL|ALL|ALL", "limitObject": limits}]})
+
+    ####################################################################################################
+    # Market data REST
+    ####################################################################################################
+
+    @_authorised
+    async def client_config(self, request, session, params):
+        return self._response({
+            "exchangeSegments": SEGMENT_CODES,
+            "xtsMessageCode": {"touchlineEvent": 1501, "marketDepthEvent": 1502, "candleDataEvent": 1505,
+                               "exchangeTradingStatusEvent": 1507, "openInterestEvent": 1510,
+                               "marketDepth100Event": 1512, "indexDataEvent": 1504},
+            "publishFormat": ["Binary", "JSON"],
+            "broadCastMode": ["Full", "Partial"],
+            "instrumentType": {"1": "Futures", "2": "Options", "4": "Spread", "8": "Equity"},
+        })
+
+    @_authorised
+    async def master(self, request, session, params):
+        segments = {SEGMENT_CODES.get(segment, segment) for segment in params.get("exchangeSegmentList", [])}
+        rows = [instrument.master_row() for instrument in self.instruments.values()
+                if not segments or instrument.segment in segments]
+        return self._response("\n".join(rows), code="s-master-0001")
+
+    def _requested(self, params):
+        """Return the simulated instruments named in params["instruments"], skipping unknown ones."""
+        found = []
+        for item in params.get("instruments", []):
+            instrument = self._instrument(item.get("exchangeSegment"), item.get("exchangeInstrumentID"))
+            if instrument is not None:
+                found.append(instrument)
+        return found
+
+    @_authorised
+    async def quotes(self, request, session, params):
+        code = int(params.get("xtsMessageCode", 1502))
+        instruments = self._requested(params)
+        return self._response({
+            "mdp": code,
+            "quotesList": [{"exchangeSegment": i.segment, "exchangeInstrumentID": i.instrument_id}
+                           for i in instruments],
+            "listQuotes": [json.dumps(instrument.message(code)) for instrument in instruments],
+        }, code="s-quotes-0001", description="Get quotes successfully!")
+
+    @_authorised
+    async def subscribe(self, request, session, params):
+        code = int(params.get("xtsMessageCode", 1501))
+        token = request.headers.get("Authorization")
+        instruments = self._requested(params)
+        subscribed = self.subscriptions.setdefault(token, set())
+        for instrument in instruments:
+            subscribed.add((code, instrument.key))
+        for sid, (sid_token, mode) in list(self.market_sids.items()):
+            if sid_token == token:
+                for instrument in instruments:
+                    await self._join(sid, code, instrument.key, mode)
+        return self._response({
+            "mdp": code,
+            "quotesList": [{"exchangeSegment": i.segment, "exchangeInstrumentID": i.instrument_id}
+                           for i in instruments],
+            "listQuotes": [json.dumps(instrument.message(code)) for instrument in instruments],
+            "Remaining_Subscription_Count": 1000 - len(subscribed),
+        }, code="s-subscription-0001", description="Instrument subscribed successfully!")
+
+    @_authorised
+    async def unsubscribe(self, request, session, params):
+        code = int(params.get("xtsMessageCode", 1501))
+        token = request.headers.get("Authorization")
+        instruments = self._requested(params)
+        subscribed = self.subscriptions.setdefault(token, set())
+        for instrument in instruments:
+            subscribed.discard((code, instrument.key))
+        for sid, (sid_token, mode) in list(self.market_sids.items()):
+            if sid_token == token:
+                for instrument in instruments:
+                    await self._leave(sid, code, instrument.key, mode)
+        return self._response({"mdp": code, "unsubList": [{"exchangeSegment": i.segment,
+                                                           "exchangeInstrumentID": i.instrument_id}
+                                                          for i in instruments]},
+                              code="s-unsubscription-0001", description="Instrument unsubscribed successfully!")
+
+    @_authorised
+    async def ohlc(self, request, session, params):
+        instrument = self._instrument(params.get("exchangeSegment"), params.get("exchangeInstrumentID"))
+        if instrument is None:
+            return self._error("Bad Request", result={"errors": ["Unknown instrument"]})
+        try:
+            start = datetime.datetime.strptime(params["startTime"], "%b %d %Y %H%M%S")
+            end = datetime.datetime.strptime(params["endTime"], "%b %d %Y %H%M%S")
+            step = max(1, int(params.get("compressionValue", 60)))
+        except (KeyError, ValueError):
+            return self._error("Bad Request", result={"errors": ["Invalid startTime, endTime or compressionValue"]})
+
+        rng = random.Random(f"{instrument.key}-{start}-{step}")  # The same request returns the same bars
+        bars = []
+        price = instrument.close
+        moment = int(start.timestamp())
+        while moment < end.timestamp() and len(bars) < 5000:
+            open_price = price
+            close_price = instrument.round_price(price * math.exp(rng.gauss(0, instrument.volatility * 5)))
+            high = max(open_price, close_price) + instrument.tick_size * rng.randint(0, 4)
+            low = min(open_price, close_price) - instrument.tick_size * rng.randint(0, 4)
+            bars.append(f"{moment}|{open_price}|{round(high, 2)}|{round(low, 2)}|{close_price}|"
+                        f"{instrument.lot_size * rng.randint(10, 500)}|{instrument.open_interest}|")
+            price = close_price
+            moment += step
+        return self._response({"exchangeSegment": SEGMENT_NAMES[instrument.segment],
+                               "exchangeInstrumentID": instrument.instrument_id,
+                               "dataReponse": ",".join(bars) + ("," if bars else "")},
+                              code="s-instrument-0002", description="Data found")
+
+    @_authorised
+    async def index_list(self, request, session, params):
+        segment = SEGMENT_CODES.get(params.get("exchangeSegment"), params.get("exchangeSegment"))
+        indexes = [f"{i.name}_{i.instrument_id}" for i in self.instruments.values()
+                   if i.series == "INDEX" and str(i.segment) == str(segment)]
+        return self._response({"exchangeSegment": segment, "indexList": indexes})
+
+    @_authorised
+    async def search_by_id(self, request, session, params):
+        return self._response([instrument.search_result() for instrument in self._requested(params)])
+
+    @_authorised
+    async def search_by_string(self, request, session, params):
+        text = str(params.get("searchString", "")).upper()
+        return self._response([i.search_result() for i in self.instruments.values() if text in i.display_name][:50])
+
+    def _matching(self, params):
+        segment = SEGMENT_CODES.get(params.get("exchangeSegment"), params.get("exchangeSegment"))
+        series = params.get("series")
+        symbol = params.get("symbol")
+        expiry = params.get("expiryDate")
+        for instrument in self.instruments.values():
+            if str(instrument.segment) != str(segment):
+                continue
+            if series and instrument.series != series:
+                continue
+            if symbol and instrument.name != symbol:
+                continue
+            if expiry and (not instrument.expiry or f"{instrument.expiry:%d%b%Y}".upper() != expiry.upper()):
+                continue
+            yield instrument
+
+    @_authorised
+    async def series(self, request, session, params):
+        return self._response(sorted({i.series for i in self._matching({"exchangeSegment":
+                                                                         params.get("exchangeSegment")})}))
+
+    @_authorised
+    async def equity_symbol(self, request, session, params):
+        return self._response([i.search_result() for i in self._matching(params)])
+
+    @_authorised
+    async def expiry_date(self, request, session, params):
+        return self._response(sorted({f"{i.expiry:%Y-%m-%d}T14:30:00" for i in self._matching(params) if i.expiry}))
+
+    @_authorised
+    async def future_symbol(self, request, session, params):
+        return self._response([i.search_result() for i in self._matching(params) if not i.option_type])
+
+    @_authorised
+    async def option_symbol(self, request, session, params):
+        return self._response([i.search_result() for i in self._matching(params)
+                               if i.option_type == params.get("optionType")
+                               and str(i.strike) == str(params.get("strikePrice"))])
+
+    @_authorised
+    async def option_type(self, request, session, params):
+        return self._response(sorted({i.option_type for i in self._matching(params) if i.option_type}))
+
+    ####################################################################################################
+    # Market data socket
+    ####################################################################################################
+
+    @staticmethod
+    def _room(code, key, mode):
+        return f"{code}:{mode}:{key[0]}_{key[1]}"
+
+    async def _join(self, sid, code, key, mode):
+        room = self._room(code, key, mode)
+        self.rooms.setdefault(room, set()).add(sid)
+        await _maybe_await(self.market_sio.enter_room(sid, room))
+
+    async def _leave(self, sid, code, key, mode):
+        room = self._room(code, key, mode)
+        self.rooms.get(room, set()).discard(sid)
+        await _maybe_await(self.market_sio.leave_room(sid, room))
+
+    async def on_market_connect(self, sid, environ, auth=None):
+        query = parse_qs(environ.get("QUERY_STRING", ""))
+        token = (query.get("token") or [""])[0]
+        mode = "partial" if (query.get("broadcastMode") or ["Full"])[0].lower() == "partial" else "full"
+        if not token:
+            return False
+        self.market_sids[sid] = (token, mode)
+        for code, key in self.subscriptions.get(token, ()):
+            await self._join(sid, code, key, mode)
+        await self.market_sio.emit("joined", "Socket connected successfully", room=sid)
+
+    async def on_market_disconnect(self, sid):
+        self.market_sids.pop(sid, None)
+        for members in self.rooms.values():
+            members.discard(sid)
+
+    async def _start_ticker(self, app):
+        self._ticker = asyncio.ensure_future(self._tick_loop())
+
+    async def _stop_ticker(self, app):
+        if self._ticker is not None:
+            self._ticker.cancel()
+
+    async def _tick_loop(self):
+        """Trade every subscribed instrument `tick_rate * speed` times a second and broadcast the results."""
+        interval = 1.0 / (self.tick_rate * self.speed)
+        bar_seconds = self.bar_seconds / self.speed
+        next_status = 0.0
+        while True:
+            started = time.monotonic()
+            now = time.time()
+            # Open interest and market status change slowly, send them every few seconds
+            send_status = started >= next_status
+            if send_status:
+                next_status = started + 3.0 / self.speed
+
+            # One failed broadcast or match must not stop the market for every client
+            try:
+                active = {}
+                for room, members in list(self.rooms.items()):
+                    if members:
+                        code, mode, key = room.split(":")
+                        segment, instrument_id = key.split("_")
+                        active.setdefault((int(segment), int(instrument_id)), []).append((int(code), mode, room))
+
+                for key, rooms in active.items():
+                    instrument = self.instruments.get(key)
+                    if instrument is None:
+                        continue
+                    instrument.step(now, bar_seconds)
+                    self.ticks += 1
+                    for code, mode, room in rooms:
+                        if code in (1507, 1510) and not send_status:
+                            continue
+                        await self._broadcast(instrument, code, mode, room)
+
+                await self.match_open_orders()
+            except Exception:
+                log.exception("Simulator tick failed")
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    async def _broadcast(self, instrument, code, mode, room):
+        if mode == "partial" and code in PARTIAL_CODES:
+            state = self.partial_state.setdefault((code, instrument.key), {})
+            changed = [(name, value) for name, value in instrument.partial_fields(code) if state.get(name) != value]
+            state.update(changed)
+            if not changed:
+                return
+            await self.market_sio.emit(f"{code}-json-partial",
+                                       encode_partial(instrument.segment, instrument.instrument_id, changed),
+                                       room=room)
+        else:
+            await self.market_sio.emit(f"{code}-json-full", json.dumps(instrument.message(code)), room=room)
+        self.messages += 1
+
+    ####################################################################################################
+    # Orders
+    ####################################################################################################
+
+    async def on_order_connect(self, sid, environ, auth=None):
+        query = parse_qs(environ.get("QUERY_STRING", ""))
+        user_id = (query.get("userID") or [self.user_id])[0]
+        await _maybe_await(self.order_sio.enter_room(sid, f"user:{user_id}"))
+        await self.order_sio.emit("joined", json.dumps({"userID": user_id}), room=sid)
+
+    async def _emit_order_event(self, user_id, event, data):
+        await self.order_sio.emit(event, json.dumps(data), room=f"user:{user_id}")
+
+    def _new_order(self, session, params, category="NORMAL"):
+        app_order_id = next(self.order_ids)
+        instrument = self._instrument(params.get("exchangeSegment"), params.get("exchangeInstrumentID"))
+        now = time.time()
+        return {
+            "LoginID": session["userID"], "ClientID": params.get("clientID") or session["userID"],
+            "AppOrderID": app_order_id, "OrderReferenceID": "", "GeneratedBy": "TWSAPI",
+            "ExchangeOrderID": "", "OrderCategoryType": category,
+            "ExchangeSegment": params.get("exchangeSegment"),
+            "ExchangeInstrumentID": int(params.get("exchangeInstrumentID") or 0),
+            "TradingSymbol": instrument.display_name if instrument else "",
+            "OrderSide": str(params.get("orderSide", "")).upper(), "OrderType": params.get("orderType"),
+            "ProductType": params.get("productType", "MIS"), "TimeInForce": params.get("timeInForce", "DAY"),
+            "OrderPrice": float(params.get("limitPrice") or 0), "OrderQuantity": int(params.get("orderQuantity") or 0),
+            "OrderStopPrice": float(params.get("stopPrice") or 0), "OrderStatus": "PendingNew",
+            "OrderAverageTradedPrice": "", "LeavesQuantity": int(params.get("orderQuantity") or 0),
+            "CumulativeQuantity": 0, "OrderDisclosedQuantity": int(params.get("disclosedQuantity") or 0),
+            "OrderGeneratedDateTime": order_time(now), "ExchangeTransactTime": order_time(now),
+            "LastUpdateDateTime": order_time(now), "OrderExpiryDate": "01-01-1980 00:00:00",
+            "CancelRejectReason": "", "OrderUniqueIdentifier": params.get("orderUniqueIdentifier", ""),
+            "OrderLegStatus": "SingleOrderLeg", "IsSpread": False, "MessageCode": 9004,
+            "MessageVersion": 4, "TokenID": 0, "ApplicationType": 146,
+        }
+
+    async def _set_status(self, order, status, reason=""):
+        order["OrderStatus"] = status
+        order["CancelRejectReason"] = reason
+        order["LastUpdateDateTime"] = order_time()
+        self.order_history.setdefault(order["AppOrderID"], []).append(dict(order))
+        await self._emit_order_event(order["LoginID"], "order", order)
+
+    async def _accept(self, order):
+        """Validate a new order, put it on the simulated exchange and match it at once if it can fill."""
+        self.orders[order["AppOrderID"]] = order
+        await self._set_status(order, "PendingNew")
+        instrument = self._instrument(order["ExchangeSegment"], order["ExchangeInstrumentID"])
+        if instrument is None:
+            return await self._set_status(order, "Rejected", "RMS:Instrument not found")
+        if order["OrderQuantity"] <= 0 or order["OrderQuantity"] % instrument.lot_size:
+            return await self._set_status(order, "Rejected", "RMS:Quantity should be a multiple of lot size")
+        if order["OrderSide"] not in ("BUY", "SELL"):
+            return await self._set_status(order, "Rejected", "RMS:Invalid order side")
+        order["ExchangeOrderID"] = str(1100000000000000 + order["AppOrderID"])
+        await self._set_status(order, "New")
+        await self._match(order, instrument, immediate=True)
+
+    def _fill_price(self, order, instrument):
+        """Return the price a working order fills at now, or None if it cannot fill yet."""
+        buy = order["OrderSide"] == "BUY"
+        order_type = str(order["OrderType"]).upper()
+        if order_type.startswith("STOP"):
+            stop = order["OrderStopPrice"]
+            if (buy and instrument.ltp < stop) or (not buy and instrument.ltp > stop):
+                return None  # Not triggered yet
+            order_type = "MARKET" if order_type == "STOPMARKET" else "LIMIT"
+        touch = instrument.best_ask() if buy else instrument.best_bid()
+        if order_type == "MARKET":
+            return touch
+        limit = order["OrderPrice"]
+        if (buy and touch <= limit) or (not buy and touch >= limit):
+            return min(touch, limit) if buy else max(touch, limit)
+        return None
+
+    async def _match(self, order, instrument, immediate=False):
+        price = self._fill_price(order, instrument)
+        if price is None:
+            if immediate and str(order["TimeInForce"]).upper() == "IOC":
+                await self._set_status(order, "Cancelled", "IOC order could not be filled")
+            return
+        quantity = order["LeavesQuantity"]
+        order["CumulativeQuantity"] += quantity
+        order["LeavesQuantity"] = 0
+        order["OrderAverageTradedPrice"] = str(price)
+        order["ExchangeTransactTime"] = order_time()
+
+        trade = dict(order, OrderStatus="Filled", LastTradedPrice=price, LastTradedQuantity=quantity,
+                     LastExecutionTransactTime=order_time(), ExecutionID=str(next(self.execution_ids)),
+                     ExecutionReportIndex=len(self.trades.get(order["LoginID"], ())), MessageCode=9005)
+        self.trades.setdefault(order["LoginID"], []).append(trade)
+        await self._set_status(order, "Filled")
+        await self._emit_order_event(order["LoginID"], "trade", trade)
+        await self._emit_order_event(order["LoginID"], "position",
+                                     self._update_position(order, instrument, price, quantity))
+
+    async def match_open_orders(self):
+        """Fill the working orders the latest prices reach; called after every tick."""
+        for order in list(self.orders.values()):
+            if order["OrderStatus"] in ("New", "Replaced"):
+                instrument = self._instrument(order["ExchangeSegment"], order["ExchangeInstrumentID"])
+                if instrument is not None:
+                    await self._match(order, instrument)
+
+    def _update_position(self, order, instrument, price, quantity):
+        key = (order["LoginID"], instrument.key, order["ProductType"])
+        position = self.positions.get(key)
+        if position is None:
+            position = self.positions[key] = {
+                "AccountID": order["ClientID"], "TradingSymbol": instrument.display_name,
+                "ExchangeSegment": SEGMENT_NAMES[instrument.segment],
+                "ExchangeInstrumentId": str(instrument.instrument_id), "ProductType": order["ProductType"],
+                "Marketlot": str(instrument.lot_size), "Multiplier": "1",
+                "BuyAveragePrice": "0", "SellAveragePrice": "0", "OpenBuyQuantity": "0", "OpenSellQuantity": "0",
+                "Quantity": "0", "BuyAmount": "0", "SellAmount": "0", "NetAmount": "0",
+                "UnrealizedMTM": "0", "RealizedMTM": "0", "MTM": "0", "BEP": "0", "SumOfTradedQuantityAndPriceBuy": "0",
+                "SumOfTradedQuantityAndPriceSell": "0", "MessageCode": 9002, "LoginID": order["LoginID"],
+            }
+        side = "Buy" if order["OrderSide"] == "BUY" else "Sell"
+        quantity_field = "OpenBuyQuantity" if side == "Buy" else "OpenSellQuantity"
+        amount_field = f"{side}Amount"
+        traded = int(position[quantity_field]) + quantity
+        amount = float(position[amount_field]) + quantity * price
+        position[quantity_field] = str(traded)
+        position[amount_field] = f"{amount:.2f}"
+        position[f"{side}AveragePrice"] = f"{amount / traded:.2f}"
+        net = int(position["OpenBuyQuantity"]) - int(position["OpenSellQuantity"])
+        net_amount = float(position["SellAmount"]) - float(position["BuyAmount"])
+        position["Quantity"] = str(net)
+        position["NetAmount"] = f"{net_amount:.2f}"
+        position["MTM"] = f"{net_amount + net * instrument.ltp:.2f}"
+        return position
+
+    @_authorised
+    async def place_order(self, request, session, params):
+        order = self._new_order(session, params)
+        asyncio.ensure_future(self._accept(order))
+        return self._response({"AppOrderID": order["AppOrderID"],
+                               "OrderUniqueIdentifier": order["OrderUniqueIdentifier"],
+                               "ClientID": order["ClientID"]}, code="s-orders-0001", description="Request sent")
+
+    @_authorised
+    async def place_bracket_order(self, request, session, params):
+        params = dict(params, productType="MIS", timeInForce="DAY")
+        order = self._new_order(session, params, category="BO")
+        asyncio.ensure_future(self._accept(order))
+        return self._response({"AppOrderID": order["AppOrderID"], "ClientID": order["ClientID"]},
+                              code="s-orders-0001", description="Request sent")
+
+    @_authorised
+    async def place_cover_order(self, request, session, params):
+        params = dict(params, productType="MIS", timeInForce="DAY")
+        order = self._new_order(session, params, category="CO")
+        asyncio.ensure_future(self._accept(order))
+        return self._response({"AppOrderID": order["AppOrderID"], "ExitAppOrderID": order["AppOrderID"] + 1,
+                               "ClientID": order["ClientID"]}, code="s-orders-0001", description="Request sent")
+
+    @_authorised
+    async def exit_cover_order(self, request, session, params):
+        order = self.orders.get(int(params.get("appOrderID") or 0))
+        if order is None:
+            return self._error("Order not found", code="e-orders-0002")
+        if order["OrderStatus"] in OPEN_STATUSES:
+            await self._set_status(order, "Cancelled")
+        return self._response({"AppOrderID": order["AppOrderID"]}, code="s-orders-0001", description="Request sent")
+
+    @_authorised
+    async def modify_order(self, request, session, params):
+        order = self.orders.get(int(params.get("appOrderID") or params.get("boEntryOrderId") or 0))
+        if order is None or order["OrderStatus"] not in OPEN_STATUSES:
+            return self._error("Order is not open", code="e-orders-0002")
+        order["OrderType"] = params.get("modifiedOrderType", order["OrderType"])
+        order["OrderQuantity"] = int(params.get("modifiedOrderQuantity") or order["OrderQuantity"])
+        order["LeavesQuantity"] = order["OrderQuantity"] - order["CumulativeQuantity"]
+        order["OrderPrice"] = float(params.get("modifiedLimitPrice") or order["OrderPrice"])
+        order["OrderStopPrice"] = float(params.get("modifiedStopPrice") or order["OrderStopPrice"])
+        order["TimeInForce"] = params.get("modifiedTimeInForce", order["TimeInForce"])
+        await self._set_status(order, "Replaced")
+        instrument = self._instrument(order["ExchangeSegment"], order["ExchangeInstrumentID"])
+        if instrument is not None:
+            await self._match(order, instrument)
+        return self._response({"AppOrderID": order["AppOrderID"], "OrderUniqueIdentifier":
+                               order["OrderUniqueIdentifier"], "ClientID": order["ClientID"]},
+                              code="s-orders-0002", description="Request sent")
+
+    @_authorised
+    async def cancel_order(self, request, session, params):
+        order = self.orders.get(int(params.get("appOrderID") or params.get("boEntryOrderId") or 0))
+        if order is None or order["OrderStatus"] not in OPEN_STATUSES:
+            return self._error("Order is not open", code="e-orders-0002")
+        await self._set_status(order, "Cancelled", "Cancelled by user")
+        return self._response({"AppOrderID": order["AppOrderID"], "OrderUniqueIdentifier":
+                               order["OrderUniqueIdentifier"], "ClientID": order["ClientID"]},
+                              code="s-orders-0003", description="Request sent")
+
+    @_authorised
+    async def cancel_all(self, request, session, params):
+        instrument_id = int(params.get("exchangeInstrumentID") or 0)
+        cancelled = []
+        for order in list(self.orders.values()):
+            if order["LoginID"] == session["userID"] and order["OrderStatus"] in OPEN_STATUSES \
+                    and order["ExchangeInstrumentID"] == instrument_id:
+                await self._set_status(order, "Cancelled", "Cancelled by user")
+                cancelled.append(order["AppOrderID"])
+        return self._response(cancelled, code="s-orders-0004", description="Request sent")
+
+    @_authorised
+    async def order_book(self, request, session, params):
+        if params.get("appOrderID"):
+            return self._response(self.order_history.get(int(params["appOrderID"]), []))
+        return self._response([order for order in self.orders.values() if order["LoginID"] == session["userID"]],
+                              code="s-orders-0001", description="Success order book")
+
+    @_authorised
+    async def trade_book(self, request, session, params):
+        return self._response(self.trades.get(session["userID"], []), code="s-trades-0001",
+                              description="Success trade book")
+
+    @_authorised
+    async def position_book(self, request, session, params):
+        positions = [position for (user_id, _, _), position in self.positions.items()
+                     if user_id == session["userID"]]
+        return self._response({"positionList": positions}, code="s-portfolio-0001", description="Success positions")
+
+    @_authorised
+    async def holdings(self, request, session, params):
+        return self._response({"RMSHoldings": {"ClientId": session["userID"], "Holdings": {}}})
+
+    @_authorised
+    async def convert_position(self, request, session, params):
+        instrument = self._instrument(params.get("exchangeSegment"), params.get("exchangeInstrumentID"))
+        key = (session["userID"], instrument.key if instrument else None, params.get("oldProductType"))
+        position = self.positions.pop(key, None)
+        if position is None:
+            return self._error("Position not found", code="e-portfolio-0003")
+        position["ProductType"] = params.get("newProductType")
+        self.positions[key[:2] + (position["ProductType"],)] = position
+        return self._response({}, code="s-portfolio-0002", description="Position converted")
+
+    @_authorised
+    async def squareoff(self, request, session, params):
+        instrument = self._instrument(params.get("exchangeSegment"), params.get("exchangeInstrumentID"))
+        position = self.positions.get((session["userID"], instrument.key if instrument else None,
+                                       params.get("productType")))
+        if position is None or int(position["Quantity"]) == 0:
+            return self._error("No open position", code="e-portfolio-0004")
+        net = int(position["Quantity"])
+        order = self._new_order(session, {
+            "exchangeSegment": params.get("exchangeSegment"), "exchangeInstrumentID": instrument.instrument_id,
+            "productType": params.get("productType"), "orderType": "MARKET",
+            "orderSide": "SELL" if net > 0 else "BUY", "orderQuantity": abs(net), "timeInForce": "DAY",
+            "orderUniqueIdentifier": "squareoff"})
+        asyncio.ensure_future(self._accept(order))
+        return self._response({"AppOrderID": order["AppOrderID"]}, code="s-portfolio-0005",
+                              description="Squareoff request sent")
+
+    def stats(self):
+        return {'rest_requests': self.rest_requests, 'ticks': self.ticks, 'messages': self.messages,
+                'market_sockets': len(self.market_sids), 'orders': len(self.orders)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local XTS REST and socket.io stand-in for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="REST response delay")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="uniform +/- jitter on the REST delay")
+    parser.add_argument("--tick-rate", type=float, default=2.0, help="trades per second per instrument at speed 1")
+    parser.add_argument("--speed", type=float, default=1.0, help="market activity multiplier, e.g. 10")
+    parser.add_argument("--bar-seconds", type=int, default=60, help="1505 candle interval at speed 1")
+    parser.add_argument("--extra-strikes", type=int, default=0, help="NIFTY option strikes to add on each side")
+    parser.add_argument("--token-ttl", type=float, default=0, help="seconds before issued tokens expire")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    simulator = XTSSimulator(instruments=default_instruments(args.extra_strikes, rng=rng),
+                             latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, tick_rate=args.tick_rate,
+                             speed=args.speed, bar_seconds=args.bar_seconds, token_ttl=args.token_ttl,
+                             seed=args.seed)
+    print(f"XTS simulator on http://{args.host}:{args.port} with {len(simulator.instruments)} instruments")
+    web.run_app(simulator.app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()